@@ -0,0 +1,149 @@
+# app/activity.py
+from sqlalchemy.sql import text
+
+from app.derived import derived_tables
+from app.filters import SqlFilters
+
+#
+#
+# AGENT ACTIVITY
+# ONE UNION ALL + GROUP BY PASS OVER THE DAILY STATS ROLLUPS
+#
+#
+# Each rollup (app/rollups.py) contributes its rows as the same counts, 0 for
+# those it does not hold: one GROUP BY over their UNION ALL gives the
+# per-agent totals, the per-day series or the per-(date, agent) stream of
+# every source at once. Each branch is filtered on its own (jour, fk_agent)
+# index before the union. Parcelles count in total and under statut 1
+# (accessible) and 2 (inaccessible).
+
+# Counts of the agent totals and daily series
+ACTIVITY_COUNTS = (
+    "parcelle_accessible_count",
+    "parcelle_inaccessible_count",
+    "bien_count",
+    "menage_count",
+    "membre_menage_count",
+)
+
+# Counts of the per-date stream, every parcelle whatever its statut
+DATE_COUNTS = ("parcelle_count", "bien_count", "menage_count", "membre_menage_count")
+
+# Granularity -> first day of the bucket holding activity.jour; 1900-01-01 was a Monday
+ACTIVITY_BUCKETS = {
+    "day": "activity.jour",
+    "week": "DATEADD(day, DATEDIFF(day, '19000101', activity.jour) / 7 * 7, CAST('19000101' AS DATE))",
+    "month": "DATEFROMPARTS(YEAR(activity.jour), MONTH(activity.jour), 1)",
+}
+
+ACTIVITY_SOURCE = """
+    SELECT s.jour, s.fk_agent, s.nb_parcelles AS parcelle_count,
+        CASE WHEN s.statut = 1 THEN s.nb_parcelles ELSE 0 END AS parcelle_accessible_count,
+        CASE WHEN s.statut = 2 THEN s.nb_parcelles ELSE 0 END AS parcelle_inaccessible_count,
+        0 AS bien_count, 0 AS menage_count, 0 AS membre_menage_count
+    FROM {stats_parcelle_jour} s
+    WHERE 1=1 {filters}
+    UNION ALL
+    SELECT s.jour, s.fk_agent, 0, 0, 0, s.nb_biens, 0, 0
+    FROM {stats_bien_jour} s
+    WHERE 1=1 {filters}
+    UNION ALL
+    SELECT s.jour, s.fk_agent, 0, 0, 0, 0, s.nb_menages, s.nb_membres_menage
+    FROM {stats_menage_jour} s
+    WHERE 1=1 {filters}
+"""
+
+
+def activity_filters(date_debut=None, date_fin=None, agent=None) -> SqlFilters:
+    """Filters on a rollup s: both days included, one agent when given."""
+    return SqlFilters().day_range("s.jour", date_debut, date_fin).equals("s.fk_agent", "agent", agent)
+
+
+# Helper function to give the UNION ALL of the rollups, each branch filtered
+def _activity_source(filters: SqlFilters) -> str:
+    rollups = {table: derived_tables.source(table) for table in ("stats_parcelle_jour", "stats_bien_jour", "stats_menage_jour")}
+    return ACTIVITY_SOURCE.format(filters=filters.sql(), **rollups)
+
+
+# Helper function to sum counts over the activity rows of a group
+def _sums(counts) -> str:
+    return ", ".join(f"SUM(activity.{count}) AS {count}" for count in counts)
+
+
+# Helper function to keep the groups where one of the counts is not 0
+def _any(counts) -> str:
+    return " OR ".join(f"SUM(activity.{count}) > 0" for count in counts)
+
+
+def agent_activity_series(db, agent: int, date_debut=None, date_fin=None) -> list:
+    """Per-day counts of one agent, days without activity left out, in day order."""
+    filters = activity_filters(date_debut, date_fin, agent)
+    query = f"""
+        SELECT activity.jour, {_sums(ACTIVITY_COUNTS)}
+        FROM ({_activity_source(filters)}) AS activity
+        GROUP BY activity.jour
+        HAVING {_any(ACTIVITY_COUNTS)}
+        ORDER BY activity.jour
+    """
+    return db.execute(text(query), filters.params).mappings().all()
+
+
+def agents_activity_page(db, date_debut=None, date_fin=None, keyword=None, page: int = 1, page_size: int = 10):
+    """(total, rows) for one page of the agents with activity in the range,
+    ordered by name, with their totals; keyword narrows on their names."""
+    filters = activity_filters(date_debut, date_fin)
+    agent_filters = SqlFilters(filters.params)
+    agent_filters.search(("u.nom", "u.postnom", "u.prenom"), "keyword", keyword, (("u.id", "utilisateur"),))
+    params = {**agent_filters.params, "offset": (page - 1) * page_size, "limit": page_size}
+
+    agent_totals = f"""
+        FROM (
+            SELECT activity.fk_agent, {_sums(ACTIVITY_COUNTS)}
+            FROM ({_activity_source(filters)}) AS activity
+            GROUP BY activity.fk_agent
+            HAVING {_any(ACTIVITY_COUNTS)}
+        ) AS totals
+        JOIN utilisateur u ON totals.fk_agent = u.id
+        WHERE 1=1 {agent_filters.sql()}
+    """
+    rows = db.execute(text(f"""
+        SELECT u.id AS agent_id, u.nom, u.postnom, u.prenom,
+            {", ".join(f"totals.{count}" for count in ACTIVITY_COUNTS)},
+            COUNT(*) OVER() AS total_count
+        {agent_totals}
+        ORDER BY u.nom, u.id
+        OFFSET :offset ROWS FETCH NEXT :limit ROWS ONLY
+    """), params).mappings().all()
+
+    if rows:
+        total = rows[0]["total_count"]
+    elif page > 1:
+        # Past the last page there is no row to carry the window count
+        total = db.execute(text(f"SELECT COUNT(*) {agent_totals}"), params).scalar()
+    else:
+        total = 0
+    return total, rows
+
+
+def activity_by_date(db, date_debut=None, date_fin=None, keyword=None, granularity: str = "day") -> list:
+    """Counts per (bucket, agent) for every agent with activity in the range,
+    whichever source it is in; buckets are days, weeks (from Monday) or months,
+    each dated by its first day. keyword narrows on the agent names."""
+    filters = activity_filters(date_debut, date_fin)
+    agent_filters = SqlFilters(filters.params)
+    agent_filters.search(("u.nom", "u.postnom", "u.prenom"), "keyword", keyword, (("u.id", "utilisateur"),))
+    bucket = ACTIVITY_BUCKETS[granularity]
+    query = f"""
+        SELECT per_date.date, u.id AS agent_id, u.nom, u.postnom, u.prenom,
+            {", ".join(f"per_date.{count}" for count in DATE_COUNTS)}
+        FROM (
+            SELECT {bucket} AS date, activity.fk_agent, {_sums(DATE_COUNTS)}
+            FROM ({_activity_source(filters)}) AS activity
+            GROUP BY {bucket}, activity.fk_agent
+            HAVING {_any(DATE_COUNTS)}
+        ) AS per_date
+        JOIN utilisateur u ON per_date.fk_agent = u.id
+        WHERE 1=1 {agent_filters.sql()}
+        ORDER BY per_date.date, u.id
+    """
+    return db.execute(text(query), agent_filters.params).mappings().all()
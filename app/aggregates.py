@@ -0,0 +1,197 @@
+# app/aggregates.py
+from sqlalchemy.sql import text
+
+from app.cache import LRUCache
+from app.derived import derived_tables
+from app.filters import SqlFilters, STATS_JOINS, build_joins
+from app.versioning import data_versions
+
+#
+#
+# SINGLE-SCAN AGGREGATION
+# GROUP BY GROUPING SETS, FANNED OUT PER SET
+#
+#
+# A dashboard needs the same filtered rows counted along several dimensions
+# (total, by rang, by commune, ...). Instead of one query per breakdown, each
+# re-deriving the filtered set, one GROUP BY GROUPING SETS scan returns every
+# breakdown at once. GROUPING_ID() tells which set a row belongs to: its bit
+# for a dimension is 1 when the row is aggregated over that dimension.
+#
+# Breakdowns are keyed by ids; labels come from label_lookup(), read once and
+# kept until one of the lookup tables changes.
+
+
+class GroupingSets:
+    """One aggregation over `source`, grouped by each of `sets`.
+
+    dimensions: name -> SQL expression, sets: name -> tuple of dimension
+    names (() for the grand total), measures: name -> aggregate expression.
+    """
+
+    def __init__(self, source: str, dimensions: dict, sets: dict, measures: dict):
+        self.source = source
+        # Only the dimensions of the sets kept: a column outside every grouping set is not in the GROUP BY
+        self.dimensions = {name: expression for name, expression in dimensions.items() if any(name in dims for dims in sets.values())}
+        self.sets = sets
+        self.measures = measures
+        names = list(self.dimensions)
+        # GROUPING_ID(d1, ..., dn) puts the bit of d1 highest
+        self.set_of_grouping_id = {
+            sum(1 << (len(names) - 1 - i) for i, name in enumerate(names) if name not in dims): set_name
+            for set_name, dims in sets.items()
+        }
+
+    def sql(self) -> str:
+        # GROUPING_ID() needs an argument: with the grand total alone, every row is grouping id 0
+        grouping_id = f"GROUPING_ID({', '.join(self.dimensions.values())})" if self.dimensions else "0"
+        columns = [f"{grouping_id} AS grouping_id"]
+        columns += [f"{expression} AS {name}" for name, expression in self.dimensions.items()]
+        columns += [f"{expression} AS {name}" for name, expression in self.measures.items()]
+        grouping_sets = ", ".join(
+            "(" + ", ".join(self.dimensions[name] for name in dims) + ")" for dims in self.sets.values()
+        )
+        return f"""
+            SELECT {", ".join(columns)}
+            FROM {self.source}
+            GROUP BY GROUPING SETS ({grouping_sets})
+        """
+
+    def run(self, db, params: dict) -> dict:
+        """set name -> {key tuple: {measure: value}}; the grand total is keyed by ()."""
+        results = {set_name: {} for set_name in self.sets}
+        for row in db.execute(text(self.sql()), params).mappings():
+            set_name = self.set_of_grouping_id[row["grouping_id"]]
+            key = tuple(row[name] for name in self.sets[set_name])
+            results[set_name][key] = {name: row[name] or 0 for name in self.measures}
+        return results
+
+
+#
+#
+# LABELS OF THE BREAKDOWN IDS
+#
+#
+
+LABEL_TABLES = ("rang", "commune", "quartier", "avenue", "nature_bien", "usage", "usage_specifique")
+LABEL_QUERIES = {
+    **{table: f"SELECT id, intitule FROM {table}" for table in LABEL_TABLES},
+    # The communes listed by the dashboards, with or without parcelles
+    "commune_ville": "SELECT id, intitule FROM commune WHERE fk_ville = 1",
+}
+LABEL_QUERY = " UNION ALL ".join(f"SELECT '{name}' AS tbl, id, intitule FROM ({query}) AS t" for name, query in LABEL_QUERIES.items())
+
+label_cache = LRUCache(maxsize=1)
+
+
+def label_lookup(db) -> dict:
+    """name -> {id: intitule}, in id order, for the lookup tables of the breakdowns."""
+    def load():
+        labels = {name: {} for name in LABEL_QUERIES}
+        for row in db.execute(text(LABEL_QUERY + " ORDER BY tbl, id")):
+            labels[row.tbl][row.id] = row.intitule
+        return labels
+    return label_cache.get_or_set(data_versions.versions(LABEL_TABLES), load)
+
+
+# Helper function to count a breakdown under labels, "Inconnu" for a missing label
+def labelled_counts(counts: dict, labels: dict, measure: str = "total") -> dict:
+    result = {}
+    for (value,), measures in counts.items():
+        label = labels.get(value) or "Inconnu"
+        result[label] = result.get(label, 0) + measures[measure]
+    return result
+
+
+# Helper function to list every label of a lookup table with its count, 0 when absent
+def all_labelled_counts(counts: dict, labels: dict, measure: str = "total") -> dict:
+    return {
+        (label or "Inconnu"): counts.get((value,), {}).get(measure, 0)
+        for value, label in labels.items()
+    }
+
+
+# Helper function to count a (child, commune) breakdown under "Child (Commune)" labels, as CONCAT() gave them
+def commune_labelled_counts(counts: dict, labels: dict, commune_labels: dict, measure: str = "total") -> dict:
+    result = {}
+    for (value, commune), measures in counts.items():
+        label = f"{labels.get(value) or ''} ({commune_labels.get(commune) or ''})"
+        result[label] = result.get(label, 0) + measures[measure]
+    return result
+
+
+#
+#
+# DASHBOARD AGGREGATES FROM THE DAILY STATS ROLLUPS (app/rollups.py)
+#
+#
+
+def stats_filters(commune=None, quartier=None, avenue=None, rang=None, date_start=None, date_end=None) -> SqlFilters:
+    """Dashboard filters on a rollup s: location through its avenue, dates on its jour."""
+    return SqlFilters().stats_location(commune=commune, quartier=quartier, avenue=avenue, rang=rang) \
+        .day_range("s.jour", date_start, date_end)
+
+
+# Helper function to keep the grouping sets named in `only` (all when None)
+def _selected(sets: dict, only) -> dict:
+    return sets if only is None else {name: dims for name, dims in sets.items() if name in only}
+
+
+def parcelle_rollup_stats(db, filters: SqlFilters, only=None) -> dict:
+    """Parcelle totals (accessible, inaccessible) and breakdowns by rang, commune,
+    (quartier, commune) and (avenue, commune), from one scan of stats_parcelle_jour.
+    `only` names the sets to compute, all by default."""
+    return GroupingSets(
+        source=f"""
+            {derived_tables.source("stats_parcelle_jour")} s
+            {build_joins(STATS_JOINS, filters.aliases() | {"q"})}
+            WHERE 1=1 {filters.sql()}
+        """,
+        dimensions={
+            "rang": "s.fk_rang",
+            "commune": "q.fk_commune",
+            "quartier": "av.fk_quartier",
+            "avenue": "s.fk_avenue",
+        },
+        sets=_selected({
+            "total": (),
+            "rang": ("rang",),
+            "commune": ("commune",),
+            "quartier": ("quartier", "commune"),
+            "avenue": ("avenue", "commune"),
+        }, only),
+        measures={
+            "total": "SUM(s.nb_parcelles)",
+            "accessible": "SUM(CASE WHEN s.statut = 1 THEN s.nb_parcelles ELSE 0 END)",
+            "inaccessible": "SUM(CASE WHEN s.statut = 2 THEN s.nb_parcelles ELSE 0 END)",
+        },
+    ).run(db, filters.params)
+
+
+def bien_rollup_stats(db, filters: SqlFilters, nature=None, only=None) -> dict:
+    """Bien total and breakdowns by nature, rang, usage and usage_specifique,
+    from one scan of stats_bien_jour; `nature` only narrows the biens."""
+    narrowed = SqlFilters(filters.params)
+    narrowed.filters = list(filters.filters)
+    narrowed.equals("s.fk_nature_bien", "nature", nature)
+    return GroupingSets(
+        source=f"""
+            {derived_tables.source("stats_bien_jour")} s
+            {build_joins(STATS_JOINS, narrowed.aliases())}
+            WHERE 1=1 {narrowed.sql()}
+        """,
+        dimensions={
+            "nature": "s.fk_nature_bien",
+            "rang": "s.fk_rang",
+            "usage": "s.fk_usage",
+            "usage_specifique": "s.fk_usage_specifique",
+        },
+        sets=_selected({
+            "total": (),
+            "nature": ("nature",),
+            "rang": ("rang",),
+            "usage": ("usage",),
+            "usage_specifique": ("usage_specifique",),
+        }, only),
+        measures={"total": "SUM(s.nb_biens)"},
+    ).run(db, narrowed.params)
@@ -0,0 +1,322 @@
+# app/autocomplete.py
+import heapq
+import logging
+import os
+import sys
+import threading
+import time
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import chain
+
+from sqlalchemy import event, inspect
+from sqlalchemy.sql import text, bindparam
+
+from app.database import SessionLocal
+from app.filters import fold
+from app.models import Parcelle, Personne
+from app.versioning import data_versions
+
+logger = logging.getLogger(__name__)
+
+#
+#
+# TYPE-AHEAD LOOKUP
+# SORTED KEYS + BISECT OVER numero_parcellaire AND OWNER NAMES
+#
+#
+# Keys are folded (lower case, no accents, see app/filters.py) and kept in a
+# sorted list, with the parcelle id of each key in a parallel array: a prefix
+# lookup is two bisects and a slice, whatever the number of parcelles. Owner
+# names are indexed from each of their words to the end ("mbuyi kalala jean",
+# "kalala jean", "jean"), so "jea" and "kalala j" both find "MBUYI KALALA Jean".
+#
+# New submissions are added incrementally (parcelles above the highest id
+# loaded) when the parcelle or personne version moved. They go to a small
+# delta index searched along with the main one, so an insert never shifts the
+# large arrays. Parcelles the session hooks below saw written (numero, owner,
+# deletion) or whose owner was renamed are reloaded the same way: their
+# current keys go to the delta and are recorded in `replaced`, which hides the
+# keys they no longer have. The full rebuild every AUTOCOMPLETE_REBUILD_SECONDS
+# folds the delta in and picks up the writes made with raw SQL, which bypass
+# the hooks: until then such a deleted parcelle is only dropped when its row
+# is read back, and such an edit is found under its previous keys.
+#
+# A lookup never waits for a load. The full builds (the first one is started
+# at startup, see app/main.py) run in a background thread while lookups use
+# the current index, empty until the first build is swapped in; an
+# incremental load is skipped while another refresh runs.
+
+AUTOCOMPLETE_REBUILD_SECONDS = int(os.getenv("AUTOCOMPLETE_REBUILD_SECONDS", 3600))
+AUTOCOMPLETE_MAX_PENDING = int(os.getenv("AUTOCOMPLETE_MAX_PENDING", 100000))  # Written ids past which a full rebuild is cheaper
+AUTOCOMPLETE_TABLES = ("parcelle", "personne")
+LOAD_BATCH_SIZE = 20000
+ID_BATCH_SIZE = 1000  # SQL Server accepts at most 2100 parameters per statement
+
+# Rows of the index, with a {where} slot on p.id
+LOAD_QUERY = """
+    SELECT p.id, p.numero_parcellaire, per.nom, per.postnom, per.prenom, per.denomination
+    FROM parcelle p
+    LEFT JOIN personne per ON p.fk_proprietaire = per.id
+    WHERE {where}
+    ORDER BY p.id
+"""
+RANGE_QUERY = text(LOAD_QUERY.format(where="p.id > :after_id AND p.id <= :up_to_id"))
+IDS_QUERY = text(LOAD_QUERY.format(where="p.id IN :ids")).bindparams(bindparam("ids", expanding=True))
+OWNED_QUERY = text("SELECT id FROM parcelle WHERE fk_proprietaire IN :ids").bindparams(bindparam("ids", expanding=True))
+
+
+class PrefixIndex:
+    """Sorted keys with a value per key; prefix lookups by bisect."""
+
+    def __init__(self, entries=()):
+        entries = sorted(entries)
+        self.keys = [key for key, _ in entries]
+        self.values = array("q", (value for _, value in entries))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def insert(self, key: str, value: int):
+        i = bisect_right(self.keys, key)
+        self.keys.insert(i, key)
+        self.values.insert(i, value)
+
+    def matches(self, prefix: str):
+        """(key, value) of the keys starting with prefix, in key order."""
+        start = bisect_left(self.keys, prefix)
+        end = bisect_right(self.keys, prefix + "\uffff", lo=start)
+        for i in range(start, end):
+            yield self.keys[i], self.values[i]
+
+
+# Helper function to take the first `limit` distinct values of several key-ordered match streams
+def _first_values(streams, limit: int) -> list:
+    found = []
+    seen = set()
+    for _, value in heapq.merge(*streams):
+        if value not in seen:
+            seen.add(value)
+            found.append(value)
+            if len(found) >= limit:
+                break
+    return found
+
+
+# Helper function to turn loaded rows into (key, parcelle_id) entries per index
+def _entries(rows):
+    numeros, owners = [], []
+    for row in rows:
+        if row.numero_parcellaire:
+            numeros.append((sys.intern(" ".join(fold(row.numero_parcellaire).split())), row.id))
+        words = fold(" ".join(label for label in (row.nom, row.postnom, row.prenom, row.denomination) if label)).split()
+        owners.extend((sys.intern(" ".join(words[i:])), row.id) for i in range(len(words)))
+    return numeros, owners
+
+
+# Helper function to run an expanding IN statement over ids, ID_BATCH_SIZE at a time
+def _rows_in_batches(db, statement, ids) -> list:
+    ids = sorted(ids)
+    rows = []
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        rows.extend(db.execute(statement, {"ids": ids[start:start + ID_BATCH_SIZE]}).fetchall())
+    return rows
+
+
+# Helper function to drop the matches of keys their parcelle no longer has
+def _current(matches, replaced: dict, kind: str):
+    for key, value in matches:
+        keys = replaced.get(value)
+        if keys is None or key in keys[kind]:
+            yield key, value
+
+
+class ParcelleAutocomplete:
+    def __init__(self):
+        # kind -> (main index, delta index)
+        self.indexes = {"numero": (PrefixIndex(), PrefixIndex()), "proprietaire": (PrefixIndex(), PrefixIndex())}
+        self.replaced = {}  # parcelle id -> kind -> its current keys, for the rows reloaded since the build
+        self.last_id = 0
+        self.versions = None
+        self.built_at = None
+        self._pending = {"parcelle": set(), "personne": set()}
+        self._rebuild = False  # Next refresh rebuilds everything
+        self._building = False  # A background build runs
+        self._lock = threading.Lock()  # Sync routes run in a thread pool
+        self._refresh_lock = threading.Lock()  # One load at a time; lookups never wait for it
+
+    def _load(self, db, after_id: int):
+        """Rows above after_id, LOAD_BATCH_SIZE ids at a time; returns (numeros, owners, last_id)."""
+        max_id = db.execute(text("SELECT MAX(id) FROM parcelle")).scalar() or 0
+        numeros, owners = [], []
+        for low in range(after_id, max_id, LOAD_BATCH_SIZE):
+            batch_numeros, batch_owners = _entries(db.execute(RANGE_QUERY, {"after_id": low, "up_to_id": low + LOAD_BATCH_SIZE}))
+            numeros.extend(batch_numeros)
+            owners.extend(batch_owners)
+        return numeros, owners, max(max_id, after_id)
+
+    def _load_written(self, db, pending: dict) -> dict:
+        """parcelle id -> kind -> current keys of the written parcelles already loaded
+        (no key for a deleted one), with the parcelles of the renamed owners."""
+        ids = set(pending["parcelle"])
+        if pending["personne"]:
+            ids.update(row[0] for row in _rows_in_batches(db, OWNED_QUERY, pending["personne"]))
+        # Written rows above last_id come with the new ones
+        ids = {parcelle_id for parcelle_id in ids if parcelle_id <= self.last_id}
+        written = {parcelle_id: {"numero": set(), "proprietaire": set()} for parcelle_id in ids}
+        numeros, owners = _entries(_rows_in_batches(db, IDS_QUERY, ids))
+        for kind, entries in (("numero", numeros), ("proprietaire", owners)):
+            for key, parcelle_id in entries:
+                written[parcelle_id][kind].add(key)
+        return written
+
+    def rebuild(self):
+        """Load every parcelle on a session of its own and swap the new index in:
+        lookups keep the current one meanwhile."""
+        with self._refresh_lock:
+            # Versions and written ids taken before loading: writes committed meanwhile are loaded on the next refresh
+            versions = data_versions.versions(AUTOCOMPLETE_TABLES)
+            with self._lock:
+                self._pending, self._rebuild = {"parcelle": set(), "personne": set()}, False
+            db = SessionLocal()
+            try:
+                numeros, owners, last_id = self._load(db, 0)
+            except Exception:
+                self.invalidate()
+                raise
+            finally:
+                db.close()
+            indexes = {"numero": (PrefixIndex(numeros), PrefixIndex()), "proprietaire": (PrefixIndex(owners), PrefixIndex())}
+            with self._lock:
+                self.indexes, self.replaced = indexes, {}
+                self.built_at = time.monotonic()
+                self.last_id, self.versions = last_id, versions
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.error("autocomplete: rebuild failed, retried on the next lookup", exc_info=True)
+        finally:
+            with self._lock:
+                self._building = False
+
+    def warm(self):
+        """Start a full rebuild in a background thread, unless one is running."""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._rebuild_in_background, name="autocomplete-rebuild", daemon=True).start()
+
+    def refresh(self, db):
+        """Bring the index up to date without making the lookup wait: an expired
+        index is rebuilt in the background, the new and written parcelles are
+        loaded unless another refresh is running."""
+        with self._lock:
+            expired = self._rebuild or self.built_at is None or time.monotonic() - self.built_at > AUTOCOMPLETE_REBUILD_SECONDS
+        if expired:
+            self.warm()
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            # Versions and written ids taken before loading: writes committed meanwhile are loaded on the next refresh
+            versions = data_versions.versions(AUTOCOMPLETE_TABLES)
+            with self._lock:
+                pending, self._pending = self._pending, {"parcelle": set(), "personne": set()}
+            if versions == self.versions and not any(pending.values()):
+                return
+            try:
+                numeros, owners, last_id = self._load(db, self.last_id)
+                written = self._load_written(db, pending)
+            except Exception:
+                self.touch(pending)
+                raise
+            with self._lock:
+                for kind, entries in (("numero", numeros), ("proprietaire", owners)):
+                    delta = self.indexes[kind][1]
+                    for key, value in entries:
+                        delta.insert(key, value)
+                for parcelle_id, keys in written.items():
+                    for kind, kind_keys in keys.items():
+                        for key in kind_keys:
+                            self.indexes[kind][1].insert(key, parcelle_id)
+                    self.replaced[parcelle_id] = keys
+                self.last_id, self.versions = last_id, versions
+        finally:
+            self._refresh_lock.release()
+
+    def touch(self, written: dict):
+        """Queue the parcelle and personne ids a commit wrote, reloaded by the next refresh."""
+        with self._lock:
+            for table, ids in written.items():
+                self._pending[table].update(ids)
+            if sum(len(ids) for ids in self._pending.values()) > AUTOCOMPLETE_MAX_PENDING:
+                # Too many rows to reload one by one: rebuild everything instead
+                self._pending = {"parcelle": set(), "personne": set()}
+                self._rebuild = True
+
+    def invalidate(self):
+        """Have the next refresh rebuild the index from the tables."""
+        with self._lock:
+            self._rebuild = True
+
+    def search(self, query: str, limit: int, type_: str = "all") -> list:
+        """[(parcelle_id, matched_on)]: numero_parcellaire matches first, then owner names."""
+        prefix = " ".join(fold(query).split())
+        if not prefix:
+            return []
+        results = []
+        with self._lock:
+            if type_ in ("all", "numero"):
+                streams = [_current(index.matches(prefix), self.replaced, "numero") for index in self.indexes["numero"]]
+                results += [(pid, "numero_parcellaire") for pid in _first_values(streams, limit)]
+            if type_ in ("all", "proprietaire") and len(results) < limit:
+                seen = {pid for pid, _ in results}
+                streams = [_current(index.matches(prefix), self.replaced, "proprietaire") for index in self.indexes["proprietaire"]]
+                results += [(pid, "proprietaire") for pid in _first_values(streams, limit + len(seen)) if pid not in seen]
+        return results[:limit]
+
+
+parcelle_autocomplete = ParcelleAutocomplete()
+
+
+#
+#
+# SESSION HOOKS: PARCELLES WHOSE NUMERO OR OWNER CHANGED, OR DELETED, AND
+# RENAMED OWNERS ARE RELOADED BY THE NEXT REFRESH ONCE THE WRITE COMMITS
+#
+#
+
+# Model -> (pending set, columns whose change changes the keys)
+AUTOCOMPLETE_SOURCES = {
+    Parcelle: ("parcelle", ("numero_parcellaire", "fk_proprietaire")),
+    Personne: ("personne", ("nom", "postnom", "prenom", "denomination")),
+}
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_autocomplete_rows(session, flush_context):
+    written = session.info.setdefault("autocomplete_written", {"parcelle": set(), "personne": set()})
+    # New parcelles come with the range load, new personnes with the parcelles pointing at them
+    for obj in chain(session.dirty, session.deleted):
+        source = AUTOCOMPLETE_SOURCES.get(type(obj))
+        if not source or obj.id is None:
+            continue
+        attrs = inspect(obj).attrs
+        if obj in session.deleted or any(attrs[column].history.has_changes() for column in source[1]):
+            written[source[0]].add(obj.id)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _queue_autocomplete_rows(session):
+    written = session.info.pop("autocomplete_written", None)
+    if written and any(written.values()):
+        parcelle_autocomplete.touch(written)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_autocomplete_rows(session):
+    session.info.pop("autocomplete_written", None)
@@ -0,0 +1,165 @@
+# app/compression.py
+import gzip
+import hashlib
+import os
+
+from dataclasses import dataclass
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.cache import LRUCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is listed in requirements.txt
+    brotli = None
+
+#
+#
+# NEGOTIATED RESPONSE COMPRESSION
+# GZIP / BROTLI WITH PER-ROUTE THRESHOLDS AND A PRECOMPRESSED CACHE
+#
+#
+
+
+@dataclass(frozen=True)
+class CompressionRule:
+    min_size: int = 1024  # Bodies smaller than this are sent as-is
+    gzip_level: int = 6
+    brotli_quality: int = 5
+    cache: bool = False  # Keep the compressed bytes of identical bodies
+
+
+DEFAULT_RULE = CompressionRule()
+
+# Reference lists barely change and are requested on every screen: compress them
+# hard once and serve the cached bytes afterwards
+REFERENCE_RULE = CompressionRule(min_size=256, gzip_level=9, brotli_quality=11, cache=True)
+
+# Map pages are large and very repetitive: favour speed, keep whole snapshots
+MAP_RULE = CompressionRule(min_size=512, gzip_level=6, brotli_quality=5, cache=True)
+
+# Longest matching path prefix wins
+ROUTE_RULES = {
+    "/api/v1/provinces": REFERENCE_RULE,
+    "/api/v1/villes": REFERENCE_RULE,
+    "/api/v1/communes": REFERENCE_RULE,
+    "/api/v1/quartiers": REFERENCE_RULE,
+    "/api/v1/avenues": REFERENCE_RULE,
+    "/api/v1/rangs": REFERENCE_RULE,
+    "/api/v1/natures": REFERENCE_RULE,
+    "/api/v1/usages": REFERENCE_RULE,
+    "/api/v1/usage-specifiques": REFERENCE_RULE,
+    "/api/v1/get-parameters": REFERENCE_RULE,
+    "/api/v1/geojson": MAP_RULE,
+    "/api/v1/cartographie": MAP_RULE,
+    "/api/v2/geojson": MAP_RULE,
+}
+
+COMPRESSIBLE_TYPES = ("application/json", "application/geo+json", "text/")
+
+# Bodies above this size are compressed in the thread pool, off the event loop
+THREADPOOL_THRESHOLD = 64 * 1024
+
+# Compressed bodies of cacheable routes, keyed by (body digest, encoding, level)
+compressed_cache = LRUCache(maxsize=int(os.getenv("COMPRESSION_CACHE_SIZE", "256")))
+
+
+def rule_for(path: str) -> CompressionRule:
+    best, best_len = DEFAULT_RULE, 0
+    for prefix, rule in ROUTE_RULES.items():
+        if path.startswith(prefix) and len(prefix) > best_len:
+            best, best_len = rule, len(prefix)
+    return best
+
+
+# Helper function to pick the encoding from the Accept-Encoding header (q-values honoured)
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[token] = q
+
+    supported = ["br", "gzip"] if brotli is not None else ["gzip"]
+    candidates = [
+        (weights.get(encoding, weights.get("*", 0.0)), -i, encoding)
+        for i, encoding in enumerate(supported)
+    ]
+    q, _, encoding = max(candidates)
+    return encoding if q > 0 else None
+
+
+def compress(body: bytes, encoding: str, rule: CompressionRule) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=rule.brotli_quality)
+    return gzip.compress(body, compresslevel=rule.gzip_level, mtime=0)
+
+
+# Helper function to rebuild a consumed streaming response around a new body,
+# keeping every original header (duplicates included) but the length
+def _rebuild(response, body: bytes) -> Response:
+    rebuilt = Response(body, status_code=response.status_code)
+    rebuilt.raw_headers = [
+        (name, value) for name, value in response.raw_headers if name != b"content-length"
+    ] + [(b"content-length", str(len(body)).encode("latin-1"))]
+    return rebuilt
+
+
+class CompressionMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        response = await call_next(request)
+
+        encoding = negotiate_encoding(request.headers.get("accept-encoding"))
+        content_type = response.headers.get("content-type", "")
+        if (
+            encoding is None
+            or request.method == "HEAD"
+            or response.status_code < 200
+            or response.status_code in (204, 304)
+            or "content-encoding" in response.headers
+            or not content_type.startswith(COMPRESSIBLE_TYPES)
+        ):
+            return response
+
+        rule = rule_for(request.url.path)
+
+        # Small bodies are not worth the CPU: skip before buffering when the length is known
+        content_length = response.headers.get("content-length")
+        if content_length is not None and int(content_length) < rule.min_size:
+            return response
+
+        body = b"".join([chunk async for chunk in response.body_iterator])
+
+        if len(body) < rule.min_size:
+            return _rebuild(response, body)
+
+        level = rule.brotli_quality if encoding == "br" else rule.gzip_level
+        key = (hashlib.sha1(body).digest(), encoding, level) if rule.cache else None
+        compressed = compressed_cache.get(key) if key else None
+
+        if compressed is None:
+            if len(body) > THREADPOOL_THRESHOLD:
+                compressed = await run_in_threadpool(compress, body, encoding, rule)
+            else:
+                compressed = compress(body, encoding, rule)
+            if key:
+                compressed_cache.set(key, compressed)
+
+        compressed_response = _rebuild(response, compressed)
+        compressed_response.headers["content-encoding"] = encoding
+        compressed_response.headers.add_vary_header("Accept-Encoding")
+        return compressed_response
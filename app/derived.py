@@ -0,0 +1,101 @@
+# app/derived.py
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.models import SchemaMigration
+
+logger = logging.getLogger(__name__)
+
+#
+#
+# DERIVED TABLES
+# READ ONCE THEIR FILL MIGRATION IS RECORDED, COMPUTED FROM THEIR SOURCES UNTIL THEN
+#
+#
+# parcelle_location, search_ngram, personne_role and the daily stats rollups
+# are created empty at startup and filled by deferred migrations (see
+# app/migrations.py), run from the CLI while the API serves. Until its fill is
+# recorded in schema_migrations a derived table only holds the rows the
+# session hooks wrote since startup, so its readers must not trust it:
+#
+#     FROM {derived_tables.source("personne_role")} pr
+#
+# reads the table once filled, and before that the subquery its owning module
+# registered, the same rows computed from the source tables: slower, never
+# partial. The applied versions are read once, then re-read at most every
+# DERIVED_RECHECK_SECONDS while a fill is missing, since the CLI records it
+# from another process. A recorded fill stays recorded.
+
+DERIVED_RECHECK_SECONDS = int(os.getenv("DERIVED_RECHECK_SECONDS", 60))
+
+# Derived table -> version of the deferred migration filling it
+FILL_MIGRATIONS = {
+    "search_ngram": 4,
+    "stats_parcelle_jour": 7,
+    "stats_bien_jour": 7,
+    "stats_menage_jour": 7,
+    "personne_role": 8,
+    "parcelle_location": 9,
+}
+
+
+class DerivedTables:
+    def __init__(self):
+        self.stand_ins = {}  # table -> SELECT of its rows from the source tables
+        self._applied = set()
+        self._read_at = None
+        self._lock = threading.Lock()
+
+    def register(self, table: str, stand_in: str):
+        """Declare the SELECT giving the rows of `table` from its sources, read until it is filled."""
+        self.stand_ins[table] = stand_in
+
+    def _read_applied(self) -> set:
+        db = SessionLocal()
+        try:
+            return set(db.execute(select(SchemaMigration.version)).scalars())
+        except Exception:
+            # No schema_migrations yet: nothing is filled
+            logger.warning("derived tables: schema_migrations unreadable, reading from the sources", exc_info=True)
+            return set()
+        finally:
+            db.close()
+
+    def filled(self, table: str) -> bool:
+        """Whether the migration filling `table` is recorded."""
+        version = FILL_MIGRATIONS[table]
+        with self._lock:
+            if version in self._applied:
+                return True
+            if self._read_at is not None and time.monotonic() - self._read_at < DERIVED_RECHECK_SECONDS:
+                return False
+        applied = self._read_applied()
+        with self._lock:
+            self._applied |= applied
+            self._read_at = time.monotonic()
+            return version in self._applied
+
+    def source(self, table: str) -> str:
+        """`table` once filled, its stand-in subquery before that, to put before an alias."""
+        if self.filled(table):
+            return table
+        return f"({self.stand_ins[table]})"
+
+    def mark_filled(self, *tables: str):
+        """Trust `tables` as filled whatever schema_migrations says (benchmark databases)."""
+        with self._lock:
+            self._applied.update(FILL_MIGRATIONS[table] for table in tables)
+
+    def clear(self):
+        """Forget the applied versions: the next check re-reads them."""
+        with self._lock:
+            self._applied = set()
+            self._read_at = None
+
+
+derived_tables = DerivedTables()
@@ -0,0 +1,101 @@
+# app/fanout.py
+import os
+import threading
+
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from sqlalchemy import event
+
+from app.database import SessionLocal
+
+#
+#
+# QUERY FANOUT
+# INDEPENDENT READ QUERIES RUN CONCURRENTLY, EACH ON ITS OWN POOLED CONNECTION
+#
+#
+# A route whose queries do not depend on each other should answer in the time
+# of the slowest one, not of their sum. fan_out() runs each query in a worker
+# thread on its own session, so on its own connection of the engine pool. At
+# most FANOUT_MAX_WORKERS run at once for a request: a burst of dashboard
+# loads must not drain the pool (pool_size 20 + max_overflow 40, see
+# app/database.py).
+#
+# The first failure cancels the queries not started yet and stops the
+# statements of the running ones: their cursor is cancelled (SQLCancel on a
+# pyodbc cursor, interrupt() on a sqlite connection) and a cancelled query
+# runs no further statement. The failure is raised once they have returned,
+# their results and errors are dropped. A failed dashboard request therefore
+# frees its connections at once instead of leaving its slowest scans running.
+
+FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", "4"))
+
+
+class QueryCancelled(Exception):
+    """Raised inside a query stopped because another query of its fan_out() failed."""
+
+
+class _Run:
+    """One query of a fan_out(), with the cursor of the statement it is running."""
+
+    def __init__(self, query):
+        self.query = query
+        self.cancelled = False
+        self._running = None  # (cursor, DBAPI connection) of the statement in progress
+        self._lock = threading.Lock()
+
+    def _track(self, conn, cursor, statement, parameters, context, executemany):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCancelled()
+            self._running = (cursor, conn.connection.driver_connection)
+
+    def __call__(self):
+        db = SessionLocal()
+        try:
+            connection = db.connection()
+            event.listen(connection, "before_cursor_execute", self._track)
+            try:
+                return self.query(db)
+            finally:
+                event.remove(connection, "before_cursor_execute", self._track)
+        finally:
+            db.close()
+
+    def cancel(self):
+        """Stop the statement in progress, and any later one."""
+        with self._lock:
+            self.cancelled = True
+            running = self._running
+        if running is None:
+            return
+        cursor, driver_connection = running
+        try:
+            if hasattr(cursor, "cancel"):
+                cursor.cancel()
+            elif hasattr(driver_connection, "interrupt"):
+                driver_connection.interrupt()
+        except Exception:
+            pass  # The statement ended meanwhile
+
+
+def fan_out(queries: dict, max_workers: int = None) -> dict:
+    """name -> query(session) result, for independent read-only queries
+    (callables taking a session), at most max_workers at a time."""
+    max_workers = min(max_workers or FANOUT_MAX_WORKERS, len(queries))
+    runs = {name: _Run(query) for name, query in queries.items()}
+    if max_workers <= 1:
+        return {name: run() for name, run in runs.items()}
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout") as executor:
+        futures = {name: executor.submit(run) for name, run in runs.items()}
+        done, pending = wait(futures.values(), return_when=FIRST_EXCEPTION)
+        for future in futures.values():
+            if future in done and future.exception() is not None:
+                for other in pending:
+                    other.cancel()
+                for name, other in futures.items():
+                    if other in pending:
+                        runs[name].cancel()
+                raise future.exception()
+    return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,69 @@
+# app/fieldsets.py
+from typing import Optional
+
+from fastapi import HTTPException
+
+#
+#
+# SPARSE FIELDSETS
+# fields=geometry,adresse,... SELECTS WHICH COLUMNS AND JOINS ARE COMPILED
+#
+#
+# Ids and creation dates are always returned. "attributes" stands for every
+# group but the geometry, "all" for every group.
+
+CARTOGRAPHIE_FIELDS = ("geometry", "superficie", "proprietaire", "usage", "agent", "adresse")
+
+# Payload keys of each /cartographie field group
+CARTOGRAPHIE_FIELD_KEYS = {
+    "geometry": ("coordinates",),
+    "superficie": ("superficie", "superficie_corrige", "unite"),
+    "proprietaire": ("nom_proprietaire",),
+    "usage": ("nature_bien", "usage", "usage_specifique"),
+    "agent": ("ajouter_par",),
+    "adresse": ("commune", "quartier", "avenue", "rang"),
+}
+
+GEOJSON_FIELDS = ("geometry", "superficie", "proprietaire", "usage", "agent", "adresse", "biens")
+
+
+def parse_fields(fields: Optional[str], groups: tuple) -> frozenset:
+    """Requested field groups; every group when `fields` is not given."""
+    if not fields:
+        return frozenset(groups)
+
+    selected = set()
+    for name in fields.split(","):
+        name = name.strip().lower()
+        if not name or name == "id":
+            continue
+        if name == "all":
+            selected.update(groups)
+        elif name == "attributes":
+            selected.update(group for group in groups if group != "geometry")
+        elif name in groups:
+            selected.add(name)
+        else:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown field group '{name}'. Allowed: id, all, attributes, {', '.join(groups)}",
+            )
+    return frozenset(selected)
+
+
+def sparse_keys(field_keys: dict, selected: frozenset) -> frozenset:
+    """Payload keys belonging to the groups that were not requested."""
+    return frozenset(key for group, keys in field_keys.items() if group not in selected for key in keys)
+
+
+def sparse(struct, dropped: frozenset):
+    """Dict view of a typed struct (see app/structs.py) without the dropped keys, nested structs included."""
+    if struct is None:
+        return None
+    out = {}
+    for name in struct.__dataclass_fields__:
+        if name in dropped:
+            continue
+        value = getattr(struct, name)
+        out[name] = sparse(value, dropped) if hasattr(value, "__dataclass_fields__") else value
+    return out
@@ -0,0 +1,280 @@
+# app/filters.py
+import re
+import unicodedata
+
+from datetime import date, datetime, timedelta
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+
+from app.derived import derived_tables
+
+#
+#
+# SARGABLE FILTER COMPILER
+# HALF-OPEN DATETIME RANGES AND TYPED PARAMETERS FOR THE SQL ROUTES
+#
+#
+# CAST(p.date_create AS DATE) >= CAST(:date_start AS DATE) wraps the column in a
+# function and binds the day as a string: SQL Server cannot seek on the
+# date_create indexes. The compiler keeps the column bare and binds datetimes:
+#
+#     p.date_create >= :date_start AND p.date_create < :date_end
+#
+# where :date_end is the midnight after the requested end day, so that day is
+# still fully included. Ids are bound as ints to match the int key columns
+# without an implicit conversion.
+
+
+def to_datetime(value) -> Optional[datetime]:
+    """Midnight of a YYYY-MM-DD string, a date or a datetime (None stays None)."""
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    try:
+        return datetime.strptime(str(value).strip()[:10], "%Y-%m-%d")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD")
+
+
+def date_bounds(date_start=None, date_end=None) -> tuple:
+    """Half-open [start, end) bounds covering date_start through date_end inclusive."""
+    start = to_datetime(date_start)
+    end = to_datetime(date_end)
+    if end is not None:
+        end += timedelta(days=1)
+    return start, end
+
+
+def day_bounds(date_start=None, date_end=None) -> tuple:
+    """Inclusive [start, end] days, for DATE columns such as the stats rollups' jour."""
+    start = to_datetime(date_start)
+    end = to_datetime(date_end)
+    return (start.date() if start else None), (end.date() if end else None)
+
+
+def date_range_clauses(column, date_start=None, date_end=None) -> list:
+    """The same half-open range as ORM expressions, for select() based routes."""
+    start, end = date_bounds(date_start, date_end)
+    clauses = []
+    if start is not None:
+        clauses.append(column >= start)
+    if end is not None:
+        clauses.append(column < end)
+    return clauses
+
+
+class SqlFilters:
+    """WHERE predicates and their bind parameters for the raw text() queries."""
+
+    def __init__(self, params: Optional[dict] = None):
+        self.filters = []
+        self.params = dict(params or {})
+
+    def __bool__(self):
+        return bool(self.filters)
+
+    def add(self, clause: str, **params):
+        self.filters.append(clause)
+        self.params.update(params)
+        return self
+
+    def equals(self, column: str, name: str, value, type_=int):
+        """column = :name, bound as `type_` (skipped when no value is given)."""
+        if value is None or value == "":
+            return self
+        self.filters.append(f"{column} = :{name}")
+        self.params[name] = type_(value)
+        return self
+
+    def date_range(self, column: str, date_start=None, date_end=None, start_name="date_start", end_name="date_end"):
+        start, end = date_bounds(date_start, date_end)
+        if start is not None:
+            self.filters.append(f"{column} >= :{start_name}")
+            self.params[start_name] = start
+        if end is not None:
+            self.filters.append(f"{column} < :{end_name}")
+            self.params[end_name] = end
+        return self
+
+    def day_range(self, column: str, date_start=None, date_end=None, start_name="date_start", end_name="date_end"):
+        """date_range() for a DATE column: both days included, bound as dates."""
+        start, end = day_bounds(date_start, date_end)
+        if start is not None:
+            self.filters.append(f"{column} >= :{start_name}")
+            self.params[start_name] = start
+        if end is not None:
+            self.filters.append(f"{column} <= :{end_name}")
+            self.params[end_name] = end
+        return self
+
+    def keyword(self, columns: Iterable[str], name: str, keyword: Optional[str]):
+        """(col1 LIKE :name OR col2 LIKE :name ...) on %keyword%."""
+        if not keyword:
+            return self
+        self.filters.append("(" + " OR ".join(f"{column} LIKE :{name}" for column in columns) + ")")
+        self.params[name] = f"%{keyword}%"
+        return self
+
+    def search(self, columns: Iterable[str], name: str, keyword: Optional[str], targets: Iterable[tuple]):
+        """keyword() narrowed first by the n-gram index: targets are (id column, entity) pairs,
+        e.g. (("per.id", "personne"), ("p.fk_rang", "rang")). The LIKE predicates still
+        decide, on the candidates only; keywords the index cannot answer fall back to them,
+        and so does every keyword until migration 4 has indexed the rows already there."""
+        grams = keyword_grams(keyword)
+        if grams and derived_tables.filled("search_ngram"):
+            names = []
+            for i, gram in enumerate(grams):
+                names.append(f":{name}_g{i}")
+                self.params[f"{name}_g{i}"] = gram
+            self.filters.append("(" + " OR ".join(
+                f"{id_column} IN (SELECT g.entity_id FROM search_ngram g"
+                f" WHERE g.entity = '{entity}' AND g.gram IN ({', '.join(names)})"
+                f" GROUP BY g.entity_id HAVING COUNT(*) = {len(grams)})"
+                for id_column, entity in targets
+            ) + ")")
+        return self.keyword(columns, name, keyword)
+
+    def sql(self, keyword: str = "AND") -> str:
+        """' AND f1 AND f2' to append after a WHERE, '' when there is no filter."""
+        if not self.filters:
+            return ""
+        return f" {keyword} " + " AND ".join(self.filters)
+
+    def location(self, province=None, ville=None, commune=None, quartier=None, avenue=None, rang=None):
+        """Location filters on the materialized parcelle_location pl (see app/locations.py):
+        one indexed join whatever the level, instead of the adresse > ... > province chain."""
+        self.equals("pl.fk_province", "province", province)
+        self.equals("pl.fk_ville", "ville", ville)
+        self.equals("pl.fk_commune", "commune", commune)
+        self.equals("pl.fk_quartier", "quartier", quartier)
+        self.equals("pl.fk_avenue", "avenue", avenue)
+        self.equals("p.fk_rang", "rang", rang)
+        return self
+
+    def stats_location(self, commune=None, quartier=None, avenue=None, rang=None):
+        """Location filters on a daily stats rollup s (see app/rollups.py), which
+        holds the avenue: quartier and commune are read through STATS_JOINS."""
+        self.equals("q.fk_commune", "commune", commune)
+        self.equals("av.fk_quartier", "quartier", quartier)
+        self.equals("s.fk_avenue", "avenue", avenue)
+        self.equals("s.fk_rang", "rang", rang)
+        return self
+
+    def aliases(self) -> set:
+        return referenced_aliases(*self.filters)
+
+
+#
+#
+# N-GRAM KEYWORD SEARCH
+# CANDIDATE IDS FROM THE search_ngram INDEX INSTEAD OF A LIKE '%kw%' SCAN
+#
+#
+# Every label of an indexed entity (see app/search.py) is folded (lower case,
+# no accents) and cut into overlapping trigrams. A row can only match
+# LIKE '%kw%' if it has every trigram of the folded keyword, so the rows
+# holding all of them are a superset of the matches: the LIKE predicates then
+# only run on those candidates.
+
+NGRAM_SIZE = 3
+
+
+def fold(text: str) -> str:
+    """Lower case without accents: the form labels and keywords are indexed in."""
+    return "".join(ch for ch in unicodedata.normalize("NFKD", text.lower()) if not unicodedata.combining(ch))
+
+
+def ngrams(text: Optional[str]) -> set:
+    if not text:
+        return set()
+    text = fold(text)
+    return {text[i:i + NGRAM_SIZE] for i in range(len(text) - NGRAM_SIZE + 1)}
+
+
+def keyword_grams(keyword: Optional[str]) -> Optional[tuple]:
+    """Trigrams of a keyword, None when the index cannot answer it: shorter
+    than a trigram, or holding LIKE wildcards (%, _, [)."""
+    if not keyword or any(ch in keyword for ch in "%_["):
+        return None
+    grams = ngrams(keyword)
+    return tuple(sorted(grams)) or None
+
+
+#
+#
+# JOIN PRUNING
+# ONLY THE JOINS THE FILTERS AND THE SELECTED COLUMNS REFERENCE
+#
+#
+# Each join is keyed by the alias it introduces and names the alias it hangs
+# from. A query references aliases (c.intitule, q.fk_commune, ...); the joins
+# reaching them are emitted, parents first, and every other join is dropped.
+# Without a location filter a count is a bare COUNT(*) on one table. A derived
+# table is named {table}: it is read through derived_tables.source()
+# (app/derived.py), its stand-in subquery until its fill migration is recorded.
+
+# From parcelle p: every location level hangs from parcelle_location pl, so a
+# commune name is two joins away instead of five
+LOCATION_JOINS = {
+    "pl": ("LEFT JOIN {parcelle_location} pl ON pl.parcelle_id = p.id", "p"),
+    "a": ("LEFT JOIN adresse a ON p.fk_adresse = a.id", "p"),
+    "av": ("LEFT JOIN avenue av ON pl.fk_avenue = av.id", "pl"),
+    "q": ("LEFT JOIN quartier q ON pl.fk_quartier = q.id", "pl"),
+    "c": ("LEFT JOIN commune c ON pl.fk_commune = c.id", "pl"),
+    "v": ("LEFT JOIN ville v ON pl.fk_ville = v.id", "pl"),
+    "pr": ("LEFT JOIN province pr ON pl.fk_province = pr.id", "pl"),
+    "r": ("LEFT JOIN rang r ON p.fk_rang = r.id", "p"),
+}
+
+# Rooted at parcelle p
+PARCELLE_JOINS = {
+    "per": ("LEFT JOIN personne per ON p.fk_proprietaire = per.id", "p"),
+    "tp": ("LEFT JOIN type_personne tp ON per.fk_type_personne = tp.id", "per"),
+    **LOCATION_JOINS,
+}
+
+# Rooted at bien b
+BIEN_JOINS = {
+    "p": ("LEFT JOIN parcelle p ON b.fk_parcelle = p.id", "b"),
+    **LOCATION_JOINS,
+    "nb": ("LEFT JOIN nature_bien nb ON b.fk_nature_bien = nb.id", "b"),
+    "per": ("LEFT JOIN personne per ON b.fk_proprietaire = per.id", "b"),
+    "tp": ("LEFT JOIN type_personne tp ON per.fk_type_personne = tp.id", "per"),
+}
+
+# From a daily stats rollup s (app/rollups.py), keyed by avenue
+STATS_JOINS = {
+    "av": ("LEFT JOIN avenue av ON s.fk_avenue = av.id", "s"),
+    "q": ("LEFT JOIN quartier q ON av.fk_quartier = q.id", "av"),
+    "c": ("LEFT JOIN commune c ON q.fk_commune = c.id", "q"),
+}
+
+_DERIVED_RE = re.compile(r"\{(\w+)\}")
+_ALIAS_RE = re.compile(r"(?<![\w.'])([A-Za-z_]\w*)\.(?=[A-Za-z_])")
+
+
+def referenced_aliases(*fragments: str) -> set:
+    """Table aliases used as `alias.column` in the given SQL fragments."""
+    aliases = set()
+    for fragment in fragments:
+        aliases.update(_ALIAS_RE.findall(fragment))
+    return aliases
+
+
+def build_joins(joins: dict, aliases: Iterable[str]) -> str:
+    """The joins needed to reach `aliases`, in the declaration order of `joins`."""
+    needed = set()
+    for alias in aliases:
+        while alias in joins and alias not in needed:
+            needed.add(alias)
+            alias = joins[alias][1]
+    return "\n".join(
+        _DERIVED_RE.sub(lambda match: derived_tables.source(match.group(1)), clause)
+        for alias, (clause, _) in joins.items()
+        if alias in needed
+    )
+
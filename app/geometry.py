@@ -0,0 +1,313 @@
+# app/geometry.py
+import json
+import math
+import os
+
+from typing import Optional
+
+from app.cache import LRUCache
+
+# Zoom levels at which simplified geometries are precomputed. A request for a
+# zoom between two levels is served the next finer level; beyond the last
+# level the raw geometry is returned untouched.
+SIMPLIFY_ZOOM_LEVELS = (10, 12, 14, 16, 18)
+
+# Approximate length of one degree of latitude, in metres
+METRES_PER_DEGREE = 111320.0
+
+# Simplified geometries, keyed by (entity, id, hash of the raw geometry) so a
+# corrected geometry (coord_corrige) never serves a stale simplification.
+geometry_cache = LRUCache(maxsize=int(os.getenv("GEOMETRY_CACHE_SIZE", "50000")))
+
+
+def zoom_tolerance(zoom: int) -> float:
+    """Tolerance (in degrees) equal to one 256px tile pixel at the given zoom."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def resolve_simplify_level(zoom: Optional[int] = None, simplify: Optional[float] = None) -> Optional[int]:
+    """
+    Pick the precomputed level to serve for a `zoom` or `simplify` (metres) request.
+    Returns None when the raw geometry should be sent.
+    """
+    if zoom is not None:
+        for level in SIMPLIFY_ZOOM_LEVELS:
+            if zoom <= level:
+                return level
+        return None
+
+    if simplify:
+        # Coarsest level whose tolerance does not exceed the requested one
+        tolerance = simplify / METRES_PER_DEGREE
+        for level in SIMPLIFY_ZOOM_LEVELS:
+            if zoom_tolerance(level) <= tolerance:
+                return level
+        return None
+
+    return None
+
+
+# Helper function to parse a stored geometry into rings of points.
+# Two formats live in the database:
+#   - Kobo geoshape: "lat lon alt acc;lat lon alt acc;..." (coordinates, coordonnee_geographique)
+#   - GeoJSON coordinates dumped with json.dumps (coord_corrige)
+def parse_geometry(raw):
+    if not raw or not isinstance(raw, str):
+        return None
+    raw = raw.strip()
+
+    if raw.startswith("["):
+        try:
+            return "json", json.loads(raw)
+        except ValueError:
+            return None
+
+    points = []
+    for part in raw.split(";"):
+        vals = part.strip().split()
+        if len(vals) < 2:
+            continue
+        try:
+            # Keep the extra tokens (altitude, accuracy) untouched
+            points.append((float(vals[1]), float(vals[0]), vals))
+        except ValueError:
+            continue
+    return ("kobo", points) if points else None
+
+
+def _is_position(value):
+    return (
+        isinstance(value, list)
+        and len(value) >= 2
+        and isinstance(value[0], (int, float))
+        and isinstance(value[1], (int, float))
+    )
+
+
+def _vertex_weights(coords):
+    """
+    Douglas-Peucker run once without a tolerance: every vertex gets the
+    tolerance below which it stops being dropped. Keeping the vertices whose
+    weight exceeds a tolerance gives the DP simplification at that tolerance,
+    so all levels come out of a single pass.
+    """
+    n = len(coords)
+    weights = [0.0] * n
+    weights[0] = weights[-1] = math.inf
+    if n < 3:
+        return weights
+
+    # Scale longitudes so distances are isotropic at the ring's latitude
+    kx = math.cos(math.radians(coords[0][1]))
+
+    stack = [(0, n - 1, math.inf)]
+    while stack:
+        first, last, parent = stack.pop()
+        if last - first < 2:
+            continue
+        ax, ay = coords[first][0] * kx, coords[first][1]
+        bx, by = coords[last][0] * kx, coords[last][1]
+        dx, dy = bx - ax, by - ay
+        seg = dx * dx + dy * dy
+        index, dmax = first + 1, -1.0
+        for i in range(first + 1, last):
+            px, py = coords[i][0] * kx, coords[i][1]
+            if seg == 0.0:
+                # Closed ring: first and last are the same point
+                d = math.hypot(px - ax, py - ay)
+            else:
+                d = abs(dy * px - dx * py + bx * ay - by * ax) / math.sqrt(seg)
+            if d > dmax:
+                index, dmax = i, d
+        # A child never outlives its parent segment
+        weight = min(dmax, parent)
+        weights[index] = weight
+        stack.append((first, index, weight))
+        stack.append((index, last, weight))
+    return weights
+
+
+def _simplify_ring(points, weights, tolerance, closed):
+    kept = [p for p, w in zip(points, weights) if w > tolerance]
+    # Never collapse a polygon ring below a triangle or a line below 2 points
+    minimum = 4 if closed else 2
+    if len(kept) >= minimum or len(points) <= minimum:
+        return kept if len(kept) >= minimum else points
+    # Too coarse for the ring: its endpoints and heaviest interior vertices, in ring order,
+    # so a coarser level never sends more vertices than a finer one
+    interior = sorted(range(1, len(points) - 1), key=lambda i: weights[i], reverse=True)[:minimum - 2]
+    return [points[i] for i in [0, *sorted(interior), len(points) - 1]]
+
+
+def _is_closed(coords):
+    return len(coords) > 3 and coords[0][0] == coords[-1][0] and coords[0][1] == coords[-1][1]
+
+
+def _simplify_json(value, levels):
+    """Return {level: simplified nested coordinates} for a GeoJSON coordinates value."""
+    if isinstance(value, list) and value and all(_is_position(p) for p in value):
+        weights = _vertex_weights(value)
+        closed = _is_closed(value)
+        return {
+            level: _simplify_ring(value, weights, zoom_tolerance(level), closed)
+            for level in levels
+        }
+    if isinstance(value, list):
+        children = [_simplify_json(child, levels) for child in value]
+        return {level: [child[level] for child in children] for level in levels}
+    return {level: value for level in levels}
+
+
+def _build_levels(raw):
+    parsed = parse_geometry(raw)
+    if parsed is None:
+        return {level: raw for level in SIMPLIFY_ZOOM_LEVELS}
+
+    kind, value = parsed
+    if kind == "json":
+        simplified = _simplify_json(value, SIMPLIFY_ZOOM_LEVELS)
+        return {level: json.dumps(coords) for level, coords in simplified.items()}
+
+    coords = [(lon, lat) for lon, lat, _ in value]
+    weights = _vertex_weights(coords)
+    closed = _is_closed(coords)
+    levels = {}
+    for level in SIMPLIFY_ZOOM_LEVELS:
+        kept = _simplify_ring(value, weights, zoom_tolerance(level), closed)
+        levels[level] = ";".join(" ".join(tokens) for _, _, tokens in kept)
+    return levels
+
+
+def simplify_geometry(raw, level: Optional[int], entity: str = None, entity_id=None):
+    """
+    Serve a stored geometry at a precomputed simplification level, in the same
+    format it was stored in. Every level is computed on first access and cached.
+    """
+    if level is None or not raw or not isinstance(raw, str):
+        return raw
+    if entity is None or entity_id is None:
+        return _build_levels(raw).get(level, raw)
+
+    key = (entity, entity_id, hash(raw))
+    levels = geometry_cache.get_or_set(key, lambda: _build_levels(raw))
+    return levels.get(level, raw)
+
+
+# Default number of decimals kept on coordinates in map payloads; negative (the
+# default) sends them as stored unless a request asks for precision=. Rounding
+# is opt-in: it costs an encoding pass per geometry for ~20% smaller payloads.
+# 6 decimals is ~11 cm on the ground, well below the GPS accuracy of the surveys.
+COORD_PRECISION = int(os.getenv("COORD_PRECISION", "-1"))
+
+# Decimals of the integer-delta encoding when no precision is requested
+DELTA_PRECISION = 6
+
+
+def resolve_precision(precision: Optional[int] = None) -> Optional[int]:
+    """Requested precision, else the configured default (a negative default disables quantization)."""
+    if precision is not None:
+        return precision
+    return COORD_PRECISION if COORD_PRECISION >= 0 else None
+
+
+def _quantize_json(value, precision):
+    if _is_position(value):
+        # Only x and y: altitude or any other ordinate is not a plan coordinate
+        return [round(v, precision) if isinstance(v, float) else v for v in value[:2]] + value[2:]
+    if isinstance(value, list):
+        return [_quantize_json(child, precision) for child in value]
+    return value
+
+
+def _quantize_token(token, precision):
+    try:
+        return repr(round(float(token), precision))
+    except ValueError:
+        return token
+
+
+def quantize_geometry(raw, precision: Optional[int]):
+    """Round the coordinates of a stored geometry to `precision` decimals, keeping its format."""
+    if precision is None:
+        return raw
+    parsed = parse_geometry(raw)
+    if parsed is None:
+        return raw
+
+    kind, value = parsed
+    if kind == "json":
+        return json.dumps(_quantize_json(value, precision))
+
+    # Altitude and accuracy are kept as recorded
+    return ";".join(
+        " ".join([_quantize_token(tokens[0], precision), _quantize_token(tokens[1], precision)] + tokens[2:])
+        for _, _, tokens in value
+    )
+
+
+def _delta_ring(ring, scale):
+    encoded = []
+    px = py = 0
+    for position in ring:
+        x, y = int(round(position[0] * scale)), int(round(position[1] * scale))
+        encoded.append([x - px, y - py])
+        px, py = x, y
+    return encoded
+
+
+def _delta_json(value, scale):
+    if isinstance(value, list) and value and all(_is_position(p) for p in value):
+        return _delta_ring(value, scale)
+    if isinstance(value, list):
+        return [_delta_json(child, scale) for child in value]
+    return value
+
+
+def delta_encode_geometry(raw, precision: int):
+    """
+    Integer-delta encode a stored geometry: every position becomes integers at
+    10**precision scale, the first one absolute and the others relative to the
+    previous position. Positions are always [lon, lat], whatever the stored format.
+    """
+    parsed = parse_geometry(raw)
+    if parsed is None:
+        return raw
+
+    kind, value = parsed
+    scale = 10 ** precision
+    if kind == "json":
+        coordinates = _delta_json(value, scale)
+    else:
+        coordinates = [_delta_ring([(lon, lat) for lon, lat, _ in value], scale)]
+    return {"encoding": "delta", "scale": scale, "coordinates": coordinates}
+
+
+def render_geometry(
+    raw,
+    level: Optional[int] = None,
+    precision: Optional[int] = None,
+    delta: bool = False,
+    entity: str = None,
+    entity_id=None,
+):
+    """
+    Output stage for the geometries of map payloads: simplification for the
+    requested zoom, then quantization (or integer-delta encoding) of the coordinates.
+    """
+    if not raw or not isinstance(raw, str):
+        return raw
+    if delta and precision is None:
+        precision = COORD_PRECISION if COORD_PRECISION >= 0 else DELTA_PRECISION
+    if level is None and precision is None:
+        return raw
+
+    def build():
+        geometry = simplify_geometry(raw, level, entity, entity_id)
+        if delta:
+            return delta_encode_geometry(geometry, precision)
+        return quantize_geometry(geometry, precision)
+
+    if entity is None or entity_id is None:
+        return build()
+    key = (entity, entity_id, hash(raw), level, precision, delta)
+    return geometry_cache.get_or_set(key, build)
@@ -0,0 +1,242 @@
+# app/locations.py
+import logging
+import os
+
+from sqlalchemy import Integer, event, inspect
+from sqlalchemy.sql import bindparam, column, text
+
+from app.database import SessionLocal
+from app.derived import derived_tables
+from app.models import Parcelle, ParcelleLocation, Adresse, Avenue, Quartier, Commune, Ville
+
+logger = logging.getLogger(__name__)
+
+#
+#
+# MATERIALIZED PARCELLE LOCATION
+# ONE INDEXED ROW PER PARCELLE WITH ALL ITS ANCESTOR IDS
+#
+#
+# parcelle_location holds, for every parcelle, the ids found along
+# adresse > avenue > quartier > commune > ville > province. Location filters
+# and group-bys read it with a single join instead of walking the chain.
+#
+# It is kept in sync by the session hooks below, in the transaction that
+# writes the parcelle: ingestion (new parcelles) and remaps (an avenue moved to
+# another quartier, an adresse to another avenue, ...) refresh the rows they
+# affect before the commit. Writes made with raw SQL bypass the hooks:
+# check_parcelle_locations() finds and repairs the rows they left stale.
+# Until migration 9 has filled it, readers get the same rows from the join
+# chain (see app/derived.py).
+
+PARCELLE_LOCATION_BATCH_SIZE = int(os.getenv("PARCELLE_LOCATION_BATCH_SIZE", 5000))
+ID_BATCH_SIZE = 1000  # SQL Server accepts at most 2100 parameters per statement
+
+# Ancestor ids as resolved by the join chain: a dangling foreign key gives NULL
+LOCATION_COLUMNS = ("fk_adresse", "fk_avenue", "fk_quartier", "fk_commune", "fk_ville", "fk_province")
+LOCATION_CHAIN = """
+    LEFT JOIN adresse a ON p.fk_adresse = a.id
+    LEFT JOIN avenue av ON a.fk_avenue = av.id
+    LEFT JOIN quartier q ON av.fk_quartier = q.id
+    LEFT JOIN commune c ON q.fk_commune = c.id
+    LEFT JOIN ville v ON c.fk_ville = v.id
+    LEFT JOIN province pr ON v.fk_province = pr.id
+"""
+CHAIN_IDS = ("a.id", "av.id", "q.id", "c.id", "v.id", "pr.id")
+
+SELECT_LOCATIONS = f"""
+    SELECT p.id AS parcelle_id, {", ".join(f"{chain_id} AS {name}" for chain_id, name in zip(CHAIN_IDS, LOCATION_COLUMNS))}
+    FROM parcelle p
+    {LOCATION_CHAIN}
+"""
+
+INSERT_LOCATIONS = f"""
+    INSERT INTO parcelle_location (parcelle_id, {", ".join(LOCATION_COLUMNS)})
+    {SELECT_LOCATIONS}
+"""
+
+derived_tables.register("parcelle_location", SELECT_LOCATIONS)
+
+
+def parcelle_location_table():
+    """parcelle_location for the select() based routes, or until it is filled its rows
+    selected through the join chain: both give .c.parcelle_id, .c.fk_commune, ..."""
+    if derived_tables.filled("parcelle_location"):
+        return ParcelleLocation.__table__
+    columns = [column(name, Integer) for name in ("parcelle_id", *LOCATION_COLUMNS)]
+    return text(SELECT_LOCATIONS).columns(*columns).subquery("pl")
+
+# Model -> (foreign key whose change moves the parcelles below it, level it identifies)
+REMAP_COLUMNS = {
+    Parcelle: ("fk_adresse", "parcelle"),
+    Adresse: ("fk_avenue", "adresse"),
+    Avenue: ("fk_quartier", "fk_avenue"),
+    Quartier: ("fk_commune", "fk_quartier"),
+    Commune: ("fk_ville", "fk_commune"),
+    Ville: ("fk_province", "fk_ville"),
+}
+
+
+# Helper function to run an expanding IN statement over ids, ID_BATCH_SIZE at a time
+def _in_batches(db, statement: str, name: str, ids, fetch: bool = False):
+    query = text(statement).bindparams(bindparam(name, expanding=True))
+    ids = sorted(ids)
+    rows = []
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        result = db.execute(query, {name: ids[start:start + ID_BATCH_SIZE]})
+        if fetch:
+            rows.extend(row[0] for row in result)
+    return rows
+
+
+def refresh_parcelle_locations(db, parcelle_ids) -> int:
+    """Recompute the parcelle_location rows of the given parcelles from the join chain."""
+    parcelle_ids = set(parcelle_ids)
+    if not parcelle_ids:
+        return 0
+    _in_batches(db, "DELETE FROM parcelle_location WHERE parcelle_id IN :parcelle_ids", "parcelle_ids", parcelle_ids)
+    _in_batches(db, INSERT_LOCATIONS + " WHERE p.id IN :parcelle_ids", "parcelle_ids", parcelle_ids)
+    return len(parcelle_ids)
+
+
+def remap_parcelle_locations(db, level: str, ids) -> int:
+    """Refresh the parcelles below the given location nodes.
+
+    level is "parcelle", "adresse" or a parcelle_location column (fk_avenue,
+    fk_quartier, ...): after avenue 12 moved to another quartier,
+    remap_parcelle_locations(db, "fk_avenue", [12]) rewrites its parcelles.
+    """
+    ids = set(ids)
+    if not ids:
+        return 0
+    if level == "parcelle":
+        return refresh_parcelle_locations(db, ids)
+    if level == "adresse":
+        statement = "SELECT id FROM parcelle WHERE fk_adresse IN :ids"
+    elif level in LOCATION_COLUMNS:
+        statement = f"SELECT parcelle_id FROM parcelle_location WHERE {level} IN :ids"
+    else:
+        raise ValueError(f"Unknown location level '{level}'")
+    return refresh_parcelle_locations(db, _in_batches(db, statement, "ids", ids, fetch=True))
+
+
+#
+#
+# SESSION HOOKS: PARCELLES INSERTED OR MOVED IN A TRANSACTION ARE
+# REFRESHED BEFORE IT COMMITS
+#
+#
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_moved_parcelles(session, flush_context):
+    pending = session.info.setdefault("parcelle_location_refresh", {})
+    for obj in session.new:
+        if isinstance(obj, Parcelle):
+            pending.setdefault("parcelle", set()).add(obj.id)
+    for obj in session.dirty:
+        remap = REMAP_COLUMNS.get(type(obj))
+        if remap and inspect(obj).attrs[remap[0]].history.has_changes():
+            pending.setdefault(remap[1], set()).add(obj.id)
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _refresh_moved_parcelles(session):
+    # Flush first: the commit's own flush would run after this hook
+    if session.new or session.dirty:
+        session.flush()
+    pending = session.info.pop("parcelle_location_refresh", None)
+    if not pending:
+        return
+    # Nodes high in the chain first, so a parcelle moved twice ends with its last state
+    for level in ("fk_province", "fk_ville", "fk_commune", "fk_quartier", "fk_avenue", "adresse", "parcelle"):
+        if level in pending:
+            remap_parcelle_locations(session, level, pending[level])
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_moved_parcelles(session):
+    session.info.pop("parcelle_location_refresh", None)
+
+
+#
+#
+# BACKFILL AND CONSISTENCY CHECK
+# BATCHED ON PARCELLE ID RANGES, ONE SHORT TRANSACTION PER BATCH
+#
+#
+
+# Helper function to iterate [low, high) parcelle id ranges of batch_size ids
+def _id_ranges(db, batch_size: int):
+    low, high = db.execute(text("SELECT MIN(id), MAX(id) FROM parcelle")).fetchone()
+    if low is None:
+        return
+    for start in range(low, high + 1, batch_size):
+        yield start, start + batch_size
+
+
+def backfill_parcelle_locations(batch_size: int = PARCELLE_LOCATION_BATCH_SIZE) -> int:
+    """Insert the missing parcelle_location rows; a no-op once the table is complete."""
+    insert_missing = text(INSERT_LOCATIONS + """
+        WHERE p.id >= :low AND p.id < :high
+        AND NOT EXISTS (SELECT 1 FROM parcelle_location pl WHERE pl.parcelle_id = p.id)
+    """)
+    inserted = 0
+    db = SessionLocal()
+    try:
+        for low, high in list(_id_ranges(db, batch_size)):
+            inserted += db.execute(insert_missing, {"low": low, "high": high}).rowcount or 0
+            db.commit()
+    finally:
+        db.close()
+    if inserted:
+        logger.info(f"parcelle_location: {inserted} rows backfilled")
+    return inserted
+
+
+def check_parcelle_locations(repair: bool = False, batch_size: int = PARCELLE_LOCATION_BATCH_SIZE, sample_size: int = 20) -> dict:
+    """Compare parcelle_location with the join chain.
+
+    missing: parcelles without a row, stale: rows whose ids differ from the
+    chain, orphaned: rows without a parcelle. With repair=True every
+    inconsistent row is rewritten (or deleted for orphans).
+    """
+    mismatch = " OR ".join(
+        f"COALESCE(pl.{column}, -1) <> COALESCE({chain_id}, -1)"
+        for column, chain_id in zip(LOCATION_COLUMNS, CHAIN_IDS)
+    )
+    inconsistent = text(f"""
+        SELECT p.id, CASE WHEN pl.parcelle_id IS NULL THEN 1 ELSE 0 END AS missing
+        FROM parcelle p
+        LEFT JOIN parcelle_location pl ON pl.parcelle_id = p.id
+        {LOCATION_CHAIN}
+        WHERE p.id >= :low AND p.id < :high
+        AND (pl.parcelle_id IS NULL OR {mismatch})
+    """)
+    orphans = text("""
+        SELECT pl.parcelle_id FROM parcelle_location pl
+        WHERE NOT EXISTS (SELECT 1 FROM parcelle p WHERE p.id = pl.parcelle_id)
+    """)
+
+    report = {"checked": 0, "missing": 0, "stale": 0, "orphaned": 0, "repaired": 0, "sample": []}
+    db = SessionLocal()
+    try:
+        for low, high in list(_id_ranges(db, batch_size)):
+            rows = db.execute(inconsistent, {"low": low, "high": high}).fetchall()
+            report["missing"] += sum(1 for row in rows if row.missing)
+            report["stale"] += sum(1 for row in rows if not row.missing)
+            report["sample"].extend(row.id for row in rows[:max(sample_size - len(report["sample"]), 0)])
+            if repair and rows:
+                report["repaired"] += refresh_parcelle_locations(db, [row.id for row in rows])
+                db.commit()
+
+        report["checked"] = db.execute(text("SELECT COUNT(*) FROM parcelle")).scalar()
+        orphan_ids = [row[0] for row in db.execute(orphans)]
+        report["orphaned"] = len(orphan_ids)
+        if repair and orphan_ids:
+            _in_batches(db, "DELETE FROM parcelle_location WHERE parcelle_id IN :parcelle_ids", "parcelle_ids", orphan_ids)
+            report["repaired"] += len(orphan_ids)
+            db.commit()
+    finally:
+        db.close()
+    return report
+
@@ -8,6 +8,11 @@ from app.database import engine
 from app.routes import router as routes
 from app.v2.routes import router as v2_routes
 from app.rate_limit import RateLimiterMiddleware, TokenBucket
+from app.compression import CompressionMiddleware
+from app.versioning import ConditionalGetMiddleware
+from app.migrations import pending_migrations, run_migrations
+from app.autocomplete import parcelle_autocomplete
+from app.snapshot import SNAPSHOT_ENABLED, dashboard_snapshot
 
 # Configure logging
 logging.basicConfig(format='%(asctime)s : %(message)s', level=logging.INFO)
@@ -30,6 +35,15 @@ def connect_to_db():
 async def lifespan(app: FastAPI):
     try:
         connect_to_db()
+        # Cheap DDL only: index builds and backfills would hold the port past the liveness probe
+        run_migrations(engine, deferred=False)
+        for version, name in pending_migrations(engine):
+            logger.warning(f"migrations: {version} '{name}' pending, run python -m automation.migrations apply")
+        # Built in the background: the port binds right away, lookups use the index once it is swapped in
+        parcelle_autocomplete.warm()
+        # Same for the dashboard snapshot: the counts come from the rollups until it is
+        if SNAPSHOT_ENABLED:
+            dashboard_snapshot.warm()
         yield
     finally:
         await engine.dispose()
@@ -55,6 +69,12 @@ bucket = TokenBucket(capacity=4, refill_rate=2)
 # Add the rate limiting middleware to the FastAPI app
 app.add_middleware(RateLimiterMiddleware, bucket=bucket)
 
+# ETag / Last-Modified from the data versions, 304 answered before the routes run
+app.add_middleware(ConditionalGetMiddleware)
+
+# Negotiated gzip/brotli compression (outermost, so every response goes through it)
+app.add_middleware(CompressionMiddleware)
+
 @app.get("/health", tags=["Health"])
 def health_check():
     return {"status": "Hids Collect Working"}
@@ -0,0 +1,195 @@
+# app/migrations.py
+import logging
+import time
+
+from datetime import datetime
+
+from sqlalchemy import inspect, insert, select
+
+from app.database import Base, SessionLocal
+from app.derived import derived_tables
+from app.locations import backfill_parcelle_locations
+from app.models import ParcelleLocation, PersonneRole, SchemaMigration, SearchNgram, StatsParcelleJour, StatsBienJour, StatsMenageJour
+from app.roles import rebuild_personne_roles
+from app.rollups import rebuild_rollups_in_batches
+from app.search import rebuild_search_index
+
+logger = logging.getLogger(__name__)
+
+#
+#
+# VERSIONED SCHEMA MIGRATIONS
+# CHEAP DDL APPLIED AT STARTUP, INDEX BUILDS AND BACKFILLS DEFERRED TO THE CLI
+#
+#
+# A migration is a function of a connection registered with @migration(version,
+# name). Pending versions run in ascending order, each in its own transaction
+# together with the insert of its schema_migrations row: a failing migration
+# leaves no trace and is retried on the next run. Versions are never reused
+# or edited once deployed, a change to the schema is a new version.
+#
+# The API applies only the cheap ones at startup (creating empty tables), so
+# the port binds well within the liveness probe's 200 s. The deferred ones
+# build indexes or fill tables over the whole census; they run from
+#
+#     python -m automation.migrations apply
+#
+# while the API serves. Until then the hooks keep the new tables current for
+# the rows written since, and the readers of a table not filled yet compute
+# its rows from the source tables instead (app/derived.py): only slower, never
+# partial. The fills commit batch by batch on sessions of their own rather than
+# holding one transaction over the census: the migration's own transaction
+# only records it. A deferred migration must not be needed by a later cheap
+# one, since startup applies the cheap ones past it.
+
+MIGRATIONS = []
+
+
+def migration(version: int, name: str, deferred: bool = False):
+    def register(func):
+        if any(existing == version for existing, _, _, _ in MIGRATIONS):
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS.append((version, name, func, deferred))
+        return func
+    return register
+
+
+# Helper function to run a batched rebuild on a session of its own, committing each batch
+def _in_own_session(rebuild):
+    db = SessionLocal()
+    try:
+        return rebuild(db)
+    finally:
+        db.close()
+
+
+# Helper function to look up indexes declared in the models' __table_args__ by name
+def model_indexes(*names: str) -> list:
+    declared = {index.name: index for table in Base.metadata.tables.values() for index in table.indexes}
+    missing = [name for name in names if name not in declared]
+    if missing:
+        raise KeyError(f"Indexes not declared in app/models.py: {', '.join(missing)}")
+    return [declared[name] for name in names]
+
+
+# Helper function to create indexes, skipping the ones an administrator already created by hand
+def create_indexes(conn, names) -> None:
+    for index in model_indexes(*names):
+        existing = {item["name"] for item in inspect(conn).get_indexes(index.table.name)}
+        if index.name in existing:
+            logger.info(f"migrations: index {index.name} already exists")
+            continue
+        index.create(bind=conn)
+
+
+@migration(1, "create parcelle_location")
+def _create_parcelle_location(conn):
+    ParcelleLocation.__table__.create(bind=conn, checkfirst=True)
+
+
+# Covering indexes of the hot access paths: foreign keys every read joins on,
+# date_create ranges of the dashboards and exports, and (fk_agent, date_create)
+# for the agent activity reports. INCLUDE columns (SQL Server) let the stats
+# queries answer from the index without a key lookup.
+HOT_PATH_INDEXES = (
+    "ix_adresse_fk_avenue",
+    "ix_avenue_fk_quartier",
+    "ix_quartier_fk_commune",
+    "ix_commune_fk_ville",
+    "ix_ville_fk_province",
+    "ix_parcelle_fk_adresse",
+    "ix_parcelle_date_create",
+    "ix_parcelle_fk_agent_date_create",
+    "ix_parcelle_fk_proprietaire",
+    "ix_bien_fk_parcelle",
+    "ix_bien_date_create",
+    "ix_bien_fk_agent_date_create",
+    "ix_bien_fk_proprietaire",
+    "ix_menage_fk_bien",
+    "ix_menage_fk_personne",
+    "ix_menage_fk_agent_date_create",
+    "ix_membre_menage_fk_menage",
+    "ix_membre_menage_fk_personne",
+    "ix_membre_menage_fk_agent_date_create",
+    "ix_location_bien_fk_bien",
+    "ix_location_bien_fk_personne",
+)
+
+
+@migration(2, "covering indexes for the hot foreign keys and date columns", deferred=True)
+def _create_hot_path_indexes(conn):
+    create_indexes(conn, HOT_PATH_INDEXES)
+
+
+@migration(3, "create search_ngram")
+def _create_search_ngram(conn):
+    SearchNgram.__table__.create(bind=conn, checkfirst=True)
+
+
+@migration(4, "index personne, utilisateur and rang labels in search_ngram", deferred=True)
+def _backfill_search_ngram(conn):
+    _in_own_session(lambda db: rebuild_search_index(db, commit=True))
+
+
+@migration(5, "create the daily stats rollups")
+def _create_stats_rollups(conn):
+    for model in (StatsParcelleJour, StatsBienJour, StatsMenageJour):
+        model.__table__.create(bind=conn, checkfirst=True)
+
+
+@migration(6, "create personne_role")
+def _create_personne_role(conn):
+    PersonneRole.__table__.create(bind=conn, checkfirst=True)
+
+
+@migration(7, "fill the daily stats rollups", deferred=True)
+def _fill_stats_rollups(conn):
+    rebuild_rollups_in_batches()
+
+
+@migration(8, "fill personne_role", deferred=True)
+def _fill_personne_role(conn):
+    _in_own_session(lambda db: rebuild_personne_roles(db, commit=True))
+
+
+@migration(9, "backfill parcelle_location", deferred=True)
+def _backfill_parcelle_location(conn):
+    backfill_parcelle_locations()
+
+
+def applied_versions(engine) -> set:
+    with engine.connect() as conn:
+        return set(conn.execute(select(SchemaMigration.version)).scalars())
+
+
+def pending_migrations(engine, deferred: bool = True) -> list:
+    """(version, name) of the migrations not applied yet, the deferred ones included unless deferred=False."""
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    done = applied_versions(engine)
+    return [
+        (version, name)
+        for version, name, _, is_deferred in sorted(MIGRATIONS, key=lambda item: item[0])
+        if version not in done and (deferred or not is_deferred)
+    ]
+
+
+def run_migrations(engine, target: int = None, deferred: bool = True) -> list:
+    """Apply the pending migrations up to `target` (all by default), skipping the
+    deferred ones when deferred=False (at startup); returns the versions applied."""
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    done = applied_versions(engine)
+
+    applied = []
+    for version, name, func, is_deferred in sorted(MIGRATIONS, key=lambda item: item[0]):
+        if version in done or (target is not None and version > target) or (is_deferred and not deferred):
+            continue
+        start = time.perf_counter()
+        with engine.begin() as conn:
+            func(conn)
+            conn.execute(insert(SchemaMigration).values(version=version, name=name, applied_at=datetime.now()))
+        logger.info(f"migrations: {version} '{name}' applied in {time.perf_counter() - start:.1f}s")
+        applied.append(version)
+    if applied:
+        # Readers of the tables just filled switch to them
+        derived_tables.clear()
+    return applied
@@ -1,10 +1,13 @@
 # app/models.py
-from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, BigInteger, Date, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, BigInteger, Date, DateTime, Boolean, Index
 from sqlalchemy.sql import text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql.sqltypes import NVARCHAR, NCHAR
 from app.database import Base
 
+# Indexes declared in __table_args__ are created by the versioned migrations of
+# app/migrations.py (the tables themselves predate this API and are not managed here)
+
 # Table: access
 class UtilisateurDroit(Base):
     __tablename__ = "utilisateur_droit"
@@ -15,6 +18,9 @@ class UtilisateurDroit(Base):
 # Table: adresse
 class Adresse(Base):
     __tablename__ = "adresse"
+    __table_args__ = (
+        Index("ix_adresse_fk_avenue", "fk_avenue"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     fk_avenue = Column(Integer, ForeignKey("avenue.id"), nullable=True)
     numero = Column(NVARCHAR(50), nullable=True)
@@ -28,6 +34,9 @@ class Adresse(Base):
 # Table: avenue
 class Avenue(Base):
     __tablename__ = "avenue"
+    __table_args__ = (
+        Index("ix_avenue_fk_quartier", "fk_quartier", mssql_include=["intitule"]),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     intitule = Column(String(50), nullable=True)
     lon = Column(Float(precision=18), nullable=True)
@@ -41,6 +50,12 @@ class Avenue(Base):
 # Table: bien
 class Bien(Base):
     __tablename__ = "bien"
+    __table_args__ = (
+        Index("ix_bien_fk_parcelle", "fk_parcelle", mssql_include=["fk_nature_bien", "fk_usage", "fk_usage_specifique", "date_create"]),
+        Index("ix_bien_date_create", "date_create", mssql_include=["fk_parcelle", "fk_nature_bien", "fk_agent"]),
+        Index("ix_bien_fk_agent_date_create", "fk_agent", "date_create"),
+        Index("ix_bien_fk_proprietaire", "fk_proprietaire"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     numero_bien = Column(String(100), nullable=True)  # varchar(max)
     coordinates = Column(String, nullable=True)  # varchar(max)
@@ -73,6 +88,9 @@ class Bien(Base):
 # Table: commune
 class Commune(Base):
     __tablename__ = "commune"
+    __table_args__ = (
+        Index("ix_commune_fk_ville", "fk_ville", mssql_include=["intitule"]),
+    )
     id = Column(Integer, primary_key=True, index=True)
     intitule = Column(String(50), nullable=False)
     lon = Column(Float(precision=18), nullable=True)
@@ -130,6 +148,10 @@ class GroupeDroit(Base):
 # Table: location_bien
 class LocationBien(Base):
     __tablename__ = "location_bien"
+    __table_args__ = (
+        Index("ix_location_bien_fk_bien", "fk_bien", mssql_include=["fk_personne"]),
+        Index("ix_location_bien_fk_personne", "fk_personne"),
+    )
     id = Column(BigInteger, primary_key=True, index=True)
     fk_personne = Column(BigInteger, ForeignKey("personne.id"), nullable=True)
     fk_bien = Column(Integer, ForeignKey("bien.id"), nullable=True)
@@ -161,6 +183,11 @@ class LogsArchive(Base):
 # Table: membre_menage
 class MembreMenage(Base):
     __tablename__ = "membre_menage"
+    __table_args__ = (
+        Index("ix_membre_menage_fk_menage", "fk_menage", mssql_include=["fk_personne", "fk_filiation"]),
+        Index("ix_membre_menage_fk_personne", "fk_personne"),
+        Index("ix_membre_menage_fk_agent_date_create", "fk_agent", "date_create"),
+    )
     id = Column(BigInteger, primary_key=True, index=True)
     fk_menage = Column(BigInteger, ForeignKey("menage.id"), nullable=True)
     fk_personne = Column(BigInteger, ForeignKey("personne.id"), nullable=True)
@@ -175,6 +202,11 @@ class MembreMenage(Base):
 # Table: menage
 class Menage(Base):
     __tablename__ = "menage"
+    __table_args__ = (
+        Index("ix_menage_fk_bien", "fk_bien", mssql_include=["fk_personne"]),
+        Index("ix_menage_fk_personne", "fk_personne"),
+        Index("ix_menage_fk_agent_date_create", "fk_agent", "date_create"),
+    )
     id = Column(BigInteger, primary_key=True, index=True)
     fk_personne = Column(BigInteger, ForeignKey("personne.id"), nullable=True)
     fk_bien = Column(Integer, ForeignKey("bien.id"), nullable=True)
@@ -210,6 +242,12 @@ class NatureBien(Base):
 # Table: parcelle
 class Parcelle(Base):
     __tablename__ = "parcelle"
+    __table_args__ = (
+        Index("ix_parcelle_fk_adresse", "fk_adresse"),
+        Index("ix_parcelle_date_create", "date_create", mssql_include=["fk_adresse", "fk_rang", "fk_proprietaire", "statut"]),
+        Index("ix_parcelle_fk_agent_date_create", "fk_agent", "date_create"),
+        Index("ix_parcelle_fk_proprietaire", "fk_proprietaire"),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     numero_parcellaire = Column(String(50), nullable=True)
     fk_unite = Column(Integer, ForeignKey("unite.id"), nullable=True)
@@ -234,6 +272,19 @@ class Parcelle(Base):
     proprietaire = relationship("Personne", back_populates="parcelles")
     biens = relationship("Bien", back_populates="parcelle")
 
+# Table: parcelle_location
+# Denormalized adresse > avenue > quartier > commune > ville > province chain of
+# each parcelle, kept in sync by app/locations.py
+class ParcelleLocation(Base):
+    __tablename__ = "parcelle_location"
+    parcelle_id = Column(Integer, ForeignKey("parcelle.id", ondelete="CASCADE"), primary_key=True)
+    fk_adresse = Column(Integer, nullable=True)
+    fk_avenue = Column(Integer, nullable=True, index=True)
+    fk_quartier = Column(Integer, nullable=True, index=True)
+    fk_commune = Column(Integer, nullable=True, index=True)
+    fk_ville = Column(Integer, nullable=True, index=True)
+    fk_province = Column(Integer, nullable=True, index=True)
+
 # Table: personne
 class Personne(Base):
     __tablename__ = "personne"
@@ -300,6 +351,9 @@ class Province(Base):
 # Table: quartier
 class Quartier(Base):
     __tablename__ = "quartier"
+    __table_args__ = (
+        Index("ix_quartier_fk_commune", "fk_commune", mssql_include=["intitule"]),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     intitule = Column(String(50), nullable=True)
     lon = Column(Float(precision=18), nullable=True)
@@ -387,6 +441,9 @@ class Utilisateur(Base):
 # Table: ville
 class Ville(Base):
     __tablename__ = "ville"
+    __table_args__ = (
+        Index("ix_ville_fk_province", "fk_province", mssql_include=["intitule"]),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     intitule = Column(String(50), nullable=True)
     lon = Column(Float(precision=18), nullable=True)
@@ -442,3 +499,85 @@ class RapportRecensement(Base):
 
 
 
+
+# Table: schema_migrations
+# Versions of app/migrations.py applied to this database
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    name = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, nullable=False)
+
+# Table: search_ngram
+# Trigram inverted index of the person, agent and rang labels (app/search.py)
+class SearchNgram(Base):
+    __tablename__ = "search_ngram"
+    __table_args__ = (
+        Index("ix_search_ngram_entity_id", "entity", "entity_id"),
+    )
+    entity = Column(String(20), primary_key=True)
+    gram = Column(NVARCHAR(3), primary_key=True)
+    entity_id = Column(BigInteger, primary_key=True, autoincrement=False)
+
+# Table: stats_parcelle_jour
+# Daily parcelle counts per agent, avenue, rang and statut (app/rollups.py)
+class StatsParcelleJour(Base):
+    __tablename__ = "stats_parcelle_jour"
+    __table_args__ = (
+        Index("ix_stats_parcelle_jour_jour", "jour", "fk_agent"),
+        Index("ix_stats_parcelle_jour_fk_agent", "fk_agent", "jour"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    jour = Column(Date, nullable=True)
+    fk_agent = Column(Integer, nullable=True)
+    fk_avenue = Column(Integer, nullable=True)
+    fk_rang = Column(Integer, nullable=True)
+    statut = Column(Integer, nullable=True)
+    nb_parcelles = Column(Integer, nullable=False)
+
+# Table: stats_bien_jour
+# Daily bien counts per agent, avenue and rang of the parcelle, nature and usages (app/rollups.py)
+class StatsBienJour(Base):
+    __tablename__ = "stats_bien_jour"
+    __table_args__ = (
+        Index("ix_stats_bien_jour_jour", "jour", "fk_agent"),
+        Index("ix_stats_bien_jour_fk_agent", "fk_agent", "jour"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    jour = Column(Date, nullable=True)
+    fk_agent = Column(Integer, nullable=True)
+    fk_avenue = Column(Integer, nullable=True)
+    fk_rang = Column(Integer, nullable=True)
+    fk_nature_bien = Column(Integer, nullable=True)
+    fk_usage = Column(Integer, nullable=True)
+    fk_usage_specifique = Column(Integer, nullable=True)
+    nb_biens = Column(Integer, nullable=False)
+
+# Table: stats_menage_jour
+# Daily menage and membre_menage counts per agent (app/rollups.py)
+class StatsMenageJour(Base):
+    __tablename__ = "stats_menage_jour"
+    __table_args__ = (
+        Index("ix_stats_menage_jour_jour", "jour", "fk_agent"),
+        Index("ix_stats_menage_jour_fk_agent", "fk_agent", "jour"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    jour = Column(Date, nullable=True)
+    fk_agent = Column(Integer, nullable=True)
+    nb_menages = Column(Integer, nullable=False)
+    nb_membres_menage = Column(Integer, nullable=False)
+
+# Table: personne_role
+# Persons attached to each parcelle and bien, by role (app/roles.py)
+class PersonneRole(Base):
+    __tablename__ = "personne_role"
+    __table_args__ = (
+        Index("ix_personne_role_parcelle", "parcelle_id", "role", mssql_include=["personne_id"]),
+        Index("ix_personne_role_personne", "personne_id", "role"),
+        Index("ix_personne_role_bien", "bien_id"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    personne_id = Column(BigInteger, nullable=False)
+    parcelle_id = Column(Integer, nullable=True)
+    bien_id = Column(Integer, nullable=True)
+    role = Column(Integer, nullable=False)
@@ -0,0 +1,62 @@
+# app/renderers.py
+import json
+import dataclasses
+
+from datetime import date, datetime
+from decimal import Decimal
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements.txt
+    orjson = None
+
+#
+#
+# FAST JSON RENDERER
+# HEAVY ENDPOINTS RETURN A RENDERED RESPONSE, SKIPPING jsonable_encoder
+#
+#
+
+
+# Helper function for the values the encoders do not handle natively
+def _default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if dataclasses.is_dataclass(value):
+        return dataclasses.asdict(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content) -> bytes:
+    """Serialize dicts, lists and the typed structs of app/structs.py to JSON bytes."""
+    if orjson is not None:
+        # Dataclasses and datetimes are serialized natively by orjson
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(
+        content,
+        default=_default,
+        ensure_ascii=False,
+        allow_nan=False,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+def render_json(content, status_code: int = 200, headers: dict = None) -> FastJSONResponse:
+    """
+    Return an already rendered response: FastAPI hands Response objects through
+    as-is, so the generic jsonable_encoder walk over the payload is skipped.
+    """
+    return FastJSONResponse(content, status_code=status_code, headers=headers)
@@ -0,0 +1,219 @@
+# app/roles.py
+import logging
+import os
+
+from itertools import chain
+
+from sqlalchemy import event, inspect
+from sqlalchemy.sql import text, bindparam
+
+from app.database import SessionLocal
+from app.derived import derived_tables
+from app.models import Parcelle, Bien, Menage, MembreMenage, LocationBien
+
+logger = logging.getLogger(__name__)
+
+#
+#
+# PERSON-ROLE INDEX
+# ONE ROW PER PERSON ATTACHED TO A PARCELLE OR A BIEN, WITH ITS ROLE
+#
+#
+# The population statistics ask which persons belong to which parcelles and
+# in which role: owner of the parcelle (1), head of a ménage of one of its
+# biens (2), member of such a ménage (3) or tenant of one of its biens (4).
+# personne_role holds the answer: a population is one indexed join on
+# parcelle_id instead of a four-way UNION over parcelle, menage,
+# membre_menage and location_bien.
+#
+# Owner rows belong to their parcelle (bien_id NULL), the other rows to their
+# bien, whose parcelle they carry. The session hooks below rewrite the rows of
+# the parcelles and biens a transaction touches, before it commits; writes
+# made with raw SQL bypass them, rebuild_personne_roles() rewrites everything.
+# Until migration 8 has filled it, readers get the same rows from the sources
+# (see app/derived.py).
+
+PERSONNE_ROLE_BATCH_SIZE = int(os.getenv("PERSONNE_ROLE_BATCH_SIZE", 5000))
+ID_BATCH_SIZE = 1000  # SQL Server accepts at most 2100 parameters per statement
+
+ROLE_PROPRIETAIRE = 1
+ROLE_RESPONSABLE_MENAGE = 2
+ROLE_MEMBRE_MENAGE = 3
+ROLE_LOCATAIRE = 4
+
+ROLE_COLUMNS = "personne_id, parcelle_id, bien_id, role"
+
+OWNER_ROLES = f"""
+    SELECT p.fk_proprietaire AS personne_id, p.id AS parcelle_id, NULL AS bien_id, {ROLE_PROPRIETAIRE} AS role
+    FROM parcelle p
+    WHERE p.fk_proprietaire IS NOT NULL AND {{where}}
+"""
+
+# One branch per source, each reading its own fk_bien index; {where} is on b.id
+BIEN_ROLES = f"""
+    SELECT m.fk_personne AS personne_id, b.fk_parcelle AS parcelle_id, b.id AS bien_id, {ROLE_RESPONSABLE_MENAGE} AS role
+    FROM bien b
+    JOIN menage m ON m.fk_bien = b.id
+    WHERE m.fk_personne IS NOT NULL AND {{where}}
+    UNION ALL
+    SELECT mm.fk_personne, b.fk_parcelle, b.id, {ROLE_MEMBRE_MENAGE}
+    FROM bien b
+    JOIN menage m ON m.fk_bien = b.id
+    JOIN membre_menage mm ON mm.fk_menage = m.id
+    WHERE mm.fk_personne IS NOT NULL AND {{where}}
+    UNION ALL
+    SELECT lb.fk_personne, b.fk_parcelle, b.id, {ROLE_LOCATAIRE}
+    FROM bien b
+    JOIN location_bien lb ON lb.fk_bien = b.id
+    WHERE lb.fk_personne IS NOT NULL AND {{where}}
+"""
+
+INSERT_OWNER_ROLES = f"INSERT INTO personne_role ({ROLE_COLUMNS})" + OWNER_ROLES
+INSERT_BIEN_ROLES = f"INSERT INTO personne_role ({ROLE_COLUMNS})" + BIEN_ROLES
+
+# Every role from the sources, read until migration 8 has filled personne_role (app/derived.py)
+derived_tables.register("personne_role", OWNER_ROLES.format(where="1=1") + " UNION ALL " + BIEN_ROLES.format(where="1=1"))
+
+# Model -> (what its roles belong to, column holding that id, columns whose change moves its roles)
+ROLE_SOURCES = {
+    Parcelle: ("parcelle", "id", ("fk_proprietaire",)),
+    Bien: ("bien", "id", ("fk_parcelle",)),
+    Menage: ("bien", "fk_bien", ("fk_bien", "fk_personne")),
+    LocationBien: ("bien", "fk_bien", ("fk_bien", "fk_personne")),
+    MembreMenage: ("menage", "fk_menage", ("fk_menage", "fk_personne")),
+}
+
+
+# Helper function to run an expanding IN statement over ids, batch_size at a time
+def _in_batches(db, statement: str, ids, batch_size: int = ID_BATCH_SIZE, fetch: bool = False):
+    query = text(statement).bindparams(bindparam("ids", expanding=True))
+    ids = sorted(ids)
+    rows = []
+    for start in range(0, len(ids), batch_size):
+        result = db.execute(query, {"ids": ids[start:start + batch_size]})
+        if fetch:
+            rows.extend(row[0] for row in result)
+    return rows
+
+
+def refresh_owner_roles(db, parcelle_ids) -> int:
+    """Rewrite the owner rows of the given parcelles."""
+    parcelle_ids = set(parcelle_ids)
+    if not parcelle_ids:
+        return 0
+    _in_batches(db, f"DELETE FROM personne_role WHERE role = {ROLE_PROPRIETAIRE} AND parcelle_id IN :ids", parcelle_ids)
+    _in_batches(db, INSERT_OWNER_ROLES.format(where="p.id IN :ids"), parcelle_ids)
+    return len(parcelle_ids)
+
+
+def refresh_bien_roles(db, bien_ids) -> int:
+    """Rewrite the ménage head, member and tenant rows of the given biens."""
+    bien_ids = set(bien_ids)
+    if not bien_ids:
+        return 0
+    _in_batches(db, "DELETE FROM personne_role WHERE bien_id IN :ids", bien_ids)
+    # The id list appears in each of the three branches
+    _in_batches(db, INSERT_BIEN_ROLES.format(where="b.id IN :ids"), bien_ids, batch_size=ID_BATCH_SIZE // 3)
+    return len(bien_ids)
+
+
+#
+#
+# SESSION HOOKS: ROLES OF THE PARCELLES AND BIENS WRITTEN IN A TRANSACTION
+# ARE REWRITTEN BEFORE IT COMMITS
+#
+#
+
+# Helper function to read the current and previous values of a column (a bien moved away keeps roles to drop)
+def _values(obj, column: str) -> set:
+    values = {getattr(obj, column), *inspect(obj).attrs[column].history.deleted}
+    values.discard(None)
+    return values
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_role_sources(session, flush_context):
+    pending = session.info.setdefault("personne_role_refresh", {})
+    for obj in chain(session.new, session.deleted):
+        source = ROLE_SOURCES.get(type(obj))
+        if source:
+            pending.setdefault(source[0], set()).update(_values(obj, source[1]))
+    for obj in session.dirty:
+        source = ROLE_SOURCES.get(type(obj))
+        if not source:
+            continue
+        attrs = inspect(obj).attrs
+        if any(attrs[column].history.has_changes() for column in source[2]):
+            pending.setdefault(source[0], set()).update(_values(obj, source[1]))
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _refresh_role_sources(session):
+    # Flush first: the commit's own flush would run after this hook
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    pending = session.info.pop("personne_role_refresh", None)
+    if not pending:
+        return
+    bien_ids = pending.get("bien", set())
+    if pending.get("menage"):
+        bien_ids |= set(_in_batches(session, "SELECT fk_bien FROM menage WHERE fk_bien IS NOT NULL AND id IN :ids", pending["menage"], fetch=True))
+    refresh_owner_roles(session, pending.get("parcelle", ()))
+    refresh_bien_roles(session, bien_ids)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_role_sources(session):
+    session.info.pop("personne_role_refresh", None)
+
+
+#
+#
+# FULL REBUILD
+# BATCHED ON PARCELLE THEN BIEN ID RANGES
+#
+#
+
+# Helper function to iterate [low, high) id ranges of batch_size ids of a table
+def _id_ranges(db, table: str, batch_size: int):
+    low, high = db.execute(text(f"SELECT MIN(id), MAX(id) FROM {table}")).fetchone()
+    if low is None:
+        return
+    for start in range(low, high + 1, batch_size):
+        yield start, start + batch_size
+
+
+def rebuild_personne_roles(db, batch_size: int = PERSONNE_ROLE_BATCH_SIZE, commit: bool = False) -> int:
+    """Rewrite personne_role from its sources, batch_size parcelles then biens at a time;
+    returns the rows written. With commit=True (db a session) each batch commits on its own."""
+    batches = (
+        (
+            "parcelle",
+            f"DELETE FROM personne_role WHERE role = {ROLE_PROPRIETAIRE} AND parcelle_id >= :low AND parcelle_id < :high",
+            INSERT_OWNER_ROLES.format(where="p.id >= :low AND p.id < :high"),
+        ),
+        (
+            "bien",
+            "DELETE FROM personne_role WHERE bien_id >= :low AND bien_id < :high",
+            INSERT_BIEN_ROLES.format(where="b.id >= :low AND b.id < :high"),
+        ),
+    )
+    written = 0
+    for table, delete, insert in batches:
+        for low, high in list(_id_ranges(db, table, batch_size)):
+            bounds = {"low": low, "high": high}
+            db.execute(text(delete), bounds)
+            written += db.execute(text(insert), bounds).rowcount or 0
+            if commit:
+                db.commit()
+
+    # Rows of parcelles and biens deleted since, outside the ranges above
+    db.execute(text(f"""
+        DELETE FROM personne_role
+        WHERE (role = {ROLE_PROPRIETAIRE} AND NOT EXISTS (SELECT 1 FROM parcelle p WHERE p.id = personne_role.parcelle_id))
+        OR (role <> {ROLE_PROPRIETAIRE} AND NOT EXISTS (SELECT 1 FROM bien b WHERE b.id = personne_role.bien_id))
+    """))
+    if commit:
+        db.commit()
+    logger.info(f"personne_role: {written} rows written")
+    return written
@@ -0,0 +1,327 @@
+# app/rollups.py
+import logging
+import os
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, inspect
+from sqlalchemy.sql import text, bindparam
+
+from app.database import SessionLocal
+from app.derived import derived_tables
+from app.filters import to_datetime
+from app.models import Adresse, Bien, Menage, MembreMenage, Parcelle
+
+logger = logging.getLogger(__name__)
+
+#
+#
+# DAILY STATS ROLLUPS
+# COUNTS PER DAY x AGENT x AVENUE x RANG x NATURE x STATUT
+#
+#
+# The dashboards and the agent activity reports read these tables instead of
+# aggregating parcelle, bien, menage and membre_menage on every call:
+#
+#   stats_parcelle_jour: parcelles per (jour, agent, avenue, rang, statut)
+#   stats_bien_jour:     biens per (jour, agent, avenue and rang of their
+#                        parcelle, nature, usage, usage_specifique)
+#   stats_menage_jour:   menages and membres per (jour, agent)
+#
+# jour is the day of each row's own date_create. The avenue is the finest
+# location level the dashboards break down by; quartier and commune are read
+# through it (STATS_JOINS in app/filters.py), so moving an avenue to another
+# quartier needs no rollup update.
+#
+# A rollup is refreshed one slice at a time: all its rows of one (jour, agent)
+# are deleted and recounted from the source rows of that agent on that day,
+# an indexed range on (fk_agent, date_create). The session hooks below refresh
+# the slices a transaction touched before it commits, so an ingested form is
+# counted in the same transaction that inserts it. rebuild_rollups() recounts
+# whole days, for rows written with raw SQL. Until migration 7 has filled them,
+# readers count the same cells from the sources (see app/derived.py).
+
+ROLLUP_BATCH_DAYS = int(os.getenv("ROLLUP_BATCH_DAYS", 31))
+ID_BATCH_SIZE = 1000  # SQL Server accepts at most 2100 parameters per statement
+ALL_AGENTS = object()  # Slice agent of a whole-day refresh
+
+# Rollup -> (table, INSERT ... SELECT of a slice, source aliases filtered by the slice)
+ROLLUPS = {
+    "parcelle": ("stats_parcelle_jour", """
+        INSERT INTO stats_parcelle_jour (jour, fk_agent, fk_avenue, fk_rang, statut, nb_parcelles)
+        SELECT :jour, p.fk_agent, a.fk_avenue, p.fk_rang, p.statut, COUNT(*)
+        FROM parcelle p
+        LEFT JOIN adresse a ON p.fk_adresse = a.id
+        WHERE {p}
+        GROUP BY p.fk_agent, a.fk_avenue, p.fk_rang, p.statut
+    """, ("p",)),
+    "bien": ("stats_bien_jour", """
+        INSERT INTO stats_bien_jour (jour, fk_agent, fk_avenue, fk_rang, fk_nature_bien, fk_usage, fk_usage_specifique, nb_biens)
+        SELECT :jour, b.fk_agent, a.fk_avenue, p.fk_rang, b.fk_nature_bien, b.fk_usage, b.fk_usage_specifique, COUNT(*)
+        FROM bien b
+        LEFT JOIN parcelle p ON b.fk_parcelle = p.id
+        LEFT JOIN adresse a ON p.fk_adresse = a.id
+        WHERE {b}
+        GROUP BY b.fk_agent, a.fk_avenue, p.fk_rang, b.fk_nature_bien, b.fk_usage, b.fk_usage_specifique
+    """, ("b",)),
+    "menage": ("stats_menage_jour", """
+        INSERT INTO stats_menage_jour (jour, fk_agent, nb_menages, nb_membres_menage)
+        SELECT :jour, fk_agent, SUM(nb_menages), SUM(nb_membres_menage)
+        FROM (
+            SELECT m.fk_agent, 1 AS nb_menages, 0 AS nb_membres_menage FROM menage m WHERE {m}
+            UNION ALL
+            SELECT mm.fk_agent, 0, 1 FROM membre_menage mm WHERE {mm}
+        ) AS counted
+        GROUP BY fk_agent
+    """, ("m", "mm")),
+}
+
+# Rollup rows counted over every day at once, read until migration 7 has filled the rollups (app/derived.py)
+ROLLUP_STAND_INS = {
+    "stats_parcelle_jour": """
+        SELECT CAST(p.date_create AS DATE) AS jour, p.fk_agent, a.fk_avenue, p.fk_rang, p.statut, COUNT(*) AS nb_parcelles
+        FROM parcelle p
+        LEFT JOIN adresse a ON p.fk_adresse = a.id
+        GROUP BY CAST(p.date_create AS DATE), p.fk_agent, a.fk_avenue, p.fk_rang, p.statut
+    """,
+    "stats_bien_jour": """
+        SELECT CAST(b.date_create AS DATE) AS jour, b.fk_agent, a.fk_avenue, p.fk_rang,
+            b.fk_nature_bien, b.fk_usage, b.fk_usage_specifique, COUNT(*) AS nb_biens
+        FROM bien b
+        LEFT JOIN parcelle p ON b.fk_parcelle = p.id
+        LEFT JOIN adresse a ON p.fk_adresse = a.id
+        GROUP BY CAST(b.date_create AS DATE), b.fk_agent, a.fk_avenue, p.fk_rang, b.fk_nature_bien, b.fk_usage, b.fk_usage_specifique
+    """,
+    "stats_menage_jour": """
+        SELECT jour, fk_agent, SUM(nb_menages) AS nb_menages, SUM(nb_membres_menage) AS nb_membres_menage
+        FROM (
+            SELECT CAST(m.date_create AS DATE) AS jour, m.fk_agent, 1 AS nb_menages, 0 AS nb_membres_menage FROM menage m
+            UNION ALL
+            SELECT CAST(mm.date_create AS DATE), mm.fk_agent, 0, 1 FROM membre_menage mm
+        ) AS counted
+        GROUP BY jour, fk_agent
+    """,
+}
+for table, stand_in in ROLLUP_STAND_INS.items():
+    derived_tables.register(table, stand_in)
+
+# Source table -> (rollup it feeds, columns whose change moves a row to another cell)
+SOURCES = {
+    Parcelle: ("parcelle", "parcelle", ("date_create", "fk_agent", "fk_adresse", "fk_rang", "statut")),
+    Bien: ("bien", "bien", ("date_create", "fk_agent", "fk_parcelle", "fk_nature_bien", "fk_usage", "fk_usage_specifique")),
+    Menage: ("menage", "menage", ("date_create", "fk_agent")),
+    MembreMenage: ("membre_menage", "menage", ("date_create", "fk_agent")),
+}
+
+
+# Helper function to reduce a date_create (datetime, date or string) to its day
+def _day(value):
+    value = to_datetime(value)
+    return value.date() if value else None
+
+
+# Helper function to build the agent predicate of a slice (no predicate for ALL_AGENTS)
+def _agent_clauses(column: str, agent) -> list:
+    if agent is ALL_AGENTS:
+        return []
+    return [f"{column} IS NULL" if agent is None else f"{column} = :agent"]
+
+
+# Helper function to build the predicate of a slice on the source alias x
+def _source_clause(alias: str, jour, agent) -> str:
+    day = f"{alias}.date_create IS NULL" if jour is None else f"{alias}.date_create >= :day_start AND {alias}.date_create < :day_end"
+    return " AND ".join([day] + _agent_clauses(f"{alias}.fk_agent", agent))
+
+
+def refresh_rollup_slice(db, rollup: str, jour, agent=ALL_AGENTS) -> None:
+    """Recount the rows of one rollup for one day (None: undated rows) and one agent."""
+    table, insert, aliases = ROLLUPS[rollup]
+    params = {"jour": jour, "agent": None if agent is ALL_AGENTS else agent}
+    if jour is not None:
+        params["day_start"] = datetime(jour.year, jour.month, jour.day)
+        params["day_end"] = params["day_start"] + timedelta(days=1)
+    delete_where = " AND ".join(["jour IS NULL" if jour is None else "jour = :jour"] + _agent_clauses("fk_agent", agent))
+    db.execute(text(f"DELETE FROM {table} WHERE {delete_where}"), params)
+    db.execute(text(insert.format(**{alias: _source_clause(alias, jour, agent) for alias in aliases})), params)
+
+
+# Helper function to run `SELECT ... WHERE x IN :ids` ID_BATCH_SIZE ids at a time
+def _rows_in_batches(db, statement: str, ids) -> list:
+    query = text(statement).bindparams(bindparam("ids", expanding=True))
+    ids = sorted(ids)
+    rows = []
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        rows.extend(db.execute(query, {"ids": ids[start:start + ID_BATCH_SIZE]}).fetchall())
+    return rows
+
+
+# Helper function to read the ids selected by an IN :ids statement
+def _ids_of(db, statement: str, ids) -> set:
+    return {row[0] for row in _rows_in_batches(db, statement, ids)}
+
+
+# Helper function to read the (jour, agent) slices of source rows
+def _slices_of(db, table: str, column: str, ids) -> set:
+    rows = _rows_in_batches(db, f"SELECT DISTINCT date_create, fk_agent FROM {table} WHERE {column} IN :ids", ids)
+    return {(_day(row[0]), row[1]) for row in rows}
+
+
+#
+#
+# REBUILD
+# WHOLE DAYS RECOUNTED, FOR ROWS WRITTEN WITHOUT THE SESSION HOOKS
+#
+#
+
+def census_days(db) -> tuple:
+    """First and last day with a parcelle, bien, menage or membre_menage (None, None when empty)."""
+    low, high = db.execute(text("""
+        SELECT MIN(day_min), MAX(day_max) FROM (
+            SELECT MIN(date_create) AS day_min, MAX(date_create) AS day_max FROM parcelle
+            UNION ALL SELECT MIN(date_create), MAX(date_create) FROM bien
+            UNION ALL SELECT MIN(date_create), MAX(date_create) FROM menage
+            UNION ALL SELECT MIN(date_create), MAX(date_create) FROM membre_menage
+        ) AS bounds
+    """)).fetchone()
+    return _day(low), _day(high)
+
+
+# Helper function to recount the undated rows and drop the rollup rows outside the census days
+def _recount_outside(db, first, last, rollups) -> None:
+    for rollup in rollups:
+        refresh_rollup_slice(db, rollup, None)
+        table = ROLLUPS[rollup][0]
+        if first is None:
+            db.execute(text(f"DELETE FROM {table} WHERE jour IS NOT NULL"))
+        else:
+            db.execute(text(f"DELETE FROM {table} WHERE jour < :first OR jour > :last"), {"first": first, "last": last})
+
+
+def rebuild_rollups(db, date_start=None, date_end=None, rollups=None) -> int:
+    """Recount every day from date_start to date_end (YYYY-MM-DD or dates, the
+    whole census by default) of `rollups` (all by default); returns the number
+    of days recounted. A whole-census rebuild also recounts the undated rows and
+    drops the rollup rows of days left without any source row."""
+    rollups = rollups or tuple(ROLLUPS)
+    first, last = census_days(db)
+    full = date_start is None and date_end is None
+    if date_start is not None:
+        first = _day(date_start)
+    if date_end is not None:
+        last = _day(date_end)
+
+    days = 0
+    day = first
+    while day is not None and last is not None and day <= last:
+        for rollup in rollups:
+            refresh_rollup_slice(db, rollup, day)
+        day += timedelta(days=1)
+        days += 1
+
+    if full:
+        _recount_outside(db, first, last, rollups)
+    return days
+
+
+def rebuild_rollups_in_batches(batch_days: int = ROLLUP_BATCH_DAYS) -> int:
+    """Whole-census rebuild_rollups(), in one short transaction per batch_days days."""
+    db = SessionLocal()
+    try:
+        first, last = census_days(db)
+        days = 0
+        day = first
+        while day is not None and day <= last:
+            end = min(day + timedelta(days=batch_days - 1), last)
+            days += rebuild_rollups(db, day, end)
+            db.commit()
+            day = end + timedelta(days=1)
+        _recount_outside(db, first, last, tuple(ROLLUPS))
+        db.commit()
+    finally:
+        db.close()
+    logger.info(f"stats rollups: {days} days rebuilt")
+    return days
+
+
+#
+#
+# SESSION HOOKS: SLICES WHOSE SOURCE ROWS WERE INSERTED, MOVED OR DELETED IN
+# A TRANSACTION ARE RECOUNTED BEFORE IT COMMITS
+#
+#
+# The slices of the rows as they are now are read back by id before the
+# commit; the slices they left (previous day or agent, deleted rows) come from
+# the attribute history. GeoJSON corrections only write coordinates and areas,
+# which no rollup counts: they refresh nothing.
+
+# Helper function to read the (jour, agent) a row had when it was loaded, None when unknown
+def _loaded_slice(obj):
+    attrs = inspect(obj).attrs
+    values = []
+    for column in ("date_create", "fk_agent"):
+        history = attrs[column].history
+        loaded = history.deleted or history.unchanged
+        if not loaded:
+            return None
+        values.append(loaded[0])
+    return _day(values[0]), values[1]
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_rollup_slices(session, flush_context):
+    pending = session.info.setdefault("stats_rollup_refresh", {"ids": {}, "slices": set()})
+    for obj in session.new:
+        source = SOURCES.get(type(obj))
+        if source:
+            pending["ids"].setdefault(source[0], set()).add(obj.id)
+    for obj in session.deleted:
+        source = SOURCES.get(type(obj))
+        loaded = source and _loaded_slice(obj)
+        if loaded:
+            pending["slices"].add((source[1], *loaded))
+    for obj in session.dirty:
+        if isinstance(obj, Adresse):
+            if inspect(obj).attrs["fk_avenue"].history.has_changes():
+                pending["ids"].setdefault("adresse", set()).add(obj.id)
+            continue
+        source = SOURCES.get(type(obj))
+        if not source:
+            continue
+        attrs = inspect(obj).attrs
+        if any(attrs[column].history.has_changes() for column in source[2]):
+            pending["ids"].setdefault(source[0], set()).add(obj.id)
+            loaded = _loaded_slice(obj)
+            if loaded:
+                pending["slices"].add((source[1], *loaded))
+            if isinstance(obj, Parcelle):
+                # Its biens carry its avenue and rang
+                pending["ids"].setdefault("parcelle_biens", set()).add(obj.id)
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _refresh_rollup_slices(session):
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    pending = session.info.pop("stats_rollup_refresh", None)
+    if not pending:
+        return
+    ids = pending["ids"]
+    slices = set(pending["slices"])
+    if "adresse" in ids:
+        # Parcelles of an adresse moved to another avenue, and their biens
+        moved = _ids_of(session, "SELECT id FROM parcelle WHERE fk_adresse IN :ids", ids["adresse"])
+        ids.setdefault("parcelle", set()).update(moved)
+        ids.setdefault("parcelle_biens", set()).update(moved)
+    for table, rollup in (("parcelle", "parcelle"), ("bien", "bien"), ("menage", "menage"), ("membre_menage", "menage")):
+        if table in ids:
+            slices.update((rollup, *found) for found in _slices_of(session, table, "id", ids[table]))
+    if "parcelle_biens" in ids:
+        slices.update(("bien", *found) for found in _slices_of(session, "bien", "fk_parcelle", ids["parcelle_biens"]))
+    # Always in the same order, so concurrent commits lock the rollup rows alike
+    for rollup, jour, agent in sorted(slices, key=repr):
+        refresh_rollup_slice(session, rollup, jour, agent)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_rollup_slices(session):
+    session.info.pop("stats_rollup_refresh", None)
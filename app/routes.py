@@ -1,17 +1,18 @@
 import zipfile
 from io import BytesIO
+import os
 import json
 import json5
 import requests
 import logging
 from collections import defaultdict
 
-from datetime import timedelta, datetime
+from datetime import timedelta, datetime, date
 from typing import Optional, List
 from sqlalchemy import Date
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.sql import text, func, cast, and_, or_  # Add Date and or_ here
+from sqlalchemy.sql import text, func, cast, and_, or_, bindparam  # Add Date and or_ here
 from fastapi import (
     APIRouter,
     Depends,
@@ -59,7 +60,6 @@ from app.schemas import (
     UpdatePassword)
 from app.database import get_db
 from app.models import (
-    Adresse,
     Bien,
     Parcelle,
     Equipe,
@@ -73,7 +73,6 @@ from app.models import (
     Commune,
     Quartier,
     Menage,
-    MembreMenage,
     Logs,
     LogsArchive,
     RapportRecensement,
@@ -87,6 +86,43 @@ from app.models import (
 )
 from app.auth import get_password_hash
 from app.utils import remove_trailing_commas
+from app.geometry import resolve_precision, resolve_simplify_level, render_geometry
+from app.renderers import render_json
+from app.search import search_candidates
+from app.autocomplete import parcelle_autocomplete
+from app.derived import derived_tables
+from app.locations import parcelle_location_table
+from app.filters import (
+    SqlFilters,
+    date_bounds,
+    date_range_clauses,
+    build_joins,
+    referenced_aliases,
+    PARCELLE_JOINS,
+    BIEN_JOINS,
+)
+from app.aggregates import (
+    label_lookup,
+    labelled_counts,
+    all_labelled_counts,
+    commune_labelled_counts,
+)
+from app.activity import ACTIVITY_COUNTS, DATE_COUNTS, agent_activity_series, agents_activity_page, activity_by_date
+from app.cache import LRUCache
+from app.stats_cache import stats_cache, stats_key, stats_scope
+from app.snapshot import SNAPSHOT_CHECK_IDS, dashboard_snapshot, dashboard_parcelle_stats, dashboard_bien_stats
+from app.versioning import data_versions, SURVEY_TABLES, LOCATION_TABLES
+from app.fieldsets import CARTOGRAPHIE_FIELDS, CARTOGRAPHIE_FIELD_KEYS, parse_fields, sparse, sparse_keys
+from app.structs import (
+    AdresseStruct,
+    ProprietaireStruct,
+    GeojsonFeature,
+    GeojsonBienFeature,
+    CartographieParcelle,
+    CartographieBien,
+    CartographieParcelleRow,
+    CartographieBienRow,
+)
 
 router = APIRouter()
 
@@ -390,23 +426,10 @@ def get_all_users(
         """
 
         # Add filters
-        filters = []
-        params = {}
-        if name:
-            filters.append("(u.nom LIKE :name OR u.postnom LIKE :name OR u.prenom LIKE :name OR u.login LIKE :name)")
-            params["name"] = f"%{name}%"
-        if date_start:
-            try:
-                filters.append("CAST(u.date_create AS DATE) >= CAST(:date_start AS DATE)")
-                params["date_start"] = date_start
-            except Exception:
-                pass
-        if date_end:
-            try:
-                filters.append("CAST(u.date_create AS DATE) <= CAST(:date_end AS DATE)")
-                params["date_end"] = date_end
-            except Exception:
-                pass
+        sql_filters = SqlFilters()
+        sql_filters.search(("u.nom", "u.postnom", "u.prenom", "u.login"), "name", name, (("u.id", "utilisateur"),))
+        sql_filters.date_range("u.date_create", date_start, date_end)
+        filters, params = sql_filters.filters, sql_filters.params
 
         # Build final query
         query = base_query
@@ -696,20 +719,29 @@ async def get_geojson(
     date_start: str = Query(None),
     date_end: str = Query(None),
     type: str = Query('parcelle'),
-    province: str = Query(None),
-    ville: str = Query(None),
-    commune: str = Query(None),
-    quartier: str = Query(None),
-    avenue: str = Query(None),
-    rang: str = Query(None),
-    nature: str = Query(None),
+    province: int = Query(None),
+    ville: int = Query(None),
+    commune: int = Query(None),
+    quartier: int = Query(None),
+    avenue: int = Query(None),
+    rang: int = Query(None),
+    nature: int = Query(None),
+    zoom: Optional[int] = Query(None, ge=0, le=24),
+    simplify: Optional[float] = Query(None, gt=0),
+    precision: Optional[int] = Query(None, ge=0, le=10),
+    coord_encoding: str = Query("decimal", regex="^(decimal|delta)$"),
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db),
 ):
     try:
-        # Base queries
-        parcelle_query = """
-            SELECT
+        # Simplification level for the geometries (None = raw geometry)
+        simplify_level = resolve_simplify_level(zoom, simplify)
+        # Quantization of the coordinates (decimal places or integer deltas)
+        coord_precision = resolve_precision(precision)
+        delta = coord_encoding == "delta"
+
+        # Selected columns; their joins are added from the aliases they reference
+        parcelle_columns = """
                 p.id,
                 p.coordonnee_geographique,
                 p.date_create,
@@ -722,21 +754,9 @@ async def get_geojson(
                 per.prenom AS proprietaire_prenom,
                 per.denomination AS proprietaire_denomination,
                 tp.intitule AS type_personne
-            FROM parcelle p
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN personne per ON p.fk_proprietaire = per.id
-            LEFT JOIN type_personne tp ON per.fk_type_personne = tp.id
-            LEFT JOIN ville v ON c.fk_ville = v.id
-            LEFT JOIN province pr ON v.fk_province = pr.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            WHERE 1=1
         """
-        
-        bien_query = """
-            SELECT DISTINCT
+
+        bien_columns = """
                 b.id,
                 b.coordinates,
                 b.date_create,
@@ -751,99 +771,42 @@ async def get_geojson(
                 per.prenom AS proprietaire_prenom,
                 per.denomination AS proprietaire_denomination,
                 tp.intitule AS type_personne
-            FROM bien b
-            LEFT JOIN nature_bien nb ON b.fk_nature_bien = nb.id
-            LEFT JOIN utilisateur u ON b.fk_agent = u.id
-            LEFT JOIN parcelle p ON b.fk_parcelle = p.id
-            LEFT JOIN personne per ON b.fk_proprietaire = per.id
-            LEFT JOIN type_personne tp ON per.fk_type_personne = tp.id
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN ville v ON c.fk_ville = v.id
-            LEFT JOIN province pr ON v.fk_province = pr.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            WHERE 1=1
         """
 
-        query = parcelle_query if type == "parcelle" else bien_query
-        date_field = "p.date_create" if type == "parcelle" else "b.date_create"
+        if type == "parcelle":
+            root, columns, joins = "parcelle p", parcelle_columns, PARCELLE_JOINS
+            date_field = "p.date_create"
+        else:
+            root, columns = "bien b", bien_columns
+            joins = {**BIEN_JOINS, "u": ("LEFT JOIN utilisateur u ON b.fk_agent = u.id", "b")}
+            date_field = "b.date_create"
 
         # Initialize filters and parameters
-        filters = []
-        params = {}
-        join_clauses = []
+        sql_filters = SqlFilters()
 
         # Date filters
-        if date_start:
-            filters.append(f"CAST({date_field} AS DATE) >= CAST(:date_start AS DATE)")
-            params["date_start"] = date_start
-        if date_end:
-            filters.append(f"CAST({date_field} AS DATE) <= CAST(:date_end AS DATE)")
-            params["date_end"] = date_end
+        sql_filters.date_range(date_field, date_start, date_end)
 
         # Location filters
-        if province:
-            filters.append("pr.id = :province")
-            params["province"] = province
-        if ville:
-            filters.append("v.id = :ville")
-            params["ville"] = ville
-        if commune:
-            filters.append("c.id = :commune")
-            params["commune"] = commune
-        if quartier:
-            filters.append("q.id = :quartier")
-            params["quartier"] = quartier
-        if avenue:
-            filters.append("av.id = :avenue")
-            params["avenue"] = avenue
-        if rang:
-            filters.append("r.id = :rang")
-            params["rang"] = rang
-        if nature and type == "bien":
-            filters.append("nb.id = :nature")
-            params["nature"] = nature
-
-        # Apply filters
-        if filters:
-            query += " AND " + " AND ".join(filters)
-
-        # Count total records with optimized queries
+        sql_filters.location(province=province, ville=ville, commune=commune, quartier=quartier, avenue=avenue, rang=rang)
         if type == "bien":
-            # Efficient count query for biens
-            count_query = "SELECT COUNT(DISTINCT b.id) FROM bien b"
-            
-            # Define location patterns that require joins
-            location_patterns = ["pr.id", "v.id", "c.id", "q.id", "av.id", "r.id"]
-            
-            # Check if any filter contains location patterns
-            if any(any(pattern in f for pattern in location_patterns) for f in filters):
-                count_query += """
-                    LEFT JOIN parcelle p ON b.fk_parcelle = p.id
-                    LEFT JOIN adresse a ON p.fk_adresse = a.id
-                    LEFT JOIN avenue av ON a.fk_avenue = av.id
-                    LEFT JOIN quartier q ON av.fk_quartier = q.id
-                    LEFT JOIN commune c ON q.fk_commune = c.id
-                    LEFT JOIN ville v ON c.fk_ville = v.id
-                    LEFT JOIN province pr ON v.fk_province = pr.id
-                    LEFT JOIN rang r ON p.fk_rang = r.id
-                """
-            
-            # Check for nature filter
-            if any("nb.id" in f for f in filters):
-                count_query += " LEFT JOIN nature_bien nb ON b.fk_nature_bien = nb.id"
-            
-            # Apply filters
-            if filters:
-                count_query += " WHERE " + " AND ".join(filters)
-                
-            total = db.execute(text(count_query), params).scalar()
-        else:
-            # Standard count for parcelles
-            count_query = f"SELECT COUNT(*) FROM ({query}) AS total"
-            total = db.execute(text(count_query), params).scalar()
+            sql_filters.equals("b.fk_nature_bien", "nature", nature)
+        params = sql_filters.params
+
+        # Every join is to-one: the count only needs the joins of the filters
+        count_query = f"""
+            SELECT COUNT(*) FROM {root}
+            {build_joins(joins, sql_filters.aliases())}
+            WHERE 1=1 {sql_filters.sql()}
+        """
+        total = db.execute(text(count_query), params).scalar()
+
+        query = f"""
+            SELECT {columns}
+            FROM {root}
+            {build_joins(joins, referenced_aliases(columns) | sql_filters.aliases())}
+            WHERE 1=1 {sql_filters.sql()}
+        """
 
         # Add pagination
         query += f"""
@@ -856,41 +819,48 @@ async def get_geojson(
         # Execute query
         results = db.execute(text(query), params).fetchall()
 
-        # Format results
-        common_fields = {
-            "id": lambda row: str(row.id),
-            "coordinates": lambda row: row.coordonnee_geographique if type == "parcelle" else row.coordinates,
-            "adresse": lambda row: {
-                "numero": row.adresse_numero,
-                "avenue": row.avenue,
-                "quartier": row.quartier,
-                "commune": row.commune
-            },
-            "proprietaire": lambda row: {
-                "nom": row.proprietaire_nom,
-                "postnom": row.proprietaire_postnom,
-                "prenom": row.proprietaire_prenom,
-                "denomination": row.proprietaire_denomination,
-                "type_personne": row.type_personne
-            },
-            "date": lambda row: row.date_create.isoformat() if row.date_create else None,
-        }
+        # Format results into typed structs (rendered without the generic encoder)
+        def common_fields(row):
+            return {
+                "id": str(row.id),
+                "coordinates": render_geometry(
+                    row.coordonnee_geographique if type == "parcelle" else row.coordinates,
+                    simplify_level,
+                    coord_precision,
+                    delta,
+                    type,
+                    row.id,
+                ),
+                "adresse": AdresseStruct(
+                    numero=row.adresse_numero,
+                    avenue=row.avenue,
+                    quartier=row.quartier,
+                    commune=row.commune,
+                ),
+                "proprietaire": ProprietaireStruct(
+                    nom=row.proprietaire_nom,
+                    postnom=row.proprietaire_postnom,
+                    prenom=row.proprietaire_prenom,
+                    denomination=row.proprietaire_denomination,
+                    type_personne=row.type_personne,
+                ),
+                "date": row.date_create.isoformat() if row.date_create else None,
+            }
 
         if type == "parcelle":
-            data = [{key: func(row) for key, func in common_fields.items()} for row in results]
+            data = [GeojsonFeature(**common_fields(row)) for row in results]
         else:
-            data = [{
-                **{key: func(row) for key, func in common_fields.items()},
-                "recense_par": row.recense_par,
-                "nature": row.nature
-            } for row in results]
+            data = [
+                GeojsonBienFeature(**common_fields(row), recense_par=row.recense_par, nature=row.nature)
+                for row in results
+            ]
 
-        return {
+        return render_json({
             "data": data,
             "total": total,
             "page": page,
             "page_size": page_size,
-        }
+        })
 
     except Exception as e:
         import traceback
@@ -1035,23 +1005,23 @@ async def get_parcelles(
     page_size: int = Query(10, ge=1, le=100),
     date_start: str = Query(None),
     date_end: str = Query(None),
-    province: str = Query(None),
-    ville: str = Query(None),
-    commune: str = Query(None),
-    quartier: str = Query(None),
-    avenue: str = Query(None),
-    rang: str = Query(None),
-    nature: str = Query(None),
+    province: int = Query(None),
+    ville: int = Query(None),
+    commune: int = Query(None),
+    quartier: int = Query(None),
+    avenue: int = Query(None),
+    rang: int = Query(None),
+    nature: int = Query(None),
     keyword: str = Query(None),
     accessibilite: int = Query(None, description="Filter by accessibility: 1 for accessible, 2 for inaccessible"),  # Changed to int
+    precision: Optional[int] = Query(None, ge=0, le=10),
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db),
     fk_agent: int = Query(None)
 ):
     try:
-        # Base query with all necessary joins
-        base_query = """
-            SELECT 
+        # Selected columns; their joins are added from the aliases they reference
+        columns = """
                 p.id, p.numero_parcellaire, p.superficie_calculee, p.coordonnee_geographique, p.date_create, p.statut,p.fk_agent,
                 per.id AS proprietaire_id, per.nom AS proprietaire_nom, per.postnom AS proprietaire_postnom,
                 per.prenom AS proprietaire_prenom, per.denomination AS proprietaire_denomination,
@@ -1067,76 +1037,43 @@ async def get_parcelles(
                 un.intitule AS unite,
                 us.intitule AS usage,
                 usp.intitule AS usage_specifique
-            FROM parcelle p
-            LEFT JOIN personne per ON p.fk_proprietaire = per.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            LEFT JOIN type_personne u ON per.fk_type_personne = u.id
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN ville v ON c.fk_ville = v.id
-            LEFT JOIN province pr ON v.fk_province = pr.id
-            LEFT JOIN bien b ON p.id = b.fk_parcelle
-            LEFT JOIN nature_bien nb ON b.fk_nature_bien = nb.id
-            LEFT JOIN unite un ON b.fk_unite = un.id
-            LEFT JOIN usage us ON b.fk_usage = us.id
-            LEFT JOIN usage_specifique usp ON b.fk_usage_specifique = usp.id
-            WHERE 1=1
         """
+        joins = {
+            **PARCELLE_JOINS,
+            "u": ("LEFT JOIN type_personne u ON per.fk_type_personne = u.id", "per"),
+            "b": ("LEFT JOIN bien b ON p.id = b.fk_parcelle", "p"),
+            "nb": ("LEFT JOIN nature_bien nb ON b.fk_nature_bien = nb.id", "b"),
+            "un": ("LEFT JOIN unite un ON b.fk_unite = un.id", "b"),
+            "us": ("LEFT JOIN usage us ON b.fk_usage = us.id", "b"),
+            "usp": ("LEFT JOIN usage_specifique usp ON b.fk_usage_specifique = usp.id", "b"),
+        }
 
         # Add filters
-        filters = []
-        params = {}
-        if fk_agent:
-            filters.append("p.fk_agent = :fk_agent")
-            params["fk_agent"] = fk_agent
-        if date_start:
-            filters.append("CAST(p.date_create AS DATE) >= CAST(:date_start AS DATE)")
-            params["date_start"] = date_start
-        if date_end:
-            filters.append("CAST(p.date_create AS DATE) <= CAST(:date_end AS DATE)")
-            params["date_end"] = date_end
-        if province:
-            filters.append("pr.id = :province")
-            params["province"] = province
-        if ville:
-            filters.append("v.id = :ville")
-            params["ville"] = ville
-        if commune:
-            filters.append("c.id = :commune")
-            params["commune"] = commune
-        if quartier:
-            filters.append("q.id = :quartier")
-            params["quartier"] = quartier
-        if avenue:
-            filters.append("av.id = :avenue")
-            params["avenue"] = avenue
-        if rang:
-            filters.append("r.id = :rang")
-            params["rang"] = rang
-        if keyword:
-            keyword_filters = [
-                "per.nom LIKE :keyword",
-                "per.postnom LIKE :keyword",
-                "per.prenom LIKE :keyword",
-                "per.denomination LIKE :keyword",
-                "r.intitule LIKE :keyword"
-            ]
-            filters.append(f"({' OR '.join(keyword_filters)})")
-            params["keyword"] = f"%{keyword}%"
-        if accessibilite:
-            if accessibilite in [1, 2]:  # Only accept 1 or 2
-                filters.append("p.statut = :accessibilite")
-                params["accessibilite"] = accessibilite
+        sql_filters = SqlFilters()
+        sql_filters.equals("p.fk_agent", "fk_agent", fk_agent)
+        sql_filters.date_range("p.date_create", date_start, date_end)
+        sql_filters.location(province=province, ville=ville, commune=commune, quartier=quartier, avenue=avenue, rang=rang)
+        sql_filters.search(("per.nom", "per.postnom", "per.prenom", "per.denomination", "r.intitule"), "keyword", keyword,
+                           (("per.id", "personne"), ("p.fk_rang", "rang")))
+        if accessibilite in [1, 2]:  # Only accept 1 or 2
+            sql_filters.equals("p.statut", "accessibilite", accessibilite)
+        params = sql_filters.params
 
         # Build final query
-        query = base_query
-        if filters:
-            query += " AND " + " AND ".join(filters)
+        query = f"""
+            SELECT {columns}
+            FROM parcelle p
+            {build_joins(joins, referenced_aliases(columns) | sql_filters.aliases())}
+            WHERE 1=1 {sql_filters.sql()}
+        """
 
-        # Count total records
-        count_query = f"SELECT COUNT(*) FROM ({query}) AS total"
+        # Count total records: one row per (parcelle, bien) like the page, so the
+        # bien join stays; the label joins only come with the filters using them
+        count_query = f"""
+            SELECT COUNT(*) FROM parcelle p
+            {build_joins(joins, sql_filters.aliases() | {"b"})}
+            WHERE 1=1 {sql_filters.sql()}
+        """
         total = db.execute(text(count_query), params).scalar()
 
         # Add pagination using SQL Server syntax
@@ -1151,6 +1088,7 @@ async def get_parcelles(
         results = db.execute(text(query), params).fetchall()
 
         # Format results
+        coord_precision = resolve_precision(precision)
         data = []
         parcelle_map = {}
         for row in results:
@@ -1159,7 +1097,7 @@ async def get_parcelles(
                     "id": row.id,
                     "numero_parcellaire": row.numero_parcellaire,
                     "superficie_calculee": row.superficie_calculee,
-                    "coordonnee_geographique": row.coordonnee_geographique,
+                    "coordonnee_geographique": render_geometry(row.coordonnee_geographique, precision=coord_precision, entity="parcelle", entity_id=row.id),
                     "date_create": row.date_create.isoformat() if row.date_create else None,
                     "statut": "Accessible" if row.statut == 1 else "Non accessible",
                     "adresse": {
@@ -1194,25 +1132,108 @@ async def get_parcelles(
         # Convert the map to a list
         data = list(parcelle_map.values())
 
-        return {
+        return render_json({
             "data": data,
             "total": total,
             "page": page,
             "page_size": page_size,
-        }
+        })
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Type-ahead lookup of parcelles by numero_parcellaire or owner name, answered from
+# the in-memory prefix index of app/autocomplete.py; only the matches are read back.
+# Never waits for the index: nothing matches until its first build, started at startup
+@router.get("/autocomplete/parcelles", tags=["Parcelles"])
+def autocomplete_parcelles(
+    q: str = Query(..., min_length=1, max_length=100),
+    type: str = Query("all", regex="^(all|numero|proprietaire)$"),
+    limit: int = Query(10, ge=1, le=50),
+    current_user = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+):
+    try:
+        parcelle_autocomplete.refresh(db)
+        matches = parcelle_autocomplete.search(q, limit, type)
+        if not matches:
+            return {"data": [], "count": 0}
 
+        query = text("""
+            SELECT p.id, p.numero_parcellaire, per.nom, per.postnom, per.prenom, per.denomination
+            FROM parcelle p
+            LEFT JOIN personne per ON p.fk_proprietaire = per.id
+            WHERE p.id IN :parcelle_ids
+        """).bindparams(bindparam("parcelle_ids", expanding=True))
+        rows = {row.id: row for row in db.execute(query, {"parcelle_ids": [pid for pid, _ in matches]})}
+
+        data = []
+        for parcelle_id, matched_on in matches:
+            row = rows.get(parcelle_id)
+            if row is None:  # Deleted since the index was loaded
+                continue
+            data.append({
+                "id": row.id,
+                "numero_parcellaire": row.numero_parcellaire,
+                "proprietaire": " ".join(label for label in (row.nom, row.postnom, row.prenom) if label) or row.denomination,
+                "match": matched_on,
+            })
+        return {"data": data, "count": len(data)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Helper function to fetch the details of many personnes in one round trip.
+# SQL Server caps a statement at 2100 parameters, so the ids are sent in chunks.
+PERSONNE_BATCH_SIZE = 1000
+
+
+def get_personnes_details(db: Session, personne_ids) -> dict:
+    query = text("""
+        SELECT 
+            p.id, p.nom, p.postnom, p.prenom, p.denomination, p.sigle, p.nif,
+            p.sexe, p.fk_type_personne, tp.intitule AS type_personne,
+            fm.intitule AS lien_parente, n.intitule AS nationalite
+        FROM personne p
+        LEFT JOIN type_personne tp ON p.fk_type_personne = tp.id
+        LEFT JOIN filiation_membre fm ON p.fk_lien_parente = fm.id
+        LEFT JOIN nationalite n ON p.fk_nationalite = n.id
+        WHERE p.id IN :personne_ids
+    """).bindparams(bindparam("personne_ids", expanding=True))
+
+    ids = sorted(personne_ids)
+    personnes = {}
+    for start in range(0, len(ids), PERSONNE_BATCH_SIZE):
+        chunk = ids[start:start + PERSONNE_BATCH_SIZE]
+        for result in db.execute(query, {"personne_ids": chunk}):
+            personnes[result.id] = {
+                "id": result.id,
+                "nom": result.nom,
+                "postnom": result.postnom,
+                "prenom": result.prenom,
+                "denomination": result.denomination,
+                "sigle": result.sigle,
+                "nif": result.nif,
+                "sexe": result.sexe,
+                "type_personne": result.type_personne,
+                "lien_parente": result.lien_parente,
+                "nationalite": result.nationalite
+            }
+    return personnes
+
+
 # Fetch parcelle details by ID
 @router.get("/parcelles/{parcelle_id}", tags=["Parcelles"])
 async def get_parcelle_details(
     parcelle_id: int,
+    precision: Optional[int] = Query(None, ge=0, le=10),
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db),
 ):
     try:
+        coord_precision = resolve_precision(precision)
+
         # Main query to fetch parcelle, owner, and address hierarchy
         parcelle_query = """
             SELECT 
@@ -1295,37 +1316,15 @@ async def get_parcelle_details(
         # Execute biens query
         biens_results = db.execute(text(biens_query), {"parcelle_id": parcelle_id}).fetchall()
 
-        # Helper function to get personne details
-        def get_personne_details(personne_id: int):
-            if not personne_id:
-                return None
-            query = """
-                SELECT 
-                    p.id, p.nom, p.postnom, p.prenom, p.denomination, p.sigle, p.nif,
-                    p.sexe, p.fk_type_personne, tp.intitule AS type_personne,
-                    fm.intitule AS lien_parente, n.intitule AS nationalite
-                FROM personne p
-                LEFT JOIN type_personne tp ON p.fk_type_personne = tp.id
-                LEFT JOIN filiation_membre fm ON p.fk_lien_parente = fm.id
-                LEFT JOIN nationalite n ON p.fk_nationalite = n.id
-                WHERE p.id = :personne_id
-            """
-            result = db.execute(text(query), {"personne_id": personne_id}).first()
-            if result:
-                return {
-                    "id": result.id,
-                    "nom": result.nom,
-                    "postnom": result.postnom,
-                    "prenom": result.prenom,
-                    "denomination": result.denomination,
-                    "sigle": result.sigle,
-                    "nif": result.nif,
-                    "sexe": result.sexe,
-                    "type_personne": result.type_personne,
-                    "lien_parente": result.lien_parente,
-                    "nationalite": result.nationalite
-                }
-            return None
+        # Every personne referenced by the biens (ménage owners, locataires, members),
+        # resolved with one batched query instead of one query per reference
+        personne_ids = {
+            personne_id
+            for row in biens_results
+            for personne_id in (row.menage_owner_id, row.locataire_id, row.membre_id)
+            if personne_id
+        }
+        personnes = get_personnes_details(db, personne_ids)
 
         # Process biens and their relationships
         biens_map = {}
@@ -1336,22 +1335,22 @@ async def get_parcelle_details(
                 biens_map[row.id] = {
                     "id": row.id,
                     "ref_bien": row.ref_bien,
-                    "coordinates": row.coordinates,
+                    "coordinates": render_geometry(row.coordinates, precision=coord_precision, entity="bien", entity_id=row.id),
                     "superficie": row.superficie,
                     "date_create": row.date_create.isoformat() if row.date_create else None,
                     "nature_bien": row.nature_bien,
                     "unite": row.unite,
                     "usage": row.usage,
                     "usage_specifique": row.usage_specifique,
-                    "proprietaire": get_personne_details(row.menage_owner_id),
-                    "locataire": get_personne_details(row.locataire_id),
+                    "proprietaire": personnes.get(row.menage_owner_id),
+                    "locataire": personnes.get(row.locataire_id),
                     "membres_menage": []
                 }
                 membres_seen[row.id] = set()
 
             # Add membre if exists and not already added
             if row.membre_id and row.membre_id not in membres_seen[row.id]:
-                membre_details = get_personne_details(row.membre_id)
+                membre_details = personnes.get(row.membre_id)
                 if membre_details:
                     biens_map[row.id]["membres_menage"].append(membre_details)
                     membres_seen[row.id].add(row.membre_id)
@@ -1361,7 +1360,7 @@ async def get_parcelle_details(
                 "id": parcelle_result.id,
                 "numero_parcellaire": parcelle_result.numero_parcellaire,
                 "superficie_calculee": parcelle_result.superficie_calculee,
-                "coordonnee_geographique": parcelle_result.coordonnee_geographique,
+                "coordonnee_geographique": render_geometry(parcelle_result.coordonnee_geographique, precision=coord_precision, entity="parcelle", entity_id=parcelle_result.id),
                 "date_create": parcelle_result.date_create.isoformat() if parcelle_result.date_create else None,
                 "longueur": parcelle_result.longueur,
                 "largeur": parcelle_result.largeur,
@@ -1379,126 +1378,110 @@ async def get_parcelle_details(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Age pyramid histograms, keyed by filters and survey table versions.
+# The TTL lets ages roll over with the calendar.
+AGE_PYRAMID_LAST_GROUP = 75
+AGE_PYRAMID_TABLES = SURVEY_TABLES + LOCATION_TABLES
+age_pyramid_cache = LRUCache(
+    maxsize=int(os.getenv("AGE_PYRAMID_CACHE_SIZE", "256")),
+    ttl=int(os.getenv("AGE_PYRAMID_CACHE_TTL", "21600")),
+)
+
+
 @router.get("/population-by-age-pyramid", tags=["Populations"])
 def get_age_pyramid(
-    commune: Optional[str] = Query(None),
-    quartier: Optional[str] = Query(None),
-    avenue: Optional[str] = Query(None),
+    commune: Optional[int] = Query(None),
+    quartier: Optional[int] = Query(None),
+    avenue: Optional[int] = Query(None),
     date_start: str = Query(..., description="Start date in format YYYY-MM-DD", regex=r"^\d{4}-\d{2}-\d{2}$"),
     date_end: str = Query(..., description="End date in format YYYY-MM-DD", regex=r"^\d{4}-\d{2}-\d{2}$"),
     current_user=Depends(get_current_active_user),
     db: Session=Depends(get_db),
 ):
     try:
-        # Base query to get filtered parcelle IDs
-        parcelle_query = """
-            SELECT DISTINCT p.id
-            FROM parcelle p
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            WHERE 1=1
-        """
-
-        # Add filters
-        filters = []
-        params = {}
-        if commune:
-            filters.append("c.id = :commune")
-            params["commune"] = commune
-        if quartier:
-            filters.append("q.id = :quartier")
-            params["quartier"] = quartier
-        if avenue:
-            filters.append("av.id = :avenue")
-            params["avenue"] = avenue
-
-        # Build final parcelle query
-        if filters:
-            parcelle_query += " AND " + " AND ".join(filters)
-
-        # Get filtered parcelle IDs
-        parcelle_ids = [row[0] for row in db.execute(text(parcelle_query), params).fetchall()]
-
-        # If no parcelle IDs found, return empty list
-        if not parcelle_ids:
-            return []
-
-        # Prepare parcelle IDs for IN clause
-        parcelle_ids_str = ",".join(map(str, parcelle_ids))
-
-        # Query to get persons with date filters
-        persons_query = """
-        WITH related_persons AS (
-            SELECT DISTINCT p.id, p.sexe, p.date_naissance
-            FROM personne p
-            WHERE p.date_naissance IS NOT NULL 
-            AND p.date_naissance <= GETDATE()
-            AND CAST(p.date_create AS DATE) >= CAST(:date_start AS DATE)
-            AND CAST(p.date_create AS DATE) <= CAST(:date_end AS DATE)
-            AND (
-                -- Owners of parcelles
-                p.id IN (
-                    SELECT fk_proprietaire 
-                    FROM parcelle 
-                    WHERE id IN ({parcelle_ids}) AND fk_proprietaire IS NOT NULL
-                )
-                OR
-                -- Persons in menage related to parcelles
-                p.id IN (
-                    SELECT m.fk_personne 
-                    FROM bien b
-                    JOIN menage m ON b.id = m.fk_bien
-                    WHERE b.fk_parcelle IN ({parcelle_ids})
-                )
-                OR
-                -- Persons in location_bien related to parcelles
-                p.id IN (
-                    SELECT lb.fk_personne 
-                    FROM bien b
-                    JOIN location_bien lb ON b.id = lb.fk_bien
-                    WHERE b.fk_parcelle IN ({parcelle_ids})
-                )
-                OR
-                -- Members of menage related to parcelles
-                p.id IN (
-                    SELECT mm.fk_personne 
-                    FROM bien b
-                    JOIN menage m ON b.id = m.fk_bien
-                    JOIN membre_menage mm ON m.id = mm.fk_menage
-                    WHERE b.fk_parcelle IN ({parcelle_ids})
-                )
+        sql_filters = SqlFilters()
+        sql_filters.location(commune=commune, quartier=quartier, avenue=avenue)
+        # The date range applies to the persons, not to the parcelles
+        params = sql_filters.params
+        params["date_start"], params["date_end"] = date_bounds(date_start, date_end)
+
+        # Any ingestion bumps the survey table versions, which changes the key
+        cache_key = (
+            commune, quartier, avenue, date_start, date_end,
+            data_versions.versions(AGE_PYRAMID_TABLES),
+        )
+        cached = age_pyramid_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # Persons linked to the filtered parcelles, bucketed by 5-year age group and sex in SQL
+        pyramid_query = """
+            WITH filtered_parcelles AS (
+                SELECT p.id, p.fk_proprietaire
+                FROM parcelle p
+                {joins}
+                WHERE 1=1
+                {filters}
+            ),
+            related_persons AS (
+                SELECT DISTINCT pr.personne_id AS person_id
+                FROM filtered_parcelles fp
+                JOIN {personne_role} pr ON pr.parcelle_id = fp.id
+            ),
+            population AS (
+                SELECT
+                    UPPER(LEFT(LTRIM(p.sexe), 1)) AS sexe,
+                    CASE
+                        WHEN DATEADD(YEAR, DATEDIFF(YEAR, p.date_naissance, GETDATE()), p.date_naissance) > GETDATE()
+                        THEN DATEDIFF(YEAR, p.date_naissance, GETDATE()) - 1
+                        ELSE DATEDIFF(YEAR, p.date_naissance, GETDATE())
+                    END AS age
+                FROM related_persons rp
+                JOIN personne p ON rp.person_id = p.id
+                WHERE p.date_naissance IS NOT NULL
+                AND p.date_naissance <= GETDATE()
+                AND p.date_create >= :date_start
+                AND p.date_create < :date_end
+            ),
+            buckets AS (
+                SELECT sexe, CASE WHEN age >= :last_group THEN :last_group ELSE (age / 5) * 5 END AS min_age
+                FROM population
             )
+            SELECT
+                min_age,
+                SUM(CASE WHEN sexe = 'M' THEN 1 ELSE 0 END) AS male_count,
+                SUM(CASE WHEN sexe = 'F' THEN 1 ELSE 0 END) AS female_count
+            FROM buckets
+            GROUP BY min_age
+        """.format(
+            joins=build_joins(PARCELLE_JOINS, sql_filters.aliases()),
+            filters=sql_filters.sql(),
+            personne_role=derived_tables.source("personne_role"),
         )
-        SELECT id, sexe, date_naissance
-        FROM related_persons
-        """.format(parcelle_ids=parcelle_ids_str)
+        params["last_group"] = AGE_PYRAMID_LAST_GROUP
 
-        # Execute query with date parameters
-        results = db.execute(
-            text(persons_query),
-            {
-                "date_start": date_start,
-                "date_end": date_end,
-                **params
-            }
-        ).fetchall()
-
-        # Log the number of persons retrieved
-        logger.info(f"Retrieved {len(results)} persons with non-NULL date_naissance")
+        counts = {
+            row.min_age: (row.male_count or 0, row.female_count or 0)
+            for row in db.execute(text(pyramid_query), params)
+        }
 
-        # Format results
-        persons = [
-            {
-                "id": row[0],
-                "sexe": row[1],
-                "date_naissance": row[2].isoformat() if row[2] else None
-            }
-            for row in results
-        ]
+        # Every group is returned, empty ones included, youngest first
+        age_pyramid = []
+        for min_age in range(0, AGE_PYRAMID_LAST_GROUP + 1, 5):
+            age_group = f"{min_age}-{min_age + 4}" if min_age < AGE_PYRAMID_LAST_GROUP else f"{AGE_PYRAMID_LAST_GROUP}+"
+            male_count, female_count = counts.get(min_age, (0, 0))
+            total = male_count + female_count
+
+            age_pyramid.append({
+                "ageGroup": age_group,
+                "masculinCount": male_count,
+                "masculinProportion": round((male_count / total) * 100, 1) if total > 0 else 0,
+                "femininCount": female_count,
+                "femininProportion": round((female_count / total) * 100, 1) if total > 0 else 0,
+            })
 
-        return persons
+        age_pyramid_cache.set(cache_key, age_pyramid)
+        return age_pyramid
 
     except Exception as e:
         logger.error(f"Error in get_age_pyramid: {str(e)}", exc_info=True)
@@ -1510,10 +1493,10 @@ def get_age_pyramid(
 def get_populations(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
-    commune: Optional[str] = Query(None),
-    quartier: Optional[str] = Query(None),
-    avenue: Optional[str] = Query(None),
-    rang: Optional[str] = Query(None),
+    commune: Optional[int] = Query(None),
+    quartier: Optional[int] = Query(None),
+    avenue: Optional[int] = Query(None),
+    rang: Optional[int] = Query(None),
     keyword: Optional[str] = Query(None),
     date_start: str = Query(..., description="Start date in format YYYY-MM-DD", regex=r"^\d{4}-\d{2}-\d{2}$"),
     date_end: str = Query(..., description="End date in format YYYY-MM-DD", regex=r"^\d{4}-\d{2}-\d{2}$"),
@@ -1521,124 +1504,54 @@ def get_populations(
     db: Session = Depends(get_db),
 ):
     try:
-        # Base query to get filtered parcelle IDs
-        parcelle_query = """
-            SELECT DISTINCT p.id
-            FROM parcelle p
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN personne per ON p.fk_proprietaire = per.id
-            WHERE 1=1 AND per.fk_type_personne = 1
-        """
-
-        # Add filters
-        filters = []
-        params = {}
-        if commune:
-            filters.append("c.id = :commune")
-            params["commune"] = commune
-        if quartier:
-            filters.append("q.id = :quartier")
-            params["quartier"] = quartier
-        if avenue:
-            filters.append("av.id = :avenue")
-            params["avenue"] = avenue
-        if rang:
-            filters.append("p.fk_rang = :rang")
-            params["rang"] = rang
-        if keyword:
-            keyword_filters = [
-                "per.nom LIKE :keyword",
-                "per.postnom LIKE :keyword",
-                "per.prenom LIKE :keyword",
-                "per.denomination LIKE :keyword",
-                "per.sigle LIKE :keyword"
-            ]
-            filters.append(f"({' OR '.join(keyword_filters)})")
-            params["keyword"] = f"%{keyword}%"
-
-        # Add date filters
-        filters.append("CAST(p.date_create AS DATE) >= CAST(:date_start AS DATE)")
-        filters.append("CAST(p.date_create AS DATE) <= CAST(:date_end AS DATE)")
-        params["date_start"] = date_start
-        params["date_end"] = date_end
-
-        # Build final parcelle query
-        if filters:
-            parcelle_query += " AND " + " AND ".join(filters)
-
-        # Get filtered parcelle IDs
-        parcelle_ids = [row[0] for row in db.execute(text(parcelle_query), params).fetchall()]
-
-        if not parcelle_ids:
-            logger.info("Not parcelle_ids")
-            return {
-                "data": [],
-                "total": 0,
-                "page": page,
-                "page_size": page_size,
-            }
-
-        # Get all person IDs with sorting applied
-        person_query = """
-            WITH all_persons AS (
-                SELECT p.fk_proprietaire AS person_id
+        # Filtered parcelles and the persons attached to them (personne_role, app/roles.py).
+        # Each way a person is linked to a parcelle is a role; the lowest one
+        # gives the category (1 Propriétaire, 2 Responsable menage, 3 Membre menage,
+        # 4 locataire only -> Inconnu). Heads and tenants count when physical persons.
+        population_cte = """
+            WITH filtered_parcelles AS (
+                SELECT p.id, p.fk_proprietaire
                 FROM parcelle p
-                JOIN personne per ON p.fk_proprietaire = per.id
-                WHERE p.id IN (SELECT * FROM string_split(:parcelle_ids, ','))
-                AND p.fk_proprietaire IS NOT NULL
-                AND per.fk_type_personne = 1
-                UNION
-                SELECT m.fk_personne AS person_id
-                FROM bien b
-                JOIN menage m ON b.id = m.fk_bien
-                JOIN personne per ON m.fk_personne = per.id
-                WHERE b.fk_parcelle IN (SELECT * FROM string_split(:parcelle_ids, ','))
-                AND m.fk_personne IS NOT NULL
-                AND per.fk_type_personne = 1
-                UNION
-                SELECT lb.fk_personne AS person_id
-                FROM bien b
-                JOIN location_bien lb ON b.id = lb.fk_bien
-                JOIN personne per ON lb.fk_personne = per.id
-                WHERE b.fk_parcelle IN (SELECT * FROM string_split(:parcelle_ids, ','))
-                AND lb.fk_personne IS NOT NULL
-                AND per.fk_type_personne = 1
-                UNION
-                SELECT mm.fk_personne AS person_id
-                FROM bien b
-                JOIN menage m ON b.id = m.fk_bien
-                JOIN membre_menage mm ON m.id = mm.fk_menage
-                WHERE b.fk_parcelle IN (SELECT * FROM string_split(:parcelle_ids, ','))
-                AND mm.fk_personne IS NOT NULL
+                {joins}
+                WHERE 1=1 AND per.fk_type_personne = 1
+                {filters}
+            ),
+            person_roles AS (
+                SELECT pr.personne_id AS person_id, pr.role AS role_rank
+                FROM filtered_parcelles fp
+                JOIN {personne_role} pr ON pr.parcelle_id = fp.id
+                JOIN personne per ON pr.personne_id = per.id
+                WHERE pr.role IN (1, 3) OR per.fk_type_personne = 1
+            ),
+            population AS (
+                SELECT
+                    person_id,
+                    MIN(role_rank) AS role_rank,
+                    MAX(CASE WHEN role_rank = 3 THEN 1 ELSE 0 END) AS is_membre
+                FROM person_roles
+                GROUP BY person_id
             )
-            SELECT DISTINCT p.id, p.date_create  -- Include date_create in SELECT
-            FROM all_persons ap
-            JOIN personne p ON ap.person_id = p.id
-            ORDER BY p.date_create DESC  -- Apply sorting here
         """
 
-        # Convert parcelle_ids to a comma-separated string
-        parcelle_ids_str = ",".join(str(id) for id in parcelle_ids)
-
-        # Execute person query with proper parameterization
-        person_ids = [
-            row[0] for row in db.execute(
-                text(person_query),
-                {"parcelle_ids": parcelle_ids_str if parcelle_ids_str else "0"}
-            ).fetchall()
-        ]
-
-        # Pagination
-        total = len(person_ids)
-        start = (page - 1) * page_size
-        end = start + page_size
-        paginated_ids = person_ids[start:end]
+        # Add filters
+        sql_filters = SqlFilters({
+            "offset": (page - 1) * page_size,
+            "page_size": page_size,
+        })
+        sql_filters.location(commune=commune, quartier=quartier, avenue=avenue, rang=rang)
+        sql_filters.search(("per.nom", "per.postnom", "per.prenom", "per.denomination", "per.sigle"), "keyword", keyword,
+                           (("per.id", "personne"),))
+        sql_filters.date_range("p.date_create", date_start, date_end)
+        params = sql_filters.params
+
+        population_cte = population_cte.format(
+            joins=build_joins(PARCELLE_JOINS, sql_filters.aliases() | {"per"}),
+            filters=sql_filters.sql(),
+            personne_role=derived_tables.source("personne_role"),
+        )
 
-        # Query to get person details (remove ORDER BY here since it's already sorted)
-        person_details_query = """
+        # One page of persons, sorted and paginated in SQL; the total comes with it
+        person_details_query = population_cte + """
             SELECT 
                 p.id, p.nom, p.postnom, p.prenom, p.fk_lien_parente,
                 p.nif, p.lieu_naissance, p.date_naissance, p.profession,
@@ -1650,64 +1563,43 @@ def get_populations(
                 av.intitule AS avenue,
                 q.intitule AS quartier,
                 c.intitule AS commune,
-                CASE
-                    WHEN p.id IN (
-                        SELECT p.fk_proprietaire
-                        FROM parcelle p
-                        WHERE p.id IN (SELECT * FROM string_split(:parcelle_ids, ','))
-                    ) THEN 'Propriétaire'
-                    WHEN p.id IN (
-                        SELECT m.fk_personne
-                        FROM bien b
-                        JOIN menage m ON b.id = m.fk_bien
-                        WHERE b.fk_parcelle IN (SELECT * FROM string_split(:parcelle_ids, ','))
-                    ) THEN 'Responsable menage'
-                    WHEN p.id IN (
-                        SELECT mm.fk_personne
-                        FROM bien b
-                        JOIN menage m ON b.id = m.fk_bien
-                        JOIN membre_menage mm ON m.id = mm.fk_menage
-                        WHERE b.fk_parcelle IN (SELECT * FROM string_split(:parcelle_ids, ','))
-                    ) THEN 'Membre menage'
+                CASE pop.role_rank
+                    WHEN 1 THEN 'Propriétaire'
+                    WHEN 2 THEN 'Responsable menage'
+                    WHEN 3 THEN 'Membre menage'
                     ELSE 'Inconnu'
                 END AS categorie,
-                CASE
-                    WHEN p.id IN (
-                        SELECT mm.fk_personne
-                        FROM bien b
-                        JOIN menage m ON b.id = m.fk_bien
-                        JOIN membre_menage mm ON m.id = mm.fk_menage
-                        WHERE b.fk_parcelle IN (SELECT * FROM string_split(:parcelle_ids, ','))
-                    ) THEN (
-                        SELECT TOP 1 CONCAT(rp.nom, ' ', rp.prenom)
-                        FROM menage m
-                        JOIN personne rp ON m.fk_personne = rp.id
-                        WHERE m.id = (
-                            SELECT TOP 1 mm.fk_menage
-                            FROM membre_menage mm
-                            WHERE mm.fk_personne = p.id
-                        )
-                    )
-                    ELSE NULL
-                END AS nom_responsable
-            FROM personne p
+                resp.nom_responsable,
+                COUNT(*) OVER() AS total_count
+            FROM population pop
+            JOIN personne p ON pop.person_id = p.id
             LEFT JOIN type_personne tp ON p.fk_type_personne = tp.id
             LEFT JOIN nationalite n ON p.fk_nationalite = n.id
             LEFT JOIN adresse a ON p.fk_adresse = a.id
             LEFT JOIN avenue av ON a.fk_avenue = av.id
             LEFT JOIN quartier q ON av.fk_quartier = q.id
             LEFT JOIN commune c ON q.fk_commune = c.id
-            WHERE p.id IN (SELECT * FROM string_split(:person_ids, ','))
+            OUTER APPLY (
+                SELECT TOP 1 CONCAT(rp.nom, ' ', rp.prenom) AS nom_responsable
+                FROM membre_menage mm
+                JOIN menage m ON mm.fk_menage = m.id
+                JOIN personne rp ON m.fk_personne = rp.id
+                WHERE pop.is_membre = 1 AND mm.fk_personne = p.id
+            ) resp
+            ORDER BY p.date_create DESC, p.id DESC
+            OFFSET :offset ROWS FETCH NEXT :page_size ROWS ONLY
         """
 
-        # Convert paginated_ids to a comma-separated string
-        paginated_ids_str = ",".join(str(id) for id in paginated_ids)
+        person_results = db.execute(text(person_details_query), params).fetchall()
 
-        # Get person details
-        person_results = db.execute(
-            text(person_details_query),
-            {"person_ids": paginated_ids_str if paginated_ids_str else "0", "parcelle_ids": parcelle_ids_str if parcelle_ids_str else "0"}
-        ).fetchall()
+        if person_results:
+            total = person_results[0].total_count
+        elif page > 1:
+            # Past the last page there is no row to carry the window count
+            count_query = population_cte + "SELECT COUNT(*) FROM population pop JOIN personne p ON pop.person_id = p.id"
+            total = db.execute(text(count_query), params).scalar()
+        else:
+            total = 0
 
         # Format results
         data = [{
@@ -1737,12 +1629,12 @@ def get_populations(
             "nom_responsable": row.nom_responsable
         } for row in person_results]
 
-        return {
+        return render_json({
             "data": data,
             "total": total,
             "page": page,
             "page_size": page_size,
-        }
+        })
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1753,7 +1645,6 @@ from sqlalchemy import select, func, or_, and_
 from sqlalchemy.orm import aliased, Session
 from sqlalchemy.sql.expression import cast
 from sqlalchemy.types import Date
-import datetime
 
 
 '''
@@ -2078,24 +1969,36 @@ async def get_cartographie_v1(
 
 @router.get("/cartographie", tags=["Cartographie"])
 def get_cartographie(
-    commune: str = Query(None),
-    quartier: str = Query(None),
-    avenue: str = Query(None),
-    rang: str = Query(None),
-    nature: str = Query(None),
-    usage: str = Query(None),
-    usage_specifique: str = Query(None),
+    commune: int = Query(None),
+    quartier: int = Query(None),
+    avenue: int = Query(None),
+    rang: int = Query(None),
+    nature: int = Query(None),
+    usage: int = Query(None),
+    usage_specifique: int = Query(None),
     type_donnee: str = Query(None),
     entity_type: str = Query(default='parcelle'),
     current_user=Depends(get_current_active_user),
-    fk_agent: Optional[str] = Query(None),
+    fk_agent: Optional[int] = Query(None),
     date_start: str = Query(..., description="Start date in format YYYY-MM-DD", regex=r"^\d{4}-\d{2}-\d{2}$"),
     date_end: str = Query(..., description="End date in format YYYY-MM-DD", regex=r"^\d{4}-\d{2}-\d{2}$"),
     db: Session = Depends(get_db),
     page: int = Query(1, ge=1),
     limit: int = Query(10, ge=1, le=10000),
+    zoom: Optional[int] = Query(None, ge=0, le=24),
+    simplify: Optional[float] = Query(None, gt=0),
+    precision: Optional[int] = Query(None, ge=0, le=10),
+    coord_encoding: str = Query("decimal", regex="^(decimal|delta)$"),
+    fields: Optional[str] = Query(None, description="Field groups to return: " + ", ".join(CARTOGRAPHIE_FIELDS)),
 ):
+    selected_fields = parse_fields(fields, CARTOGRAPHIE_FIELDS)
     try:
+        # Simplification level for the geometries (None = raw geometry)
+        simplify_level = resolve_simplify_level(zoom, simplify)
+        # Quantization of the coordinates (decimal places or integer deltas)
+        coord_precision = resolve_precision(precision)
+        delta = coord_encoding == "delta"
+
         # Parse parameters to integers/dates
         commune_id = int(commune) if commune else None
         quartier_id = int(quartier) if quartier else None
@@ -2105,8 +2008,8 @@ def get_cartographie(
         usage_id = int(usage) if usage else None
         usage_specifique_id = int(usage_specifique) if usage_specifique else None
         agent_id = int(fk_agent) if fk_agent else None
-        date_start_dt = datetime.date.fromisoformat(date_start)
-        date_end_dt = datetime.date.fromisoformat(date_end)
+        date_start_dt = date.fromisoformat(date_start)
+        date_end_dt = date.fromisoformat(date_end)
 
         if date_start_dt > date_end_dt:
             raise HTTPException(status_code=400, detail="date_start must be before or equal to date_end")
@@ -2118,36 +2021,32 @@ def get_cartographie(
         PersonneBien = aliased(Personne, name='personne_bien')
         PersonneAgent = aliased(Utilisateur, name='personne_agent')
 
-        # Common filters
+        # Common filters, on foreign keys where possible so they need no extra join;
+        # location filters read the materialized parcelle_location (app/locations.py)
+        location = parcelle_location_table()
         filters = []
 
         if commune_id:
-            filters.append(Commune.id == commune_id)
+            filters.append(location.c.fk_commune == commune_id)
         if quartier_id:
-            filters.append(Quartier.id == quartier_id)
+            filters.append(location.c.fk_quartier == quartier_id)
         if avenue_id:
-            filters.append(Avenue.id == avenue_id)
+            filters.append(location.c.fk_avenue == avenue_id)
         if rang_id:
-            filters.append(Rang.id == rang_id)
+            filters.append(Parcelle.fk_rang == rang_id)
         if nature_id:
-            filters.append(NatureBien.id == nature_id)
+            filters.append(Bien.fk_nature_bien == nature_id)
         if usage_id:
-            filters.append(Usage.id == usage_id)
+            filters.append(Bien.fk_usage == usage_id)
         if usage_specifique_id:
-            filters.append(UsageSpecifique.id == usage_specifique_id)
+            filters.append(Bien.fk_usage_specifique == usage_specifique_id)
         if agent_id:
             filters.append(or_(Bien.fk_agent == agent_id, Parcelle.fk_agent == agent_id))
 
         # Date filter: include if at least one entity's create date is within the range
         date_filter = or_(
-            and_(
-                cast(Bien.date_create, Date) >= date_start_dt,
-                cast(Bien.date_create, Date) <= date_end_dt
-            ),
-            and_(
-                cast(Parcelle.date_create, Date) >= date_start_dt,
-                cast(Parcelle.date_create, Date) <= date_end_dt
-            )
+            and_(*date_range_clauses(Bien.date_create, date_start_dt, date_end_dt)),
+            and_(*date_range_clauses(Parcelle.date_create, date_start_dt, date_end_dt)),
         )
         filters.append(date_filter)
 
@@ -2155,108 +2054,115 @@ def get_cartographie(
         if type_donnee not in ['corrected', 'collected', None]:
             raise HTTPException(status_code=400, detail="type_donnee must be 'corrected' or 'collected'")
 
+        if entity_type not in ('parcelle', 'bien'):
+            raise HTTPException(status_code=400, detail="Invalid entity_type. Must be 'parcelle' or 'bien'.")
+
+        # Only the geometry column that is returned is selected (collected or corrected)
+        parcelle_geometry = Parcelle.coordonnee_geographique if type_donnee == 'collected' else Parcelle.coord_corrige
+        bien_geometry = Bien.coordinates if type_donnee == 'collected' else Bien.coord_corrige
+
+        if type_donnee == 'corrected':
+            filters.append((Parcelle.coord_corrige if entity_type == 'parcelle' else Bien.coord_corrige).isnot(None))
+        elif type_donnee == 'collected':
+            filters.append((Parcelle.coordonnee_geographique if entity_type == 'parcelle' else Bien.coordinates).isnot(None))
+
+        # Join required by the filters, whatever the requested fields
+        join_location = bool(commune_id or quartier_id or avenue_id)
+
+        # Columns and joins of the requested field groups only
+        columns = [
+            func.count().over().label("total_rows"),
+            Bien.id.label('bien_id'),
+            Bien.date_create.label('bien_date_create'),
+        ]
         if entity_type == 'parcelle':
-            if type_donnee == 'corrected':
-                filters.append(Parcelle.coord_corrige.isnot(None))
-            elif type_donnee == 'collected':
-                filters.append(Parcelle.coordonnee_geographique.isnot(None))
-            # Select statement for parcelle entity_type
-            stmt = select(
-                func.count().over().label("total_rows"),
-                Bien.id.label('bien_id'),
-                Bien.coordinates.label('bien_coordinates'),
-                Bien.coord_corrige.label('bien_coord_corrige'),
-                Bien.superficie.label('bien_superficie'),
-                Bien.superficie_corrige.label('bien_superficie_corrige'),
-                Bien.date_create.label('bien_date_create'),
+            columns += [
                 Parcelle.id.label('parcelle_id'),
                 Parcelle.numero_parcellaire.label('parcelle_numero'),
-                Parcelle.coordonnee_geographique.label('parcelle_coordinates'),
-                Parcelle.coord_corrige.label('parcelle_coord_corrige'),
-                Parcelle.superficie_calculee.label('parcelle_superficie'),
-                Parcelle.superficie_corrige.label('parcelle_superficie_corrige'),
                 Parcelle.date_create.label('parcelle_date_create'),
-                Commune.intitule.label('commune'),
-                Quartier.intitule.label('quartier'),
-                Avenue.intitule.label('avenue'),
-                func.coalesce(
-                    func.concat(PersonneParcelle.nom, ' ', PersonneParcelle.prenom),
-                    func.concat(PersonneBien.nom, ' ', PersonneBien.prenom)
-                ).label('nom_proprietaire'),
-                func.concat(PersonneBien.nom, ' ', PersonneBien.prenom).label('bien_proprietaire'),
-                NatureBien.intitule.label('nature_bien'),
-                UniteBien.intitule.label('unite'),
-                Usage.intitule.label('usage'),
-                UsageSpecifique.intitule.label('usage_specifique'),
-                func.concat(PersonneAgent.nom, ' ', PersonneAgent.prenom).label('ajouter_par'),
-                Rang.intitule.label('rang'),
-                UniteParcelle.intitule.label('parcelle_unite')
-            ).select_from(Parcelle
-            ).outerjoin(Bien, Parcelle.id == Bien.fk_parcelle
-            ).outerjoin(Menage, Bien.id == Menage.fk_bien
-            ).outerjoin(PersonneBien, Menage.fk_personne == PersonneBien.id
-            ).outerjoin(NatureBien, Bien.fk_nature_bien == NatureBien.id
-            ).outerjoin(UniteBien, Bien.fk_unite == UniteBien.id
-            ).outerjoin(Usage, Bien.fk_usage == Usage.id
-            ).outerjoin(UsageSpecifique, Bien.fk_usage_specifique == UsageSpecifique.id
-            ).outerjoin(Adresse, Parcelle.fk_adresse == Adresse.id
-            ).outerjoin(Avenue, Adresse.fk_avenue == Avenue.id
-            ).outerjoin(Quartier, Avenue.fk_quartier == Quartier.id
-            ).outerjoin(Commune, Quartier.fk_commune == Commune.id
-            ).outerjoin(Rang, Parcelle.fk_rang == Rang.id
-            ).outerjoin(UniteParcelle, Parcelle.fk_unite == UniteParcelle.id
-            ).outerjoin(PersonneParcelle, Parcelle.fk_proprietaire == PersonneParcelle.id
-            ).outerjoin(PersonneAgent, Parcelle.fk_agent == PersonneAgent.id
-            ).where(and_(*filters)
-            ).order_by(Parcelle.id.desc())
-
-        elif entity_type == 'bien':
-            if type_donnee == 'corrected':
-                filters.append(Bien.coord_corrige.isnot(None))
-            elif type_donnee == 'collected':
-                filters.append(Bien.coordinates.isnot(None))
-            # Select statement for bien entity_type (no parcelle-specific fields unless needed for filters)
-            stmt = select(
-                Bien.id.label('bien_id'),
-                Bien.coordinates.label('bien_coordinates'),
-                Bien.coord_corrige.label('bien_coord_corrige'),
+            ]
+        if "geometry" in selected_fields:
+            columns.append(bien_geometry.label('bien_geometry'))
+            if entity_type == 'parcelle':
+                columns.append(parcelle_geometry.label('parcelle_geometry'))
+        if "superficie" in selected_fields:
+            columns += [
                 Bien.superficie.label('bien_superficie'),
                 Bien.superficie_corrige.label('bien_superficie_corrige'),
-                Bien.date_create.label('bien_date_create'),
-                func.concat(PersonneBien.nom, ' ', PersonneBien.prenom).label('bien_proprietaire'),
-                NatureBien.intitule.label('nature_bien'),
                 UniteBien.intitule.label('unite'),
+            ]
+            if entity_type == 'parcelle':
+                columns += [
+                    Parcelle.superficie_calculee.label('parcelle_superficie'),
+                    Parcelle.superficie_corrige.label('parcelle_superficie_corrige'),
+                    UniteParcelle.intitule.label('parcelle_unite'),
+                ]
+        if "proprietaire" in selected_fields:
+            # Head of the bien's first ménage, one value per bien (TOP 1): a bien with several
+            # ménages stays one row, so the rows and the total never depend on fields=
+            bien_proprietaire = (
+                select(func.concat(PersonneBien.nom, ' ', PersonneBien.prenom))
+                .select_from(Menage)
+                .join(PersonneBien, Menage.fk_personne == PersonneBien.id)
+                .where(Menage.fk_bien == Bien.id)
+                .order_by(Menage.id)
+                .limit(1)
+                .correlate(Bien)
+                .scalar_subquery()
+            )
+            columns.append(bien_proprietaire.label('bien_proprietaire'))
+            if entity_type == 'parcelle':
+                columns.append(func.coalesce(
+                    func.concat(PersonneParcelle.nom, ' ', PersonneParcelle.prenom),
+                    bien_proprietaire
+                ).label('nom_proprietaire'))
+        if "usage" in selected_fields:
+            columns += [
+                NatureBien.intitule.label('nature_bien'),
                 Usage.intitule.label('usage'),
                 UsageSpecifique.intitule.label('usage_specifique'),
-                func.concat(PersonneAgent.nom, ' ', PersonneAgent.prenom).label('ajouter_par'),
+            ]
+        if "agent" in selected_fields:
+            columns.append(func.concat(PersonneAgent.nom, ' ', PersonneAgent.prenom).label('ajouter_par'))
+        if "adresse" in selected_fields:
+            join_location = True
+            columns += [
                 Commune.intitule.label('commune'),
                 Quartier.intitule.label('quartier'),
                 Avenue.intitule.label('avenue'),
-                Rang.intitule.label('rang')
-            ).select_from(Bien
-            ).outerjoin(Parcelle, Bien.fk_parcelle == Parcelle.id
-            ).outerjoin(Adresse, Parcelle.fk_adresse == Adresse.id
-            ).outerjoin(Avenue, Adresse.fk_avenue == Avenue.id
-            ).outerjoin(Quartier, Avenue.fk_quartier == Quartier.id
-            ).outerjoin(Commune, Quartier.fk_commune == Commune.id
-            ).outerjoin(Rang, Parcelle.fk_rang == Rang.id
-            ).outerjoin(Menage, Bien.id == Menage.fk_bien
-            ).outerjoin(PersonneBien, Menage.fk_personne == PersonneBien.id
-            ).outerjoin(NatureBien, Bien.fk_nature_bien == NatureBien.id
-            ).outerjoin(UniteBien, Bien.fk_unite == UniteBien.id
-            ).outerjoin(Usage, Bien.fk_usage == Usage.id
-            ).outerjoin(UsageSpecifique, Bien.fk_usage_specifique == UsageSpecifique.id
-            ).outerjoin(PersonneAgent, Bien.fk_agent == PersonneAgent.id
-            ).where(and_(*filters)
-            ).order_by(Bien.id.desc())
+                Rang.intitule.label('rang'),
+            ]
 
+        if entity_type == 'parcelle':
+            stmt = select(*columns).select_from(Parcelle).outerjoin(Bien, Parcelle.id == Bien.fk_parcelle)
         else:
-            raise HTTPException(status_code=400, detail="Invalid entity_type. Must be 'parcelle' or 'bien'.")
+            stmt = select(*columns).select_from(Bien).outerjoin(Parcelle, Bien.fk_parcelle == Parcelle.id)
+
+        if "proprietaire" in selected_fields and entity_type == 'parcelle':
+            stmt = stmt.outerjoin(PersonneParcelle, Parcelle.fk_proprietaire == PersonneParcelle.id)
+        if "usage" in selected_fields:
+            stmt = stmt.outerjoin(NatureBien, Bien.fk_nature_bien == NatureBien.id
+            ).outerjoin(Usage, Bien.fk_usage == Usage.id
+            ).outerjoin(UsageSpecifique, Bien.fk_usage_specifique == UsageSpecifique.id)
+        if "superficie" in selected_fields:
+            stmt = stmt.outerjoin(UniteBien, Bien.fk_unite == UniteBien.id)
+            if entity_type == 'parcelle':
+                stmt = stmt.outerjoin(UniteParcelle, Parcelle.fk_unite == UniteParcelle.id)
+        if join_location:
+            stmt = stmt.outerjoin(location, location.c.parcelle_id == Parcelle.id)
+        if "adresse" in selected_fields:
+            stmt = stmt.outerjoin(Avenue, location.c.fk_avenue == Avenue.id
+            ).outerjoin(Quartier, location.c.fk_quartier == Quartier.id
+            ).outerjoin(Commune, location.c.fk_commune == Commune.id
+            ).outerjoin(Rang, Parcelle.fk_rang == Rang.id)
+        if "agent" in selected_fields:
+            agent_fk = Parcelle.fk_agent if entity_type == 'parcelle' else Bien.fk_agent
+            stmt = stmt.outerjoin(PersonneAgent, agent_fk == PersonneAgent.id)
+
+        stmt = stmt.where(and_(*filters)).order_by(
+            Parcelle.id.desc() if entity_type == 'parcelle' else Bien.id.desc()
+        )
 
-        # Execute the statement
-        # results = db.execute(stmt).fetchall()
-        
-        
         # ------------------------------------------------------------------ #
         # 6. Pagination
         # ------------------------------------------------------------------ #
@@ -2271,74 +2177,71 @@ def get_cartographie(
         # total rows (same for every row because of .over())
         total = result[0].total_rows if result else 0
 
-        # Format results based on entity_type
+        # Keys of the field groups left out of the payload
+        dropped_keys = sparse_keys(CARTOGRAPHIE_FIELD_KEYS, selected_fields)
+
+        # Format results based on entity_type, into typed structs
         data = []
-        if entity_type == 'parcelle':
-            for row in result:
-                if row.parcelle_id:
-                    parcelle_coords = row.parcelle_coordinates if type_donnee == 'collected' else (row.parcelle_coord_corrige)
-                    bien_coords = row.bien_coordinates if type_donnee == 'collected' else (row.bien_coord_corrige) if row.bien_id else None
-                    data.append({
-                        "parcelle": {
-                            "id": row.parcelle_id,
-                            "numero_parcellaire": row.parcelle_numero,
-                            "coordinates": parcelle_coords,
-                            "superficie": row.parcelle_superficie,
-                            "superficie_corrige": row.parcelle_superficie_corrige,
-                            "date_create": row.parcelle_date_create.isoformat() if row.parcelle_date_create else None,
-                            "unite": row.parcelle_unite,
-                            "rang": row.rang,
-                            "nom_proprietaire": row.nom_proprietaire
-                        },
-                        "bien": {
-                            "id": row.bien_id,
-                            "coordinates": bien_coords,
-                            "superficie": row.bien_superficie,
-                            "superficie_corrige": row.bien_superficie_corrige,
-                            "date_create": row.bien_date_create.isoformat() if row.bien_date_create else None,
-                            "nature_bien": row.nature_bien,
-                            "unite": row.unite,
-                            "usage": row.usage,
-                            "usage_specifique": row.usage_specifique,
-                            "nom_proprietaire": row.bien_proprietaire
-                        } if row.bien_id else None,
-                        "ajouter_par": row.ajouter_par,
-                        "commune": row.commune,
-                        "quartier": row.quartier,
-                        "avenue": row.avenue
-                    })
-        elif entity_type == 'bien':
-            for row in result:
-                if row.bien_id:
-                    bien_coords = row.bien_coordinates if type_donnee == 'collected' else (row.bien_coord_corrige)
-                    data.append({
-                        "bien": {
-                            "id": row.bien_id,
-                            "coordinates": bien_coords,
-                            "superficie": row.bien_superficie,
-                            "superficie_corrige": row.bien_superficie_corrige,
-                            "date_create": row.bien_date_create.isoformat() if row.bien_date_create else None,
-                            "nature_bien": row.nature_bien,
-                            "unite": row.unite,
-                            "usage": row.usage,
-                            "usage_specifique": row.usage_specifique,
-                            "nom_proprietaire": row.bien_proprietaire
-                        },
-                        "ajouter_par": row.ajouter_par,
-                        "commune": row.commune,
-                        "quartier": row.quartier,
-                        "avenue": row.avenue,
-                        "rang": row.rang
-                    })
+        for row in result:
+            col = row._mapping.get
+            if entity_type == 'parcelle' and not row.parcelle_id:
+                continue
+            if entity_type == 'bien' and not row.bien_id:
+                continue
 
-        return {
+            bien = None
+            if row.bien_id:
+                bien = CartographieBien(
+                    id=row.bien_id,
+                    coordinates=render_geometry(col('bien_geometry'), simplify_level, coord_precision, delta, "bien", row.bien_id),
+                    superficie=col('bien_superficie'),
+                    superficie_corrige=col('bien_superficie_corrige'),
+                    date_create=row.bien_date_create.isoformat() if row.bien_date_create else None,
+                    nature_bien=col('nature_bien'),
+                    unite=col('unite'),
+                    usage=col('usage'),
+                    usage_specifique=col('usage_specifique'),
+                    nom_proprietaire=col('bien_proprietaire'),
+                )
+
+            if entity_type == 'parcelle':
+                item = CartographieParcelleRow(
+                    parcelle=CartographieParcelle(
+                        id=row.parcelle_id,
+                        numero_parcellaire=row.parcelle_numero,
+                        coordinates=render_geometry(col('parcelle_geometry'), simplify_level, coord_precision, delta, "parcelle", row.parcelle_id),
+                        superficie=col('parcelle_superficie'),
+                        superficie_corrige=col('parcelle_superficie_corrige'),
+                        date_create=row.parcelle_date_create.isoformat() if row.parcelle_date_create else None,
+                        unite=col('parcelle_unite'),
+                        rang=col('rang'),
+                        nom_proprietaire=col('nom_proprietaire'),
+                    ),
+                    bien=bien,
+                    ajouter_par=col('ajouter_par'),
+                    commune=col('commune'),
+                    quartier=col('quartier'),
+                    avenue=col('avenue'),
+                )
+            else:
+                item = CartographieBienRow(
+                    bien=bien,
+                    ajouter_par=col('ajouter_par'),
+                    commune=col('commune'),
+                    quartier=col('quartier'),
+                    avenue=col('avenue'),
+                    rang=col('rang'),
+                )
+            data.append(sparse(item, dropped_keys) if dropped_keys else item)
+
+        return render_json({
             # "data": data,
             # "total": len(data),
             "data": data,
             "total": total,
             "page": page,
             "limit": limit,
-        }
+        })
 
     except ValueError as ve:
         raise HTTPException(status_code=400, detail=f"Invalid parameter format: {str(ve)}")
@@ -2346,288 +2249,116 @@ def get_cartographie(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Hit, miss and invalidation counters of the stats result cache (app/stats_cache.py)
+@router.get("/stats/cache", tags=["Stats"])
+def get_stats_cache(current_user = Depends(get_current_active_user)):
+    return stats_cache.stats()
+
+
+# Rows and memory held by the columnar dashboard snapshot (app/snapshot.py)
+@router.get("/stats/snapshot", tags=["Stats"])
+def get_stats_snapshot(current_user = Depends(get_current_active_user)):
+    return dashboard_snapshot.memory_usage()
+
+
+# Compare the columnar dashboard snapshot with the tables over an id range, next_start_id
+# continues the walk; rebuild=true starts a background rebuild when they differ
+@router.get("/stats/snapshot/check", tags=["Stats"])
+def check_stats_snapshot(
+    start_id: int = Query(0, ge=0),
+    width: int = Query(SNAPSHOT_CHECK_IDS, ge=1, le=200000),
+    rebuild: bool = Query(False),
+    current_user = Depends(get_current_active_user),
+    db: Session = Depends(get_db),
+):
+    try:
+        report = dashboard_snapshot.check(db, start_id, width)
+        if rebuild and report.get("consistent") is False:
+            # Counts come from the rollups until the rebuild is swapped in
+            dashboard_snapshot.invalidate()
+            dashboard_snapshot.warm()
+            report["rebuilding"] = True
+        return report
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # Fetch dashboard statistics
 @router.get("/stats/dashboard", tags=["Stats"])
 def get_dashboard_stats(
-    commune: str = Query(None),
-    quartier: str = Query(None),
-    avenue: str = Query(None),
-    rang: str = Query(None),
-    nature: str = Query(None),
+    commune: int = Query(None),
+    quartier: int = Query(None),
+    avenue: int = Query(None),
+    rang: int = Query(None),
+    nature: int = Query(None),
     date_start: str = Query(None),
     date_end: str = Query(None),
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db),
 ):
     try:
-        # Base query for parcelles
-        parcelle_query = """
-            SELECT p.id
-            FROM parcelle p
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            WHERE 1=1
-        """
-
-        # Base query for biens
-        bien_query = """
-            SELECT b.id
-            FROM bien b
-            LEFT JOIN parcelle p ON b.fk_parcelle = p.id
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            LEFT JOIN nature_bien nb ON b.fk_nature_bien = nb.id
-            LEFT JOIN usage u ON b.fk_usage = u.id
-            LEFT JOIN usage_specifique us ON b.fk_usage_specifique = us.id
-            WHERE 1=1
-        """
+        # Same filters, same payload until an ingestion touches its days and location
+        cache_key = stats_key(
+            "dashboard", commune=commune, quartier=quartier, avenue=avenue, rang=rang,
+            nature=nature, date_start=date_start, date_end=date_end,
+        )
+        cached = stats_cache.get(cache_key)
+        if cached is not None:
+            return render_json(cached)
+        generation = stats_cache.generation
 
         # Add filters
-        filters = []
-        params = {}
-        if commune:
-            filters.append("c.id = :commune")
-            params["commune"] = commune
-        if quartier:
-            filters.append("q.id = :quartier")
-            params["quartier"] = quartier
-        if avenue:
-            filters.append("av.id = :avenue")
-            params["avenue"] = avenue
-        if rang:
-            filters.append("r.id = :rang")
-            params["rang"] = rang
-        if nature:
-            filters.append("nb.id = :nature")
-            params["nature"] = nature
-        if date_start:
-            filters.append("CAST(p.date_create AS DATE) >= CAST(:date_start AS DATE)")
-            params["date_start"] = date_start
-        if date_end:
-            filters.append("CAST(p.date_create AS DATE) <= CAST(:date_end AS DATE)")
-            params["date_end"] = date_end
-
-        # Build final queries
-        if filters:
-            parcelle_query += " AND " + " AND ".join(filters)
-            bien_query += " AND " + " AND ".join(filters)
+        sql_filters = SqlFilters()
+        sql_filters.location(commune=commune, quartier=quartier, avenue=avenue, rang=rang)
+        sql_filters.date_range("p.date_create", date_start, date_end)
+        params = sql_filters.params
 
-        # Get total parcelles - split into accessible and inaccessible
-        parcelle_accessibility_query = f"""
-            SELECT 
-                SUM(CASE WHEN p.statut = 1 THEN 1 ELSE 0 END) AS accessible,
-                SUM(CASE WHEN p.statut = 2 THEN 1 ELSE 0 END) AS inaccessible
-            FROM ({parcelle_query}) AS filtered_parcelles
-            JOIN parcelle p ON filtered_parcelles.id = p.id
+        # Filtered parcelle ids, with only the joins the filters need
+        parcelle_query = f"""
+            SELECT p.id
+            FROM parcelle p
+            {build_joins(PARCELLE_JOINS, sql_filters.aliases())}
+            WHERE 1=1 {sql_filters.sql()}
         """
-        parcelle_accessibility = db.execute(text(parcelle_accessibility_query), params).fetchone()
-        total_parcelles_accessibles = parcelle_accessibility[0] or 0
-        total_parcelles_inaccessibles = parcelle_accessibility[1] or 0
 
-        # Get total biens
-        total_biens = db.execute(text(f"SELECT COUNT(*) FROM ({bien_query}) AS total"), params).scalar()
+        # Counts and breakdowns from the columnar snapshot (app/snapshot.py), or the daily rollups
+        parcelle_stats = dashboard_parcelle_stats(db, commune, quartier, avenue, rang, date_start, date_end)
+        bien_stats = dashboard_bien_stats(db, commune, quartier, avenue, rang, date_start, date_end, nature)
 
-        # Get total proprietaires
+        labels = label_lookup(db)
+        parcelle_totals = parcelle_stats["total"].get((), {})
+        total_parcelles_accessibles = parcelle_totals.get("accessible", 0)
+        total_parcelles_inaccessibles = parcelle_totals.get("inaccessible", 0)
+        total_biens = bien_stats["total"].get((), {}).get("total", 0)
+
+        # Distinct owners are not additive across days: counted on the parcelles
         proprietaire_query = f"""
             SELECT COUNT(DISTINCT p.fk_proprietaire)
             FROM ({parcelle_query}) AS filtered_parcelles
             JOIN parcelle p ON filtered_parcelles.id = p.id
-            WHERE p.fk_proprietaire IS NOT NULL
         """
-        total_proprietaires = db.execute(text(proprietaire_query), params).scalar()
+        total_proprietaires = db.execute(text(proprietaire_query), params).scalar() or 0
 
-        # Get total population
+        # Total population: every person attached to the filtered parcelles, whatever the role (app/roles.py)
         population_query = f"""
-            WITH filtered_parcelles AS ({parcelle_query})
-            SELECT COUNT(DISTINCT person_id) FROM (
-                SELECT p.fk_proprietaire AS person_id
-                FROM filtered_parcelles fp
-                JOIN parcelle p ON fp.id = p.id
-                WHERE p.fk_proprietaire IS NOT NULL
-                UNION
-                SELECT m.fk_personne AS person_id
-                FROM filtered_parcelles fp
-                JOIN bien b ON fp.id = b.fk_parcelle
-                JOIN menage m ON b.id = m.fk_bien
-                WHERE m.fk_personne IS NOT NULL
-                UNION
-                SELECT lb.fk_personne AS person_id
-                FROM filtered_parcelles fp
-                JOIN bien b ON fp.id = b.fk_parcelle
-                JOIN location_bien lb ON b.id = lb.fk_bien
-                WHERE lb.fk_personne IS NOT NULL
-                UNION
-                SELECT mm.fk_personne AS person_id
-                FROM filtered_parcelles fp
-                JOIN bien b ON fp.id = b.fk_parcelle
-                JOIN menage m ON b.id = m.fk_bien
-                JOIN membre_menage mm ON m.id = mm.fk_menage
-                WHERE mm.fk_personne IS NOT NULL
-            ) AS all_persons
+            SELECT COUNT(DISTINCT pr.personne_id)
+            FROM ({parcelle_query}) AS filtered_parcelles
+            JOIN {derived_tables.source("personne_role")} pr ON pr.parcelle_id = filtered_parcelles.id
         """
         total_population = db.execute(text(population_query), params).scalar()
 
-        # Get biens by nature
-        biens_by_nature_query = f"""
-            WITH all_natures AS (
-                SELECT id, intitule 
-                FROM nature_bien
-            ),
-            filtered_biens AS ({bien_query})
-            SELECT 
-                an.intitule, 
-                COUNT(fb.id) AS bien_count
-            FROM all_natures an
-            LEFT JOIN bien b ON an.id = b.fk_nature_bien
-            LEFT JOIN filtered_biens fb ON b.id = fb.id
-            GROUP BY an.id, an.intitule
-        """
-        biens_by_nature = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(biens_by_nature_query), params).fetchall()
-        }
-
-        # Get biens by rang
-        biens_by_rang_query = f"""
-            SELECT r.intitule, COUNT(b.id)
-            FROM ({bien_query}) AS filtered_biens
-            JOIN bien b ON filtered_biens.id = b.id
-            LEFT JOIN parcelle p ON b.fk_parcelle = p.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            GROUP BY r.intitule
-        """
-        biens_by_rang = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(biens_by_rang_query), params).fetchall()
-        }
-
-        # Get biens by usage
-        biens_by_usage_query = f"""
-            WITH all_usages AS (
-                SELECT id, intitule 
-                FROM usage
-            ),
-            filtered_biens AS ({bien_query})
-            SELECT 
-                au.intitule, 
-                COUNT(fb.id) AS bien_count
-            FROM all_usages au
-            LEFT JOIN bien b ON au.id = b.fk_usage
-            LEFT JOIN filtered_biens fb ON b.id = fb.id
-            GROUP BY au.id, au.intitule
-        """
-        biens_by_usage = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(biens_by_usage_query), params).fetchall()
-        }
-
-        # Get biens by usage_specifique
-        biens_by_usage_specifique_query = f"""
-            WITH all_usage_specifiques AS (
-                SELECT id, intitule 
-                FROM usage_specifique
-            ),
-            filtered_biens AS ({bien_query})
-            SELECT 
-                aus.intitule, 
-                COUNT(fb.id) AS bien_count
-            FROM all_usage_specifiques aus
-            LEFT JOIN bien b ON aus.id = b.fk_usage_specifique
-            LEFT JOIN filtered_biens fb ON b.id = fb.id
-            GROUP BY aus.id, aus.intitule
-        """
-        biens_by_usage_specifique = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(biens_by_usage_specifique_query), params).fetchall()
-        }
-
-        # Get parcelles by rang
-        parcelles_by_rang_query = f"""
-            WITH all_rangs AS (
-                SELECT id, intitule 
-                FROM rang
-            ),
-            filtered_parcelles AS ({parcelle_query})
-            SELECT 
-                ar.intitule, 
-                COUNT(fp.id) AS parcelle_count
-            FROM all_rangs ar
-            LEFT JOIN parcelle p ON ar.id = p.fk_rang
-            LEFT JOIN filtered_parcelles fp ON p.id = fp.id
-            GROUP BY ar.id, ar.intitule
-        """
-        parcelles_by_rang = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(parcelles_by_rang_query), params).fetchall()
-        }
-
-        # Get parcelles by commune
-        parcelles_by_commune_query = f"""
-            WITH all_communes AS (
-                SELECT id, intitule 
-                FROM commune 
-                WHERE fk_ville = 1
-            ),
-            filtered_parcelles AS ({parcelle_query})
-            SELECT 
-                ac.intitule, 
-                COUNT(fp.id) AS parcelle_count
-            FROM all_communes ac
-            LEFT JOIN quartier q ON ac.id = q.fk_commune
-            LEFT JOIN avenue av ON q.id = av.fk_quartier
-            LEFT JOIN adresse a ON av.id = a.fk_avenue
-            LEFT JOIN parcelle p ON a.id = p.fk_adresse
-            LEFT JOIN filtered_parcelles fp ON p.id = fp.id
-            GROUP BY ac.id, ac.intitule
-        """
-        parcelles_by_commune = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(parcelles_by_commune_query), params).fetchall()
-        }
-
-        # Get parcelles by quartier
-        parcelles_by_quartier_query = f"""
-            SELECT 
-                CONCAT(q.intitule, ' (', c.intitule, ')') AS quartier_commune, 
-                COUNT(p.id) AS count
-            FROM ({parcelle_query}) AS filtered_parcelles
-            JOIN parcelle p ON filtered_parcelles.id = p.id
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            GROUP BY q.intitule, c.intitule
-        """
-        parcelles_by_quartier = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(parcelles_by_quartier_query), params).fetchall()
-        }
+        # Every nature, usage, usage_specifique and rang is listed, 0 when it has no match
+        biens_by_nature = all_labelled_counts(bien_stats["nature"], labels["nature_bien"])
+        biens_by_rang = labelled_counts(bien_stats["rang"], labels["rang"])
+        biens_by_usage = all_labelled_counts(bien_stats["usage"], labels["usage"])
+        biens_by_usage_specifique = all_labelled_counts(bien_stats["usage_specifique"], labels["usage_specifique"])
+        parcelles_by_rang = all_labelled_counts(parcelle_stats["rang"], labels["rang"])
+        parcelles_by_commune = all_labelled_counts(parcelle_stats["commune"], labels["commune_ville"])
 
-        # Get parcelles by avenue
-        parcelles_by_avenue_query = f"""
-            SELECT 
-                CONCAT(av.intitule, ' (', c.intitule, ')') AS avenue_commune, 
-                COUNT(p.id) AS count
-            FROM ({parcelle_query}) AS filtered_parcelles
-            JOIN parcelle p ON filtered_parcelles.id = p.id
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            GROUP BY av.intitule, c.intitule
-        """
-        parcelles_by_avenue = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(parcelles_by_avenue_query), params).fetchall()
-        }
+        parcelles_by_quartier = commune_labelled_counts(parcelle_stats["quartier"], labels["quartier"], labels["commune"])
+        parcelles_by_avenue = commune_labelled_counts(parcelle_stats["avenue"], labels["avenue"], labels["commune"])
 
-        return {
+        payload = {
             "total_parcelles_accessibles": total_parcelles_accessibles,
             "total_parcelles_inaccessibles": total_parcelles_inaccessibles,
             "total_biens": total_biens,
@@ -2642,6 +2373,8 @@ def get_dashboard_stats(
             "parcelles_by_quartier": parcelles_by_quartier,
             "parcelles_by_avenue": parcelles_by_avenue,
         }
+        stats_cache.set(cache_key, payload, stats_scope(date_start, date_end, commune, quartier, avenue), generation)
+        return render_json(payload)
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -2865,20 +2598,11 @@ def get_teams(
         """
 
         # Add filters
-        filters = []
-        params = {}
-        if date_start:
-            filters.append("CAST(e.date_create AS DATE) >= CAST(:date_start AS DATE)")
-            params["date_start"] = date_start
-        if date_end:
-            filters.append("CAST(e.date_create AS DATE) <= CAST(:date_end AS DATE)")
-            params["date_end"] = date_end
-        if fk_quartier:
-            filters.append("e.fk_quartier = :fk_quartier")
-            params["fk_quartier"] = fk_quartier
-        if intitule:
-            filters.append("e.intitule LIKE :intitule")
-            params["intitule"] = f"%{intitule}%"
+        sql_filters = SqlFilters()
+        sql_filters.date_range("e.date_create", date_start, date_end)
+        sql_filters.equals("e.fk_quartier", "fk_quartier", fk_quartier)
+        sql_filters.keyword(("e.intitule",), "intitule", intitule)
+        filters, params = sql_filters.filters, sql_filters.params
 
         # Build final query
         if filters:
@@ -3118,7 +2842,8 @@ def get_personne(
 ):
     try:
         # Updated query to handle district, territoire, secteur, and village as strings
-        personne_query = """
+        personne_roles = derived_tables.source("personne_role")
+        personne_query = f"""
             SELECT 
                 p.id, p.nom, p.postnom, p.prenom, p.denomination, p.sigle, p.fk_lien_parente,
                 p.nif, p.domaine_activite, p.lieu_naissance, p.date_naissance, p.profession,
@@ -3133,34 +2858,19 @@ def get_personne(
                 q.id AS quartier_id, q.intitule AS quartier,
                 c.id AS commune_id, c.intitule AS commune,
                 pr.id AS province_id, pr.intitule AS province,
-                CASE
-                    WHEN p.id IN (
-                        SELECT p.fk_proprietaire
-                        FROM parcelle p
-                        WHERE p.fk_proprietaire = :personne_id
-                    ) THEN 'Propriétaire'
-                    WHEN p.id IN (
-                        SELECT m.fk_personne
-                        FROM bien b
-                        JOIN menage m ON b.id = m.fk_bien
-                        WHERE m.fk_personne = :personne_id
-                    ) THEN 'Responsable menage'
-                    WHEN p.id IN (
-                        SELECT mm.fk_personne
-                        FROM bien b
-                        JOIN menage m ON b.id = m.fk_bien
-                        JOIN membre_menage mm ON m.id = mm.fk_menage
-                        WHERE mm.fk_personne = :personne_id
-                    ) THEN 'Membre menage'
+                CASE (
+                    SELECT MIN(pr.role) FROM {personne_roles} pr
+                    WHERE pr.personne_id = :personne_id AND pr.role IN (1, 2, 3)
+                )
+                    WHEN 1 THEN 'Propriétaire'
+                    WHEN 2 THEN 'Responsable menage'
+                    WHEN 3 THEN 'Membre menage'
                     ELSE 'Inconnu'
                 END AS categorie,
                 CASE
-                    WHEN p.id IN (
-                        SELECT mm.fk_personne
-                        FROM bien b
-                        JOIN menage m ON b.id = m.fk_bien
-                        JOIN membre_menage mm ON m.id = mm.fk_menage
-                        WHERE mm.fk_personne = :personne_id
+                    WHEN EXISTS (
+                        SELECT 1 FROM {personne_roles} pr
+                        WHERE pr.personne_id = :personne_id AND pr.role = 3
                     ) THEN (
                         SELECT TOP 1 CONCAT(rp.nom, ' ', rp.prenom)
                         FROM menage m
@@ -3838,17 +3548,19 @@ def assign_droits_to_user(
 def get_menages(
     page: int = Query(1, ge=1),
     page_size: int = Query(10, ge=1, le=100),
-    commune: Optional[str] = Query(None),
-    quartier: Optional[str] = Query(None),
-    avenue: Optional[str] = Query(None),
-    rang: Optional[str] = Query(None),
+    commune: Optional[int] = Query(None),
+    quartier: Optional[int] = Query(None),
+    avenue: Optional[int] = Query(None),
+    rang: Optional[int] = Query(None),
     date_start: str = Query(..., description="Start date in format YYYY-MM-DD", regex=r"^\d{4}-\d{2}-\d{2}$"),
     date_end: str = Query(..., description="End date in format YYYY-MM-DD", regex=r"^\d{4}-\d{2}-\d{2}$"),
     current_user=Depends(get_current_active_user),
     db: Session = Depends(get_db),
 ):
     try:
-        # Base query to get menage information with SQL Server pagination
+        # Base query to get menage information with SQL Server pagination.
+        # COUNT(*) OVER() is computed on the filtered set before OFFSET/FETCH, so
+        # the page and the total come out of the same pass over the joins.
         menage_query = """
             SELECT 
                 m.id AS menage_id,
@@ -3858,7 +3570,8 @@ def get_menages(
                 p.telephone, n.intitule AS nationalite,
                 c.intitule AS commune, q.intitule AS quartier,
                 av.intitule AS avenue, a.numero, r.intitule AS rang,
-                fm.intitule AS lien_parente
+                fm.intitule AS lien_parente,
+                COUNT(*) OVER() AS total_count
             FROM menage m
             JOIN personne p ON m.fk_personne = p.id
             LEFT JOIN nationalite n ON p.fk_nationalite = n.id
@@ -3871,65 +3584,55 @@ def get_menages(
             LEFT JOIN rang r ON par.fk_rang = r.id
             LEFT JOIN filiation_membre fm ON p.fk_lien_parente = fm.id
             WHERE p.fk_type_personne = 1
-            AND CAST(p.date_create AS DATE) >= CAST(:date_start AS DATE)
-            AND CAST(p.date_create AS DATE) <= CAST(:date_end AS DATE)
         """
 
         # Add filters
-        filters = []
-        params = {
-            "date_start": date_start,
-            "date_end": date_end,
+        sql_filters = SqlFilters({
             "offset": (page - 1) * page_size,
             "page_size": page_size
-        }
-        if commune:
-            filters.append("c.id = :commune")
-            params["commune"] = commune
-        if quartier:
-            filters.append("q.id = :quartier")
-            params["quartier"] = quartier
-        if avenue:
-            filters.append("av.id = :avenue")
-            params["avenue"] = avenue
-        if rang:
-            filters.append("r.id = :rang")
-            params["rang"] = rang
+        })
+        sql_filters.date_range("p.date_create", date_start, date_end)
+        sql_filters.equals("c.id", "commune", commune)
+        sql_filters.equals("q.id", "quartier", quartier)
+        sql_filters.equals("av.id", "avenue", avenue)
+        sql_filters.equals("r.id", "rang", rang)
+        params = sql_filters.params
 
-        if filters:
-            menage_query += " AND " + " AND ".join(filters)
+        menage_query += sql_filters.sql()
 
         # Add SQL Server-compatible pagination
         menage_query += " ORDER BY m.id OFFSET :offset ROWS FETCH NEXT :page_size ROWS ONLY"
 
-        # Get total count for pagination
-        count_query = """
-            SELECT COUNT(*) 
-            FROM menage m
-            JOIN personne p ON m.fk_personne = p.id
-            LEFT JOIN bien b ON m.fk_bien = b.id
-            LEFT JOIN parcelle par ON b.fk_parcelle = par.id
-            LEFT JOIN adresse a ON par.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN rang r ON par.fk_rang = r.id
-            WHERE p.fk_type_personne = 1
-            AND CAST(p.date_create AS DATE) >= CAST(:date_start AS DATE)
-            AND CAST(p.date_create AS DATE) <= CAST(:date_end AS DATE)
-        """
-        if filters:
-            count_query += " AND " + " AND ".join(filters)
-
-        # Execute queries
-        total = db.execute(text(count_query), params).scalar()
         menage_results = db.execute(text(menage_query), params).fetchall()
 
-        # Get member data for each menage
-        menage_data = []
-        for menage in menage_results:
-            member_query = """
+        if menage_results:
+            total = menage_results[0].total_count
+        elif page > 1:
+            # Past the last page there is no row to carry the window count
+            count_query = """
+                SELECT COUNT(*) 
+                FROM menage m
+                JOIN personne p ON m.fk_personne = p.id
+                LEFT JOIN bien b ON m.fk_bien = b.id
+                LEFT JOIN parcelle par ON b.fk_parcelle = par.id
+                LEFT JOIN adresse a ON par.fk_adresse = a.id
+                LEFT JOIN avenue av ON a.fk_avenue = av.id
+                LEFT JOIN quartier q ON av.fk_quartier = q.id
+                LEFT JOIN commune c ON q.fk_commune = c.id
+                LEFT JOIN rang r ON par.fk_rang = r.id
+                WHERE p.fk_type_personne = 1
+            """
+            count_query += sql_filters.sql()
+            total = db.execute(text(count_query), params).scalar()
+        else:
+            total = 0
+
+        # Members of every menage on the page, in one query
+        members_by_menage = defaultdict(list)
+        if menage_results:
+            member_query = text("""
                 SELECT 
+                    mm.fk_menage AS menage_id,
                     p.id AS member_id,
                     p.nom, p.postnom, p.prenom, p.date_naissance, p.sexe,
                     p.etat_civil, p.profession, p.niveau_etude, p.lieu_naissance,
@@ -3939,9 +3642,16 @@ def get_menages(
                 JOIN personne p ON mm.fk_personne = p.id
                 LEFT JOIN nationalite n ON p.fk_nationalite = n.id
                 LEFT JOIN filiation_membre fm ON mm.fk_filiation = fm.id
-                WHERE mm.fk_menage = :menage_id
-            """
-            members = db.execute(text(member_query), {"menage_id": menage.menage_id}).fetchall()
+                WHERE mm.fk_menage IN :menage_ids
+                ORDER BY mm.fk_menage, mm.id
+            """).bindparams(bindparam("menage_ids", expanding=True))
+            menage_ids = [menage.menage_id for menage in menage_results]
+            for member in db.execute(member_query, {"menage_ids": menage_ids}):
+                members_by_menage[member.menage_id].append(member)
+
+        menage_data = []
+        for menage in menage_results:
+            members = members_by_menage.get(menage.menage_id, [])
 
             # Format menage data
             menage_data.append({
@@ -4039,120 +3749,25 @@ def get_agent_activity_stats(
          .filter(Quartier.id == agent["fk_quartier"])\
          .first()
 
-    # Get activity counts with date range filter using cast
-    parcelle_accessible_count = db.query(func.count(Parcelle.id)).filter(
-        Parcelle.fk_agent == fk_agent,
-        Parcelle.statut == 1,
-        cast(Parcelle.date_create, Date).between(date_debut, date_fin)
-    ).scalar() or 0
-
-    parcelle_inaccessible_count = db.query(func.count(Parcelle.id)).filter(
-        Parcelle.fk_agent == fk_agent,
-        Parcelle.statut == 2,
-        cast(Parcelle.date_create, Date).between(date_debut, date_fin)
-    ).scalar() or 0
-
-    bien_count = db.query(func.count(Bien.id)).filter(
-        Bien.fk_agent == fk_agent,
-        cast(Bien.date_create, Date).between(date_debut, date_fin)
-    ).scalar() or 0
-
-    menage_count = db.query(func.count(Menage.id)).filter(
-        Menage.fk_agent == fk_agent,
-        cast(Menage.date_create, Date).between(date_debut, date_fin)
-    ).scalar() or 0
-
-    membre_menage_count = db.query(func.count(MembreMenage.id)).filter(
-        MembreMenage.fk_agent == fk_agent,
-        cast(MembreMenage.date_create, Date).between(date_debut, date_fin)
-    ).scalar() or 0
-
-    # Get stats for Linear Scale Chart with date range filter using cast
-    parcelle_accessible_stats = db.query(
-        cast(Parcelle.date_create, Date).label("date"),
-        func.count(Parcelle.id).label("parcelle_accessible_count")
-    ).filter(
-        Parcelle.fk_agent == fk_agent,
-        Parcelle.statut == 1,
-        cast(Parcelle.date_create, Date).between(date_debut, date_fin)
-    ).group_by(cast(Parcelle.date_create, Date))\
-     .all()
-
-    parcelle_inaccessible_stats = db.query(
-        cast(Parcelle.date_create, Date).label("date"),
-        func.count(Parcelle.id).label("parcelle_inaccessible_count")
-    ).filter(
-        Parcelle.fk_agent == fk_agent,
-        Parcelle.statut == 2,
-        cast(Parcelle.date_create, Date).between(date_debut, date_fin)
-    ).group_by(cast(Parcelle.date_create, Date))\
-     .all()
-
-    bien_stats = db.query(
-        cast(Bien.date_create, Date).label("date"),
-        func.count(Bien.id).label("bien_count")
-    ).filter(
-        Bien.fk_agent == fk_agent,
-        cast(Bien.date_create, Date).between(date_debut, date_fin)
-    ).group_by(cast(Bien.date_create, Date))\
-     .all()
-
-    menage_stats = db.query(
-        cast(Menage.date_create, Date).label("date"),
-        func.count(Menage.id).label("menage_count")
-    ).filter(
-        Menage.fk_agent == fk_agent,
-        cast(Menage.date_create, Date).between(date_debut, date_fin)
-    ).group_by(cast(Menage.date_create, Date))\
-     .all()
-
-    membre_menage_stats = db.query(
-        cast(MembreMenage.date_create, Date).label("date"),
-        func.count(MembreMenage.id).label("membre_menage_count")
-    ).filter(
-        MembreMenage.fk_agent == fk_agent,
-        cast(MembreMenage.date_create, Date).between(date_debut, date_fin)
-    ).group_by(cast(MembreMenage.date_create, Date))\
-     .all()
-
-    # Combine all stats into a single dictionary
-    stats_dict = defaultdict(lambda: {
-        "parcelle_accessible_count": 0,
-        "parcelle_inaccessible_count": 0,
-        "bien_count": 0,
-        "menage_count": 0,
-        "membre_menage_count": 0
-    })
-
-    for stat in parcelle_accessible_stats:
-        stats_dict[stat.date]["parcelle_accessible_count"] = stat.parcelle_accessible_count
-
-    for stat in parcelle_inaccessible_stats:
-        stats_dict[stat.date]["parcelle_inaccessible_count"] = stat.parcelle_inaccessible_count
-
-    for stat in bien_stats:
-        stats_dict[stat.date]["bien_count"] = stat.bien_count
-
-    for stat in menage_stats:
-        stats_dict[stat.date]["menage_count"] = stat.menage_count
-
-    for stat in membre_menage_stats:
-        stats_dict[stat.date]["membre_menage_count"] = stat.membre_menage_count
+    cache_key = stats_key("agent-activity", fk_agent=fk_agent, date_debut=date_debut, date_fin=date_fin)
+    cached = stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = stats_cache.generation
 
-    # Convert the dictionary to a list of stats
+    # Daily counts from one pass over the stats rollups (app/activity.py); the totals are their sums
     stats = [
-        {
-            "date": date,
-            "parcelle_accessible_count": counts["parcelle_accessible_count"],
-            "parcelle_inaccessible_count": counts["parcelle_inaccessible_count"],
-            "bien_count": counts["bien_count"],
-            "menage_count": counts["menage_count"],
-            "membre_menage_count": counts["membre_menage_count"]
-        }
-        for date, counts in sorted(stats_dict.items())
+        {"date": row["jour"], **{count: row[count] for count in ACTIVITY_COUNTS}}
+        for row in agent_activity_series(db, fk_agent, date_debut, date_fin)
     ]
 
-    return {
+    parcelle_accessible_count = sum(stat["parcelle_accessible_count"] for stat in stats)
+    parcelle_inaccessible_count = sum(stat["parcelle_inaccessible_count"] for stat in stats)
+    bien_count = sum(stat["bien_count"] for stat in stats)
+    menage_count = sum(stat["menage_count"] for stat in stats)
+    membre_menage_count = sum(stat["membre_menage_count"] for stat in stats)
+
+    payload = {
         "agent": {
             "nom": agent.get("nom"),
             "postnom": agent.get("postnom"),
@@ -4169,6 +3784,8 @@ def get_agent_activity_stats(
         },
         "stats": stats
     }
+    stats_cache.set(cache_key, payload, stats_scope(date_debut, date_fin), generation)
+    return payload
 
 
 @router.get("/stats/all-agents-activity", tags=["Stats"])
@@ -4194,125 +3811,26 @@ def get_all_agents_activity_stats(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # Subquery for accessible Parcelle count (statut = 1)
-    parcelle_accessible_subquery = db.query(
-        Parcelle.fk_agent.label("agent_id"),
-        func.count(Parcelle.id).label("parcelle_accessible_count")
-    ).filter(
-        and_(
-            cast(Parcelle.date_create, Date) >= date_debut,
-            cast(Parcelle.date_create, Date) <= date_fin,
-            Parcelle.statut == 1
-        )
-    ).group_by(Parcelle.fk_agent).subquery()
-
-    # Subquery for inaccessible Parcelle count (statut = 2)
-    parcelle_inaccessible_subquery = db.query(
-        Parcelle.fk_agent.label("agent_id"),
-        func.count(Parcelle.id).label("parcelle_inaccessible_count")
-    ).filter(
-        and_(
-            cast(Parcelle.date_create, Date) >= date_debut,
-            cast(Parcelle.date_create, Date) <= date_fin,
-            Parcelle.statut == 2
-        )
-    ).group_by(Parcelle.fk_agent).subquery()
-
-    # Subquery for Bien count
-    bien_subquery = db.query(
-        Bien.fk_agent.label("agent_id"),
-        func.count(Bien.id).label("bien_count")
-    ).filter(
-        and_(
-            cast(Bien.date_create, Date) >= date_debut,
-            cast(Bien.date_create, Date) <= date_fin
-        )
-    ).group_by(Bien.fk_agent).subquery()
-
-    # Subquery for Menage count
-    menage_subquery = db.query(
-        Bien.fk_agent.label("agent_id"),
-        func.count(Menage.id).label("menage_count")
-    ).join(Menage, Menage.fk_bien == Bien.id)\
-     .filter(
-        and_(
-            cast(Menage.date_create, Date) >= date_debut,
-            cast(Menage.date_create, Date) <= date_fin
-        )
-    ).group_by(Bien.fk_agent).subquery()
-
-    # Subquery for MembreMenage count
-    membre_menage_subquery = db.query(
-        Bien.fk_agent.label("agent_id"),
-        func.count(MembreMenage.id).label("membre_menage_count")
-    ).join(Menage, Menage.fk_bien == Bien.id)\
-     .join(MembreMenage, MembreMenage.fk_menage == Menage.id)\
-     .filter(
-        and_(
-            cast(MembreMenage.date_create, Date) >= date_debut,
-            cast(MembreMenage.date_create, Date) <= date_fin
-        )
-    ).group_by(Bien.fk_agent).subquery()
-
-    # Main query - update with new fields
-    base_query = db.query(
-        Utilisateur.id.label("agent_id"),
-        Utilisateur.nom.label("nom"),
-        Utilisateur.postnom.label("postnom"),
-        Utilisateur.prenom.label("prenom"),
-        func.coalesce(parcelle_accessible_subquery.c.parcelle_accessible_count, 0).label("parcelle_accessible_count"),
-        func.coalesce(parcelle_inaccessible_subquery.c.parcelle_inaccessible_count, 0).label("parcelle_inaccessible_count"),
-        func.coalesce(bien_subquery.c.bien_count, 0).label("bien_count"),
-        func.coalesce(menage_subquery.c.menage_count, 0).label("menage_count"),
-        func.coalesce(membre_menage_subquery.c.membre_menage_count, 0).label("membre_menage_count")
-    ).outerjoin(parcelle_accessible_subquery, parcelle_accessible_subquery.c.agent_id == Utilisateur.id)\
-     .outerjoin(parcelle_inaccessible_subquery, parcelle_inaccessible_subquery.c.agent_id == Utilisateur.id)\
-     .outerjoin(bien_subquery, bien_subquery.c.agent_id == Utilisateur.id)\
-     .outerjoin(menage_subquery, menage_subquery.c.agent_id == Utilisateur.id)\
-     .outerjoin(membre_menage_subquery, membre_menage_subquery.c.agent_id == Utilisateur.id)
-
-    # Apply keyword filter
-    if keyword:
-        base_query = base_query.filter(
-            or_(
-                Utilisateur.nom.ilike(f"%{keyword}%"),
-                Utilisateur.postnom.ilike(f"%{keyword}%"),
-                Utilisateur.prenom.ilike(f"%{keyword}%")
-            )
-        )
-
-    # Add filter to exclude agents with all zero counts
-    base_query = base_query.filter(
-        or_(
-            parcelle_accessible_subquery.c.parcelle_accessible_count > 0,
-            parcelle_inaccessible_subquery.c.parcelle_inaccessible_count > 0,
-            bien_subquery.c.bien_count > 0,
-            menage_subquery.c.menage_count > 0,
-            membre_menage_subquery.c.membre_menage_count > 0
-        )
+    cache_key = stats_key(
+        "all-agents-activity", date_debut=date_debut, date_fin=date_fin,
+        keyword=keyword, page=page, page_size=page_size,
     )
+    cached = stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = stats_cache.generation
 
-    # Get total count
-    total = base_query.count()
-
-    # Apply pagination with ORDER BY
-    agent_stats = base_query.order_by(Utilisateur.nom)\
-                           .offset((page - 1) * page_size)\
-                           .limit(page_size)\
-                           .all()
+    # One page of agents, with their totals, from one pass over the stats rollups (app/activity.py)
+    total, agent_stats = agents_activity_page(db, date_debut, date_fin, keyword, page, page_size)
 
-    return {
+    payload = {
         "date_debut": date_debut,
         "date_fin": date_fin,
         "data": [
             {
-                "agent_id": stat.agent_id,
-                "agent_name": f"{stat.prenom or ''} {stat.nom or ''} {stat.postnom or ''}".strip(),
-                "parcelle_accessible_count": stat.parcelle_accessible_count,
-                "parcelle_inaccessible_count": stat.parcelle_inaccessible_count,
-                "bien_count": stat.bien_count,
-                "menage_count": stat.menage_count,
-                "membre_menage_count": stat.membre_menage_count
+                "agent_id": stat["agent_id"],
+                "agent_name": f"{stat['prenom'] or ''} {stat['nom'] or ''} {stat['postnom'] or ''}".strip(),
+                **{count: stat[count] for count in ACTIVITY_COUNTS}
             }
             for stat in agent_stats
         ],
@@ -4320,6 +3838,8 @@ def get_all_agents_activity_stats(
         "page": page,
         "page_size": page_size
     }
+    stats_cache.set(cache_key, payload, stats_scope(date_debut, date_fin), generation)
+    return payload
 
 
 @router.get("/stats/all-agents-activity-by-date", tags=["Stats"])
@@ -4327,12 +3847,14 @@ def get_all_agents_activity_stats_by_date(
     date_debut: str = Query(..., description="Start date in format YYYY-MM-DD"),
     date_fin: str = Query(..., description="End date in format YYYY-MM-DD"),
     keyword: str = Query(None, description="Search keyword for agent's name"),
+    granularity: str = Query("day", regex="^(day|week|month)$", description="Group the counts by day, week (from Monday) or month"),
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db),
 ):
     """
     Get activity statistics grouped by date and agent within a date range.
     Returns statistics grouped by date and agent with counts of Parcelle, Bien, Menage, and MembreMenage collected.
+    With a week or month granularity, each date is the first day of its week or month.
     """
     try:
         # Validate date formats
@@ -4343,112 +3865,33 @@ def get_all_agents_activity_stats_by_date(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # Query for Parcelle count by date and agent
-    parcelle_query = db.query(
-        cast(Parcelle.date_create, Date).label("date"),
-        Parcelle.fk_agent.label("agent_id"),
-        func.count(Parcelle.id).label("parcelle_count")
-    ).filter(
-        and_(
-            cast(Parcelle.date_create, Date) >= date_debut,
-            cast(Parcelle.date_create, Date) <= date_fin
-        )
-    ).group_by(cast(Parcelle.date_create, Date), Parcelle.fk_agent).subquery()
-
-    # Query for Bien count by date and agent
-    bien_query = db.query(
-        cast(Bien.date_create, Date).label("date"),
-        Bien.fk_agent.label("agent_id"),
-        func.count(Bien.id).label("bien_count")
-    ).filter(
-        and_(
-            cast(Bien.date_create, Date) >= date_debut,
-            cast(Bien.date_create, Date) <= date_fin
-        )
-    ).group_by(cast(Bien.date_create, Date), Bien.fk_agent).subquery()
-
-    # Query for Menage count by date and agent
-    menage_query = db.query(
-        cast(Menage.date_create, Date).label("date"),
-        Bien.fk_agent.label("agent_id"),
-        func.count(Menage.id).label("menage_count")
-    ).join(Bien, Menage.fk_bien == Bien.id)\
-     .filter(
-        and_(
-            cast(Menage.date_create, Date) >= date_debut,
-            cast(Menage.date_create, Date) <= date_fin
-        )
-    ).group_by(cast(Menage.date_create, Date), Bien.fk_agent).subquery()
-
-    # Query for MembreMenage count by date and agent
-    membre_menage_query = db.query(
-        cast(MembreMenage.date_create, Date).label("date"),
-        Bien.fk_agent.label("agent_id"),
-        func.count(MembreMenage.id).label("membre_menage_count")
-    ).join(Menage, MembreMenage.fk_menage == Menage.id)\
-     .join(Bien, Menage.fk_bien == Bien.id)\
-     .filter(
-        and_(
-            cast(MembreMenage.date_create, Date) >= date_debut,
-            cast(MembreMenage.date_create, Date) <= date_fin
-        )
-    ).group_by(cast(MembreMenage.date_create, Date), Bien.fk_agent).subquery()
-
-    # Main query to combine all counts by date and agent
-    base_query = db.query(
-        func.coalesce(parcelle_query.c.date, bien_query.c.date, menage_query.c.date, membre_menage_query.c.date).label("date"),
-        func.coalesce(parcelle_query.c.agent_id, bien_query.c.agent_id, menage_query.c.agent_id, membre_menage_query.c.agent_id).label("agent_id"),
-        Utilisateur.nom.label("nom"),
-        Utilisateur.postnom.label("postnom"),
-        Utilisateur.prenom.label("prenom"),
-        func.coalesce(parcelle_query.c.parcelle_count, 0).label("parcelle_count"),
-        func.coalesce(bien_query.c.bien_count, 0).label("bien_count"),
-        func.coalesce(menage_query.c.menage_count, 0).label("menage_count"),
-        func.coalesce(membre_menage_query.c.membre_menage_count, 0).label("membre_menage_count")
-    ).outerjoin(bien_query, and_(bien_query.c.date == parcelle_query.c.date, bien_query.c.agent_id == parcelle_query.c.agent_id))\
-     .outerjoin(menage_query, and_(menage_query.c.date == parcelle_query.c.date, menage_query.c.agent_id == parcelle_query.c.agent_id))\
-     .outerjoin(membre_menage_query, and_(membre_menage_query.c.date == parcelle_query.c.date, membre_menage_query.c.agent_id == parcelle_query.c.agent_id))\
-     .join(Utilisateur, Utilisateur.id == parcelle_query.c.agent_id)
-
-    # Apply keyword filter
-    if keyword:
-        base_query = base_query.filter(
-            or_(
-                Utilisateur.nom.ilike(f"%{keyword}%"),
-                Utilisateur.postnom.ilike(f"%{keyword}%"),
-                Utilisateur.prenom.ilike(f"%{keyword}%")
-            )
-        )
-
-    # Add filter to exclude agents with all zero counts
-    base_query = base_query.filter(
-        or_(
-            parcelle_query.c.parcelle_count > 0,
-            bien_query.c.bien_count > 0,
-            menage_query.c.menage_count > 0,
-            membre_menage_query.c.membre_menage_count > 0
-        )
+    cache_key = stats_key(
+        "all-agents-activity-by-date", date_debut=date_debut, date_fin=date_fin,
+        keyword=keyword, granularity=granularity,
     )
+    cached = stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = stats_cache.generation
 
-    # Execute query and format results
-    stats_by_date = base_query.order_by("date", "agent_id").all()
+    # Per (date, agent) counts of every source, from one pass over the stats rollups (app/activity.py)
+    stats_by_date = activity_by_date(db, date_debut, date_fin, keyword, granularity)
 
-    return {
+    payload = {
         "date_debut": date_debut,
         "date_fin": date_fin,
         "data": [
             {
-                "date": stat.date.strftime("%Y-%m-%d"),
-                "agent_id": stat.agent_id,
-                "agent_name": f"{stat.prenom if stat.prenom else ''} {stat.nom if stat.nom else ''} {stat.postnom if stat.postnom else ''}".strip(),
-                "parcelle_count": stat.parcelle_count,
-                "bien_count": stat.bien_count,
-                "menage_count": stat.menage_count,
-                "membre_menage_count": stat.membre_menage_count
+                "date": stat["date"].strftime("%Y-%m-%d"),
+                "agent_id": stat["agent_id"],
+                "agent_name": f"{stat['prenom'] or ''} {stat['nom'] or ''} {stat['postnom'] or ''}".strip(),
+                **{count: stat[count] for count in DATE_COUNTS}
             }
             for stat in stats_by_date
         ]
     }
+    stats_cache.set(cache_key, payload, stats_scope(date_debut, date_fin), generation)
+    return payload
 
 
 @router.get("/rapports", tags=["Rapports"])
@@ -4498,6 +3941,9 @@ def get_all_rapports(
     )
     
     if keyword:
+        candidates = search_candidates("utilisateur", keyword)
+        if candidates is not None:
+            query = query.filter(Utilisateur.id.in_(candidates))
         query = query.filter(
             or_(
                 Utilisateur.nom.ilike(f"%{keyword}%"),
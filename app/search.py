@@ -0,0 +1,137 @@
+# app/search.py
+import logging
+import os
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.sql import text, bindparam
+
+from app.database import SessionLocal
+from app.derived import derived_tables
+from app.filters import keyword_grams, ngrams
+from app.models import Personne, Rang, SearchNgram, Utilisateur
+
+logger = logging.getLogger(__name__)
+
+#
+#
+# N-GRAM SEARCH INDEX
+# search_ngram (entity, gram, entity_id) FOR THE KEYWORD FILTERS
+#
+#
+# Maintained like parcelle_location (app/locations.py): the session hooks
+# re-index the rows whose labels were inserted, changed or deleted, in the
+# transaction that writes them. rebuild_search_index() re-indexes everything
+# in id-range batches, for rows written with raw SQL. Rows that existed before
+# migration 4 filled the index are not in it: until that fill is recorded the
+# keyword filters skip the index and scan with their LIKE predicates alone
+# (see app/derived.py).
+
+SEARCH_BATCH_SIZE = int(os.getenv("SEARCH_BATCH_SIZE", 5000))
+ID_BATCH_SIZE = 1000  # SQL Server accepts at most 2100 parameters per statement
+
+# Entity -> (model, table, indexed label columns)
+SEARCH_ENTITIES = {
+    "personne": (Personne, "personne", ("nom", "postnom", "prenom", "denomination", "sigle")),
+    "utilisateur": (Utilisateur, "utilisateur", ("nom", "postnom", "prenom", "login")),
+    "rang": (Rang, "rang", ("intitule",)),
+}
+SEARCH_MODELS = {model: entity for entity, (model, _, _) in SEARCH_ENTITIES.items()}
+
+
+def search_candidates(entity: str, keyword: str):
+    """select() of the ids holding every trigram of keyword, for ORM queries
+    (`Model.id.in_(...)`); None when the index cannot answer the keyword, or is not
+    filled yet."""
+    grams = keyword_grams(keyword)
+    if not grams or not derived_tables.filled("search_ngram"):
+        return None
+    return (
+        select(SearchNgram.entity_id)
+        .where(SearchNgram.entity == entity, SearchNgram.gram.in_(grams))
+        .group_by(SearchNgram.entity_id)
+        .having(func.count() == len(grams))
+    )
+
+
+# Helper function to turn (id, label, label, ...) rows into search_ngram rows
+def _gram_rows(entity: str, rows) -> list:
+    return [
+        {"entity": entity, "gram": gram, "entity_id": row[0]}
+        for row in rows
+        for gram in set().union(*(ngrams(label) for label in row[1:]))
+    ]
+
+
+def reindex(db, entity: str, ids) -> int:
+    """Replace the trigrams of the given rows; deleted rows just lose theirs.
+    Returns the number of rows found and indexed."""
+    _, table, columns = SEARCH_ENTITIES[entity]
+    delete = text("DELETE FROM search_ngram WHERE entity = :entity AND entity_id IN :ids").bindparams(bindparam("ids", expanding=True))
+    labels = text(f"SELECT id, {', '.join(columns)} FROM {table} WHERE id IN :ids").bindparams(bindparam("ids", expanding=True))
+    insert = text("INSERT INTO search_ngram (entity, gram, entity_id) VALUES (:entity, :gram, :entity_id)")
+
+    ids = sorted(ids)
+    indexed = 0
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        chunk = ids[start:start + ID_BATCH_SIZE]
+        db.execute(delete, {"entity": entity, "ids": chunk})
+        rows = db.execute(labels, {"ids": chunk}).fetchall()
+        grams = _gram_rows(entity, rows)
+        if grams:
+            db.execute(insert, grams)
+        indexed += len(rows)
+    return indexed
+
+
+def rebuild_search_index(db, entities=None, batch_size: int = SEARCH_BATCH_SIZE, commit: bool = False) -> dict:
+    """Re-index every row of `entities` (all by default), batch_size ids at a time.
+    With commit=True (db a session) each batch commits on its own."""
+    counts = {}
+    for entity in entities or SEARCH_ENTITIES:
+        _, table, _ = SEARCH_ENTITIES[entity]
+        low, high = db.execute(text(f"SELECT MIN(id), MAX(id) FROM {table}")).fetchone()
+        counts[entity] = 0
+        if low is None:
+            continue
+        for start in range(low, high + 1, batch_size):
+            counts[entity] += reindex(db, entity, range(start, start + batch_size))
+            if commit:
+                db.commit()
+        logger.info(f"search_ngram: {entity} re-indexed up to id {high}")
+    return counts
+
+
+#
+#
+# SESSION HOOKS: ROWS WHOSE LABELS CHANGED IN A TRANSACTION ARE
+# RE-INDEXED BEFORE IT COMMITS
+#
+#
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_relabelled_rows(session, flush_context):
+    pending = session.info.setdefault("search_reindex", {})
+    for obj in list(session.new) + list(session.deleted):
+        entity = SEARCH_MODELS.get(type(obj))
+        if entity:
+            pending.setdefault(entity, set()).add(obj.id)
+    for obj in session.dirty:
+        entity = SEARCH_MODELS.get(type(obj))
+        if entity:
+            attrs = inspect(obj).attrs
+            if any(attrs[column].history.has_changes() for column in SEARCH_ENTITIES[entity][2]):
+                pending.setdefault(entity, set()).add(obj.id)
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _reindex_relabelled_rows(session):
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    pending = session.info.pop("search_reindex", None)
+    for entity, ids in (pending or {}).items():
+        reindex(session, entity, ids)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_relabelled_rows(session):
+    session.info.pop("search_reindex", None)
@@ -0,0 +1,585 @@
+# app/snapshot.py
+import logging
+import os
+import threading
+import time
+
+from itertools import chain
+
+from sqlalchemy import event
+from sqlalchemy.sql import text, bindparam
+
+from app.aggregates import stats_filters, parcelle_rollup_stats, bien_rollup_stats
+from app.database import SessionLocal
+from app.filters import day_bounds, to_datetime
+from app.models import Adresse, Bien, Parcelle
+from app.versioning import data_versions
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is listed in requirements.txt
+    np = None
+
+logger = logging.getLogger(__name__)
+
+#
+#
+# COLUMNAR DASHBOARD SNAPSHOT
+# PARCELLE AND BIEN COLUMNS IN NUMPY ARRAYS, FILTERED BY MASKS, COUNTED BY BINCOUNT
+#
+#
+# The dashboard counts only need a handful of integer columns per parcelle and
+# bien: the day of date_create, the avenue (through the adresse), the rang,
+# the statut, the nature and usages of the biens. Held in memory as one NumPy
+# array per column, a filter is a boolean mask over them and each breakdown one
+# np.bincount() of the masked keys: no round trip, no scan of the rollups.
+# Results have the shape of parcelle_rollup_stats() and bien_rollup_stats()
+# (app/aggregates.py), so the routes label them the same way.
+#
+# Like the rollups, rows keep their avenue; quartier and commune are read
+# through the avenue and quartier tables, and a bien takes the avenue and rang
+# of its parcelle, so moving an avenue or a parcelle needs no bien reload.
+# NULL foreign keys are stored as -1 (bincount slot 0), undated rows as NaT,
+# which no date bound matches.
+#
+# The API runs as a single uvicorn worker: the snapshot lives in process
+# memory. A refresh loads the rows above the highest id loaded, and reloads the
+# parcelles, biens and adresses the session hooks below saw written; a refresh
+# builds new arrays and swaps them in, so counts in progress keep the old ones.
+#
+# Full builds never run in a request: the first one is started at startup
+# (see app/main.py), the next ones every SNAPSHOT_REBUILD_SECONDS, each in a
+# background thread on a session of its own. Meanwhile the requests keep
+# refreshing and counting the previous arrays; the ids written during a build
+# are reloaded into the new arrays once they are swapped in. Until the first
+# build exists, or while the arrays are known to miss writes (invalidate(),
+# too many written ids), the counts are read from the rollups, which the
+# hooks keep current. Writes made with raw SQL bypass the hooks: the periodic
+# rebuild picks them up, and check() compares a range of ids of the snapshot
+# with the tables. Without NumPy (or with DASHBOARD_SNAPSHOT=0) the dashboard
+# counts are always read from the rollups.
+
+SNAPSHOT_ENABLED = np is not None and os.getenv("DASHBOARD_SNAPSHOT", "1") != "0"
+SNAPSHOT_REBUILD_SECONDS = int(os.getenv("SNAPSHOT_REBUILD_SECONDS", 3600))
+SNAPSHOT_MAX_PENDING = int(os.getenv("SNAPSHOT_MAX_PENDING", 100000))  # Written ids past which a full rebuild is cheaper
+SNAPSHOT_CHECK_IDS = int(os.getenv("SNAPSHOT_CHECK_IDS", 50000))  # Ids compared per table by one check()
+SNAPSHOT_TABLES = ("parcelle", "bien", "adresse", "avenue", "quartier")
+LOAD_BATCH_SIZE = 50000
+ID_BATCH_SIZE = 1000  # SQL Server accepts at most 2100 parameters per statement
+NULL = -1
+
+# Table -> (load query with a {where} slot on its ids, id column, loaded columns after the id)
+SNAPSHOT_SOURCES = {
+    "parcelle": ("""
+        SELECT p.id, p.date_create, a.fk_avenue, p.fk_rang, p.statut
+        FROM parcelle p
+        LEFT JOIN adresse a ON p.fk_adresse = a.id
+        WHERE {where}
+        ORDER BY p.id
+    """, "p.id", ("date_create", "fk_avenue", "fk_rang", "statut")),
+    "bien": ("""
+        SELECT b.id, b.date_create, b.fk_parcelle, b.fk_nature_bien, b.fk_usage, b.fk_usage_specifique
+        FROM bien b
+        WHERE {where}
+        ORDER BY b.id
+    """, "b.id", ("date_create", "fk_parcelle", "fk_nature_bien", "fk_usage", "fk_usage_specifique")),
+}
+
+# Lookup -> query of (id, parent id): avenue -> quartier, quartier -> commune
+LOOKUP_QUERIES = {
+    "avenue_quartier": "SELECT id, fk_quartier FROM avenue",
+    "quartier_commune": "SELECT id, fk_commune FROM quartier",
+}
+
+# Grouping set -> column of its key (None for the grand total); same sets as app/aggregates.py
+PARCELLE_SETS = {"total": None, "rang": "fk_rang", "commune": "fk_commune", "quartier": "fk_quartier", "avenue": "fk_avenue"}
+BIEN_SETS = {
+    "total": None,
+    "nature": "fk_nature_bien",
+    "rang": "fk_rang",
+    "usage": "fk_usage",
+    "usage_specifique": "fk_usage_specifique",
+}
+
+# Measure -> (column, value) of the rows it counts, None for every row; the conditions exclude each other
+PARCELLE_MEASURES = {"total": None, "accessible": ("statut", 1), "inaccessible": ("statut", 2)}
+BIEN_MEASURES = {"total": None}
+
+# Columns a bien takes from its parcelle
+BIEN_PARCELLE_COLUMNS = ("fk_avenue", "fk_rang", "fk_quartier", "fk_commune")
+
+
+# Helper function to reduce a date_create (datetime, date or string) to its day
+def _day(value):
+    value = to_datetime(value)
+    return value.date() if value else None
+
+
+# Helper function to turn loaded rows into one array per column, ids first
+def _columns(rows, names) -> dict:
+    columns = {"id": np.array([row[0] for row in rows], dtype=np.int64)}
+    for i, name in enumerate(names, start=1):
+        if name == "date_create":
+            columns[name] = np.array([_day(row[i]) for row in rows], dtype="datetime64[D]")
+        else:
+            columns[name] = np.array([NULL if row[i] is None else row[i] for row in rows], dtype=np.int32)
+    return columns
+
+
+# Helper function to concatenate column dicts loaded in batches
+def _concatenated(parts: list, names) -> dict:
+    if not parts:
+        return _columns([], names)
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+# Helper function to read `values[key]` for each key, NULL where the key is NULL or unknown
+def _lookup(values, keys):
+    found = np.full(keys.shape, NULL, dtype=np.int32)
+    known = (keys >= 0) & (keys < len(values))
+    found[known] = values[keys[known]]
+    return found
+
+
+# Helper function to drop the rows of `replaced` ids and add the loaded rows, keeping id order
+def _merged(columns: dict, loaded: dict, replaced) -> dict:
+    if len(replaced):
+        kept = ~np.isin(columns["id"], replaced)
+        columns = {name: column[kept] for name, column in columns.items()}
+    if not len(loaded["id"]):
+        return columns
+    in_order = not len(columns["id"]) or loaded["id"][0] > columns["id"][-1]
+    merged = {name: np.concatenate([column, loaded[name]]) for name, column in columns.items()}
+    if not in_order:
+        order = np.argsort(merged["id"], kind="stable")
+        merged = {name: column[order] for name, column in merged.items()}
+    return merged
+
+
+# Helper function to count equal values in two columns of the same rows (NaT equals NaT)
+def _same(left, right):
+    same = left == right
+    if left.dtype.kind == "M":
+        same |= np.isnat(left) & np.isnat(right)
+    return same
+
+
+class ColumnarSnapshot:
+    def __init__(self):
+        self.tables = {}  # table -> column name -> array, in id order
+        self.lookups = {}  # lookup -> parent id array indexed by id
+        self.last_ids = {table: 0 for table in SNAPSHOT_SOURCES}
+        self.versions = None
+        self.built_at = None
+        self.refreshed_at = None
+        self._pending = {"parcelle": set(), "bien": set(), "adresse": set()}
+        self._written_while_building = {"parcelle": set(), "bien": set(), "adresse": set()}
+        self._stale = False  # The arrays miss writes: counts come from the rollups until the next build
+        self._stale_requests = 0  # Bumped by every invalidate(), a build only clears the ones before it
+        self._building = False  # A background build runs
+        self._lock = threading.Lock()  # Sync routes run in a thread pool
+        self._refresh_lock = threading.Lock()  # One incremental refresh at a time, counts go on meanwhile
+
+    #
+    # LOADING
+    #
+
+    def _load_range(self, db, table: str, after_id: int, up_to_id: int = None):
+        """Rows above after_id (up to up_to_id), LOAD_BATCH_SIZE ids at a time; returns (columns, last_id)."""
+        query, id_column, names = SNAPSHOT_SOURCES[table]
+        statement = text(query.format(where=f"{id_column} > :after_id AND {id_column} <= :up_to_id"))
+        max_id = db.execute(text(f"SELECT MAX(id) FROM {table}")).scalar() or 0
+        if up_to_id is not None:
+            max_id = min(max_id, up_to_id)
+        parts = [
+            _columns(db.execute(statement, {"after_id": low, "up_to_id": low + LOAD_BATCH_SIZE}).fetchall(), names)
+            for low in range(after_id, max_id, LOAD_BATCH_SIZE)
+        ]
+        return _concatenated(parts, names), max(max_id, after_id)
+
+    def _load_ids(self, db, table: str, ids) -> dict:
+        """Rows of the given ids that still exist, ID_BATCH_SIZE ids at a time."""
+        query, id_column, names = SNAPSHOT_SOURCES[table]
+        statement = text(query.format(where=f"{id_column} IN :ids")).bindparams(bindparam("ids", expanding=True))
+        ids = sorted(ids)
+        parts = [
+            _columns(db.execute(statement, {"ids": ids[start:start + ID_BATCH_SIZE]}).fetchall(), names)
+            for start in range(0, len(ids), ID_BATCH_SIZE)
+        ]
+        return _concatenated(parts, names)
+
+    def _load_lookups(self, db) -> dict:
+        lookups = {}
+        for name, query in LOOKUP_QUERIES.items():
+            rows = db.execute(text(query)).fetchall()
+            values = np.full(max((row[0] for row in rows), default=-1) + 1, NULL, dtype=np.int32)
+            for child, parent in rows:
+                if parent is not None:
+                    values[child] = parent
+            lookups[name] = values
+        return lookups
+
+    # Helper method to resolve the quartier and commune of rows, and the parcelle columns of the biens
+    def _derive(self, tables: dict, lookups: dict) -> dict:
+        parcelles = dict(tables["parcelle"])
+        parcelles["fk_quartier"] = _lookup(lookups["avenue_quartier"], parcelles["fk_avenue"])
+        parcelles["fk_commune"] = _lookup(lookups["quartier_commune"], parcelles["fk_quartier"])
+
+        biens = dict(tables["bien"])
+        parcelle_ids, wanted = parcelles["id"], biens["fk_parcelle"]
+        if len(parcelle_ids):
+            positions = np.minimum(np.searchsorted(parcelle_ids, wanted), len(parcelle_ids) - 1)
+            found = parcelle_ids[positions] == wanted
+        else:
+            positions, found = np.zeros(len(wanted), dtype=np.int64), np.zeros(len(wanted), dtype=bool)
+        for name in BIEN_PARCELLE_COLUMNS:
+            column = np.full(len(wanted), NULL, dtype=np.int32)
+            column[found] = parcelles[name][positions[found]]
+            biens[name] = column
+        return {"parcelle": parcelles, "bien": biens}
+
+    def _load_changes(self, db, pending: dict) -> tuple:
+        """(tables, last_ids) with the new rows added and the written ones reloaded or dropped."""
+        written = {"parcelle": set(pending["parcelle"]), "bien": set(pending["bien"])}
+        if pending["adresse"]:
+            # Parcelles whose adresse moved to another avenue
+            statement = text("SELECT id FROM parcelle WHERE fk_adresse IN :ids").bindparams(bindparam("ids", expanding=True))
+            adresses = sorted(pending["adresse"])
+            for start in range(0, len(adresses), ID_BATCH_SIZE):
+                written["parcelle"].update(row[0] for row in db.execute(statement, {"ids": adresses[start:start + ID_BATCH_SIZE]}))
+
+        tables, last_ids = {}, {}
+        for table in SNAPSHOT_SOURCES:
+            # Written rows above last_id come with the new ones
+            replaced = sorted(i for i in written[table] if i <= self.last_ids[table])
+            reloaded = self._load_ids(db, table, replaced)
+            added, last_ids[table] = self._load_range(db, table, self.last_ids[table])
+            loaded = {name: np.concatenate([reloaded[name], added[name]]) for name in reloaded}
+            base = {name: self.tables[table][name] for name in reloaded}
+            tables[table] = _merged(base, loaded, np.array(replaced, dtype=np.int64))
+        return tables, last_ids
+
+    def rebuild(self):
+        """Load every row on a session of its own and swap the new arrays in:
+        counts and incremental refreshes keep the previous ones meanwhile."""
+        # Versions taken before loading: writes committed meanwhile are loaded on the next refresh
+        versions = data_versions.versions(SNAPSHOT_TABLES)
+        with self._lock:
+            stale_requests = self._stale_requests
+            self._written_while_building = {"parcelle": set(), "bien": set(), "adresse": set()}
+        db = SessionLocal()
+        try:
+            tables, last_ids = {}, {}
+            for table in SNAPSHOT_SOURCES:
+                tables[table], last_ids[table] = self._load_range(db, table, 0)
+            lookups = self._load_lookups(db)
+        finally:
+            db.close()
+        derived = self._derive(tables, lookups)
+
+        with self._lock:
+            self.tables, self.lookups = derived, lookups
+            self.last_ids, self.versions = last_ids, versions
+            self.built_at = self.refreshed_at = time.monotonic()
+            # Rows written while loading may have been read before their commit: reloaded by the next refresh
+            for table, ids in self._written_while_building.items():
+                self._pending[table].update(ids)
+            self._written_while_building = {"parcelle": set(), "bien": set(), "adresse": set()}
+            if stale_requests == self._stale_requests:
+                self._stale = False
+
+    def _rebuild_in_background(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.error("dashboard snapshot: rebuild failed, retried on the next count", exc_info=True)
+        finally:
+            with self._lock:
+                self._building = False
+
+    def warm(self):
+        """Start a full rebuild in a background thread, unless one is running."""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._rebuild_in_background, name="snapshot-rebuild", daemon=True).start()
+
+    def refresh(self, db) -> bool:
+        """Bring the arrays up to date with the committed writes, never waiting for a
+        full build (started in the background when due). Returns whether they can
+        answer: False until the first build exists or while they are stale."""
+        with self._lock:
+            built, stale = self.built_at is not None, self._stale
+            expired = not built or stale or time.monotonic() - self.built_at > SNAPSHOT_REBUILD_SECONDS
+        if expired:
+            self.warm()
+        if not built or stale:
+            return False
+
+        with self._refresh_lock:
+            # Versions and written ids taken before loading: writes committed meanwhile are loaded on the next refresh
+            versions = data_versions.versions(SNAPSHOT_TABLES)
+            with self._lock:
+                pending, self._pending = self._pending, {"parcelle": set(), "bien": set(), "adresse": set()}
+                base = self.tables
+            if versions == self.versions and not any(pending.values()):
+                return True
+
+            try:
+                tables, last_ids = self._load_changes(db, pending)
+                lookups = self._load_lookups(db)
+                derived = self._derive(tables, lookups)
+            except Exception:
+                # Keep the written ids for the next attempt
+                self.touch(pending)
+                raise
+
+            with self._lock:
+                if self.tables is not base:
+                    # A build was swapped in meanwhile: reload these ids into its arrays instead
+                    for table, ids in pending.items():
+                        self._pending[table].update(ids)
+                    return True
+                self.tables, self.lookups = derived, lookups
+                self.last_ids, self.versions = last_ids, versions
+                self.refreshed_at = time.monotonic()
+        return True
+
+    def touch(self, written: dict):
+        """Queue the parcelle, bien and adresse ids a commit wrote, reloaded by the next refresh."""
+        with self._lock:
+            for table, ids in written.items():
+                self._pending[table].update(ids)
+                if self._building:
+                    self._written_while_building[table].update(ids)
+            if sum(len(ids) for ids in self._pending.values()) > SNAPSHOT_MAX_PENDING:
+                # Too many rows to reload one by one: rebuild everything instead
+                self._pending = {"parcelle": set(), "bien": set(), "adresse": set()}
+                self._written_while_building = {"parcelle": set(), "bien": set(), "adresse": set()}
+                self._stale = True
+                self._stale_requests += 1
+
+    def invalidate(self):
+        """Count from the rollups until the next build, started by the next refresh."""
+        with self._lock:
+            self._stale = True
+            self._stale_requests += 1
+
+    #
+    # COUNTS
+    #
+
+    # Helper method to mask the rows matching the filters (column -> id, None for any) and the day range
+    def _mask(self, columns: dict, filters: dict, date_start=None, date_end=None):
+        mask = np.ones(len(columns["id"]), dtype=bool)
+        for name, value in filters.items():
+            if value is not None:
+                mask &= columns[name] == int(value)
+        start, end = day_bounds(date_start, date_end)
+        if start is not None:
+            mask &= columns["date_create"] >= np.datetime64(start, "D")
+        if end is not None:
+            mask &= columns["date_create"] <= np.datetime64(end, "D")
+        return mask
+
+    # Helper method to give the commune of each quartier or avenue id, as STATS_JOINS reads it
+    def _communes(self, lookups: dict, column: str, ids):
+        if column == "fk_avenue":
+            ids = _lookup(lookups["avenue_quartier"], ids)
+        return _lookup(lookups["quartier_commune"], ids)
+
+    def _grouped(self, columns: dict, lookups: dict, mask, sets: dict, measures: dict, only=None) -> dict:
+        """set name -> {key tuple: {measure: value}} of the masked rows, like GroupingSets.run()."""
+        # Masked once. Each row gets the code of the measure it meets (0: none), so one
+        # bincount of (key, code) pairs counts every measure of a breakdown at once
+        sets = {name: column for name, column in sets.items() if only is None or name in only}
+        conditional = [(measure, condition) for measure, condition in measures.items() if condition is not None]
+        needed = {column for column in sets.values() if column} | {column for _, (column, _) in conditional}
+        everything = mask.all()
+        selected = {name: columns[name] if everything else columns[name][mask] for name in needed}
+        codes = np.zeros(int(np.count_nonzero(mask)), dtype=np.int32)
+        for code, (_, (column, value)) in enumerate(conditional, start=1):
+            codes += (selected[column] == value) * np.int32(code)
+        width = len(conditional) + 1
+        results = {}
+        for set_name, column in sets.items():
+            if column is None:
+                per_code = np.bincount(codes, minlength=width)
+                totals = {measure: int(per_code[code]) for code, (measure, _) in enumerate(conditional, start=1)}
+                results[set_name] = {(): {"total": len(codes), **totals}}
+                continue
+            # Keys shifted by one: slot 0 counts the NULL keys
+            slots = selected[column] + 1
+            size = int(slots.max()) + 1 if len(slots) else 1
+            per_code = np.bincount(slots * width + codes, minlength=size * width).reshape(size, width)
+            counts = {"total": per_code.sum(axis=1)}
+            counts.update((measure, per_code[:, code]) for code, (measure, _) in enumerate(conditional, start=1))
+            present = np.flatnonzero(counts["total"])
+            keys = present - 1
+            values = [None if key == NULL else key for key in keys.tolist()]
+            if set_name in ("quartier", "avenue"):
+                communes = self._communes(lookups, column, keys).tolist()
+                key_tuples = zip(values, [None if commune == NULL else commune for commune in communes])
+            else:
+                key_tuples = ((value,) for value in values)
+            rows = zip(*(counts[measure][present].tolist() for measure in measures))
+            results[set_name] = {key: dict(zip(measures, row)) for key, row in zip(key_tuples, rows)}
+        return results
+
+    def parcelle_stats(self, commune=None, quartier=None, avenue=None, rang=None, date_start=None, date_end=None, only=None) -> dict:
+        """parcelle_rollup_stats() of the dashboard filters, from the arrays."""
+        with self._lock:
+            tables, lookups = self.tables, self.lookups
+        columns = tables["parcelle"]
+        filters = {"fk_commune": commune, "fk_quartier": quartier, "fk_avenue": avenue, "fk_rang": rang}
+        mask = self._mask(columns, filters, date_start, date_end)
+        return self._grouped(columns, lookups, mask, PARCELLE_SETS, PARCELLE_MEASURES, only)
+
+    def bien_stats(self, commune=None, quartier=None, avenue=None, rang=None, date_start=None, date_end=None, nature=None, only=None) -> dict:
+        """bien_rollup_stats() of the dashboard filters, from the arrays; `nature` only narrows the biens."""
+        with self._lock:
+            tables, lookups = self.tables, self.lookups
+        columns = tables["bien"]
+        filters = {"fk_commune": commune, "fk_quartier": quartier, "fk_avenue": avenue, "fk_rang": rang, "fk_nature_bien": nature}
+        mask = self._mask(columns, filters, date_start, date_end)
+        return self._grouped(columns, lookups, mask, BIEN_SETS, BIEN_MEASURES, only)
+
+    #
+    # REPORTING
+    #
+
+    def memory_usage(self) -> dict:
+        """Rows and bytes held per table and for the lookups."""
+        with self._lock:
+            tables, lookups = self.tables, self.lookups
+            built_at, refreshed_at = self.built_at, self.refreshed_at
+        now = time.monotonic()
+        usage = {
+            table: {
+                "rows": len(columns["id"]),
+                "bytes": sum(column.nbytes for column in columns.values()),
+                "columns": {name: column.nbytes for name, column in columns.items()},
+            }
+            for table, columns in tables.items()
+        }
+        usage["lookups"] = {"bytes": sum(values.nbytes for values in lookups.values())}
+        return {
+            "enabled": SNAPSHOT_ENABLED,
+            "tables": usage,
+            "total_bytes": sum(entry["bytes"] for entry in usage.values()),
+            "last_ids": dict(self.last_ids),
+            "built_seconds_ago": None if built_at is None else round(now - built_at, 1),
+            "refreshed_seconds_ago": None if refreshed_at is None else round(now - refreshed_at, 1),
+            "ready": built_at is not None and not self._stale,
+            "building": self._building,
+        }
+
+    def check(self, db, start_id: int = 0, width: int = SNAPSHOT_CHECK_IDS, sample_size: int = 20) -> dict:
+        """Compare the arrays with the tables over the ids in (start_id, start_id + width],
+        after a refresh: per table the rows missing from the snapshot, the extra ones
+        and the stale ones, with sample ids. A whole table is checked range by range,
+        from next_start_id (None past the last id). Differences come from raw SQL
+        writes; invalidate() has them rebuilt."""
+        if not SNAPSHOT_ENABLED:
+            return {"enabled": False}
+        if not self.refresh(db):
+            return {"enabled": True, "ready": False}
+        with self._lock:
+            tables, lookups = self.tables, self.lookups
+        up_to_id = start_id + width
+        report = {"enabled": True, "ready": True, "ids": {"after": start_id, "up_to": up_to_id}}
+        more = False
+        for table in SNAPSHOT_SOURCES:
+            held_ids = tables[table]["id"]
+            in_range = (held_ids > start_id) & (held_ids <= up_to_id)
+            held = {name: column[in_range] for name, column in tables[table].items()}
+            fresh, _ = self._load_range(db, table, start_id, up_to_id)
+            last_id = max(db.execute(text(f"SELECT MAX(id) FROM {table}")).scalar() or 0, int(held_ids.max(initial=0)))
+            more |= last_id > up_to_id
+            common, held_at, fresh_at = np.intersect1d(held["id"], fresh["id"], assume_unique=True, return_indices=True)
+            stale = np.zeros(len(common), dtype=bool)
+            for name in fresh:
+                stale |= ~_same(held[name][held_at], fresh[name][fresh_at])
+            missing = np.setdiff1d(fresh["id"], held["id"], assume_unique=True)
+            extra = np.setdiff1d(held["id"], fresh["id"], assume_unique=True)
+            report[table] = {
+                "rows": len(fresh["id"]),
+                "missing": len(missing),
+                "extra": len(extra),
+                "stale": int(stale.sum()),
+                "sample": {
+                    "missing": missing[:sample_size].tolist(),
+                    "extra": extra[:sample_size].tolist(),
+                    "stale": common[stale][:sample_size].tolist(),
+                },
+            }
+        fresh_lookups = self._load_lookups(db)
+        report["lookups"] = {
+            name: {"stale": not np.array_equal(lookups[name], values)} for name, values in fresh_lookups.items()
+        }
+        report["next_start_id"] = up_to_id if more else None
+        report["consistent"] = all(
+            not (entry["missing"] or entry["extra"] or entry["stale"]) for entry in (report[table] for table in SNAPSHOT_SOURCES)
+        ) and not any(entry["stale"] for entry in report["lookups"].values())
+        return report
+
+
+dashboard_snapshot = ColumnarSnapshot()
+
+
+#
+#
+# DASHBOARD COUNTS
+# FROM THE SNAPSHOT ONCE BUILT, FROM THE ROLLUPS BEFORE THAT OR WITHOUT NUMPY
+#
+#
+
+def dashboard_parcelle_stats(db, commune=None, quartier=None, avenue=None, rang=None, date_start=None, date_end=None, only=None) -> dict:
+    """parcelle_rollup_stats() of the dashboard filters; `only` names the sets to compute."""
+    if SNAPSHOT_ENABLED and dashboard_snapshot.refresh(db):
+        return dashboard_snapshot.parcelle_stats(commune, quartier, avenue, rang, date_start, date_end, only)
+    filters = stats_filters(commune, quartier, avenue, rang, date_start, date_end)
+    return parcelle_rollup_stats(db, filters, only)
+
+
+def dashboard_bien_stats(db, commune=None, quartier=None, avenue=None, rang=None, date_start=None, date_end=None, nature=None, only=None) -> dict:
+    """bien_rollup_stats() of the dashboard filters; `nature` only narrows the biens."""
+    if SNAPSHOT_ENABLED and dashboard_snapshot.refresh(db):
+        return dashboard_snapshot.bien_stats(commune, quartier, avenue, rang, date_start, date_end, nature, only)
+    filters = stats_filters(commune, quartier, avenue, rang, date_start, date_end)
+    return bien_rollup_stats(db, filters, nature, only)
+
+
+#
+#
+# SESSION HOOKS: PARCELLES, BIENS AND ADRESSES WRITTEN IN A TRANSACTION
+# ARE RELOADED BY THE NEXT REFRESH ONCE IT COMMITS
+#
+#
+
+SNAPSHOT_MODELS = {Parcelle: "parcelle", Bien: "bien", Adresse: "adresse"}
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_snapshot_rows(session, flush_context):
+    if not SNAPSHOT_ENABLED:
+        return
+    written = session.info.setdefault("snapshot_written", {"parcelle": set(), "bien": set(), "adresse": set()})
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = SNAPSHOT_MODELS.get(type(obj))
+        # New adresses only matter through the parcelles pointing at them, written as well
+        if table and obj.id is not None and not (table == "adresse" and obj in session.new):
+            written[table].add(obj.id)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _queue_snapshot_rows(session):
+    written = session.info.pop("snapshot_written", None)
+    if written and any(written.values()):
+        dashboard_snapshot.touch(written)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_snapshot_rows(session):
+    session.info.pop("snapshot_written", None)
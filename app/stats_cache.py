@@ -0,0 +1,257 @@
+# app/stats_cache.py
+import os
+import threading
+
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.sql import text, bindparam
+
+from app.cache import LRUCache
+from app.database import SessionLocal
+from app.filters import day_bounds, to_datetime
+from app.models import Adresse, Bien, Menage, MembreMenage, Parcelle
+
+#
+#
+# STATS RESULT CACHE
+# PAYLOADS KEYED BY THE NORMALIZED FILTERS, DROPPED WHEN AN INGESTION
+# TOUCHES THEIR DATE RANGE AND LOCATION
+#
+#
+# Dozens of supervisors open the same dashboards with the same filters: the
+# stats routes keep their payloads in a TTL + LRU cache. Each entry records
+# the days and the location it covers (its scope). A commit that writes
+# parcelles, biens, menages or membres drops the entries whose scope holds
+# one of the (day, avenue, quartier, commune) it touched, and only those:
+# a submission in Selembao on June 3 leaves the Ngaliema and May entries.
+#
+# A row's location is read along adresse > avenue > quartier > commune, and
+# it touches both its own day and its parcelle's. When its previous place
+# cannot be known (deleted rows, moved rows) it touches every location, on
+# every day unless it is a parcelle. The TTL bounds whatever the scopes miss
+# (agent names, personne edits).
+
+STATS_CACHE_SIZE = int(os.getenv("STATS_CACHE_SIZE", "512"))
+STATS_CACHE_TTL = int(os.getenv("STATS_CACHE_TTL", "600"))
+ID_BATCH_SIZE = 1000  # SQL Server accepts at most 2100 parameters per statement
+
+
+@dataclass(frozen=True)
+class StatsScope:
+    """Days and location a cached payload covers; None bounds and levels are unrestricted."""
+    first_day: Optional[object] = None
+    last_day: Optional[object] = None
+    avenue: Optional[int] = None
+    quartier: Optional[int] = None
+    commune: Optional[int] = None
+
+    def covers(self, day, location) -> bool:
+        """Whether a row written on `day` at `location` ((avenue, quartier, commune), None when unknown) changes the payload."""
+        if day is not None:
+            if self.first_day is not None and day < self.first_day:
+                return False
+            if self.last_day is not None and day > self.last_day:
+                return False
+        if location is None:
+            return True
+        return all(
+            wanted is None or wanted == found
+            for wanted, found in zip((self.avenue, self.quartier, self.commune), location)
+        )
+
+
+def stats_scope(date_start=None, date_end=None, commune=None, quartier=None, avenue=None) -> StatsScope:
+    first_day, last_day = day_bounds(date_start, date_end)
+    return StatsScope(first_day, last_day, avenue=avenue, quartier=quartier, commune=commune)
+
+
+def stats_key(route: str, **filters) -> tuple:
+    """(route, sorted filters) with the unset filters dropped and the dates normalized,
+    so ?commune=1&date_start=2025-06-01 and ?date_start=2025-6-1&commune=1&rang= share an entry."""
+    normalized = []
+    for name, value in filters.items():
+        if value is None or value == "":
+            continue
+        if name.startswith("date"):
+            value = to_datetime(value).date()
+        normalized.append((name, value))
+    return route, tuple(sorted(normalized))
+
+
+class StatsCache(LRUCache):
+    """LRUCache whose entries carry a StatsScope; invalidate() drops the ones a write touched."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.invalidations = 0  # Entries dropped by ingestion
+        self.generation = 0  # Bumped by every invalidation
+        self._generation_lock = threading.Lock()
+
+    def get(self, key, default=None):
+        item = super().get(key, None)
+        return default if item is None else item[1]
+
+    def set(self, key, value, scope: StatsScope = StatsScope(), generation: int = None):
+        """Store value under key; skipped when an invalidation ran since `generation`
+        (read before computing value), since value may predate that write."""
+        with self._generation_lock:
+            if generation is not None and generation != self.generation:
+                return
+            super().set(key, (scope, value))
+
+    def invalidate(self, touched) -> int:
+        """Drop the entries covering one of the touched (day, location) pairs."""
+        touched = list(touched)
+        if not touched:
+            return 0
+        with self._generation_lock:
+            self.generation += 1
+            with self._lock:
+                stale = [
+                    key for key, (_, (scope, _)) in self._data.items()
+                    if any(scope.covers(day, location) for day, location in touched)
+                ]
+                for key in stale:
+                    del self._data[key]
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def stats(self):
+        return {**super().stats(), "invalidations": self.invalidations}
+
+
+stats_cache = StatsCache(maxsize=STATS_CACHE_SIZE, ttl=STATS_CACHE_TTL)
+
+
+#
+#
+# SESSION HOOKS: THE (DAY, LOCATION) OF EVERY CENSUS ROW WRITTEN IN A
+# TRANSACTION INVALIDATE THE CACHE ONCE IT COMMITS
+#
+#
+
+# Source table -> query of the date_create of its rows by id, of their parcelle
+# (the dashboards filter on it) and of their location
+TOUCHED_QUERIES = {
+    "parcelle": """
+        SELECT p.date_create, p.date_create, a.fk_avenue, av.fk_quartier, q.fk_commune
+        FROM parcelle p
+        LEFT JOIN adresse a ON p.fk_adresse = a.id
+        LEFT JOIN avenue av ON a.fk_avenue = av.id
+        LEFT JOIN quartier q ON av.fk_quartier = q.id
+        WHERE p.id IN :ids
+    """,
+    "bien": """
+        SELECT b.date_create, p.date_create, a.fk_avenue, av.fk_quartier, q.fk_commune
+        FROM bien b
+        LEFT JOIN parcelle p ON b.fk_parcelle = p.id
+        LEFT JOIN adresse a ON p.fk_adresse = a.id
+        LEFT JOIN avenue av ON a.fk_avenue = av.id
+        LEFT JOIN quartier q ON av.fk_quartier = q.id
+        WHERE b.id IN :ids
+    """,
+    "menage": """
+        SELECT m.date_create, p.date_create, a.fk_avenue, av.fk_quartier, q.fk_commune
+        FROM menage m
+        LEFT JOIN bien b ON m.fk_bien = b.id
+        LEFT JOIN parcelle p ON b.fk_parcelle = p.id
+        LEFT JOIN adresse a ON p.fk_adresse = a.id
+        LEFT JOIN avenue av ON a.fk_avenue = av.id
+        LEFT JOIN quartier q ON av.fk_quartier = q.id
+        WHERE m.id IN :ids
+    """,
+    "membre_menage": """
+        SELECT mm.date_create, p.date_create, a.fk_avenue, av.fk_quartier, q.fk_commune
+        FROM membre_menage mm
+        LEFT JOIN menage m ON mm.fk_menage = m.id
+        LEFT JOIN bien b ON m.fk_bien = b.id
+        LEFT JOIN parcelle p ON b.fk_parcelle = p.id
+        LEFT JOIN adresse a ON p.fk_adresse = a.id
+        LEFT JOIN avenue av ON a.fk_avenue = av.id
+        LEFT JOIN quartier q ON av.fk_quartier = q.id
+        WHERE mm.id IN :ids
+    """,
+    # Parcelles of an adresse moved to another avenue: their previous location is unknown
+    "adresse": "SELECT p.date_create, p.date_create, NULL, NULL, NULL FROM parcelle p WHERE p.fk_adresse IN :ids",
+}
+
+# Model -> (source table, columns whose change moves its rows to another day or location)
+TOUCHED_MODELS = {
+    Parcelle: ("parcelle", ("date_create", "fk_adresse")),
+    Bien: ("bien", ("date_create", "fk_parcelle")),
+    Menage: ("menage", ("date_create", "fk_bien")),
+    MembreMenage: ("membre_menage", ("date_create", "fk_menage")),
+    Adresse: ("adresse", ()),
+}
+
+
+# Helper function to turn a date_create into a day
+def _day(value):
+    value = to_datetime(value)
+    return value.date() if value else None
+
+
+# Helper function to read the day a row had when it was loaded, None when unknown
+def _loaded_day(obj):
+    history = inspect(obj).attrs["date_create"].history
+    loaded = history.deleted or history.unchanged
+    return _day(loaded[0]) if loaded else None
+
+
+# Helper function to tell where a deleted or moved row was: a parcelle on its loaded
+# day, any location; the parcelle of a bien, menage or membre is gone, so any day
+def _previous_place(obj, table):
+    return (_loaded_day(obj) if table == "parcelle" else None), None
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_touched_rows(session, flush_context):
+    pending = session.info.setdefault("stats_cache_touched", {"ids": {}, "touched": set()})
+    for obj in session.new:
+        source = TOUCHED_MODELS.get(type(obj))
+        if source:
+            pending["ids"].setdefault(source[0], set()).add(obj.id)
+    for obj in session.deleted:
+        source = TOUCHED_MODELS.get(type(obj))
+        if source and source[0] != "adresse":
+            pending["touched"].add(_previous_place(obj, source[0]))
+    for obj in session.dirty:
+        source = TOUCHED_MODELS.get(type(obj))
+        if not source or not session.is_modified(obj):
+            continue
+        table, moving = source
+        pending["ids"].setdefault(table, set()).add(obj.id)
+        attrs = inspect(obj).attrs
+        if any(attrs[column].history.has_changes() for column in moving):
+            pending["touched"].add(_previous_place(obj, table))
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _resolve_touched_rows(session):
+    if session.new or session.dirty or session.deleted:
+        session.flush()
+    pending = session.info.get("stats_cache_touched")
+    if not pending:
+        return
+    for table, ids in pending.pop("ids").items():
+        query = text(TOUCHED_QUERIES[table]).bindparams(bindparam("ids", expanding=True))
+        ids = sorted(ids)
+        for start in range(0, len(ids), ID_BATCH_SIZE):
+            for row in session.execute(query, {"ids": ids[start:start + ID_BATCH_SIZE]}):
+                location = None if table == "adresse" else (row[2], row[3], row[4])
+                pending["touched"].update({(_day(row[0]), location), (_day(row[1]), location)})
+    pending["ids"] = {}
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _invalidate_touched_entries(session):
+    pending = session.info.pop("stats_cache_touched", None)
+    if pending and pending["touched"]:
+        stats_cache.invalidate(pending["touched"])
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_touched_rows(session):
+    session.info.pop("stats_cache_touched", None)
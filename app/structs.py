@@ -0,0 +1,91 @@
+# app/structs.py
+from dataclasses import dataclass
+from typing import Any, Optional
+
+#
+#
+# TYPED RESULT STRUCTS
+# ROWS OF THE HEAVY MAP ENDPOINTS, SERIALIZED NATIVELY BY app/renderers.py
+#
+#
+
+
+# /geojson (v1)
+@dataclass(slots=True)
+class AdresseStruct:
+    numero: Optional[str]
+    avenue: Optional[str]
+    quartier: Optional[str]
+    commune: Optional[str]
+
+
+@dataclass(slots=True)
+class ProprietaireStruct:
+    nom: Optional[str]
+    postnom: Optional[str]
+    prenom: Optional[str]
+    denomination: Optional[str]
+    type_personne: Optional[str]
+
+
+@dataclass(slots=True)
+class GeojsonFeature:
+    id: str
+    coordinates: Any
+    adresse: AdresseStruct
+    proprietaire: ProprietaireStruct
+    date: Optional[str]
+
+
+@dataclass(slots=True)
+class GeojsonBienFeature(GeojsonFeature):
+    recense_par: Optional[str]
+    nature: Optional[str]
+
+
+# /cartographie
+@dataclass(slots=True)
+class CartographieParcelle:
+    id: int
+    numero_parcellaire: Optional[str]
+    coordinates: Any
+    superficie: Any
+    superficie_corrige: Any
+    date_create: Optional[str]
+    unite: Optional[str]
+    rang: Optional[str]
+    nom_proprietaire: Optional[str]
+
+
+@dataclass(slots=True)
+class CartographieBien:
+    id: int
+    coordinates: Any
+    superficie: Any
+    superficie_corrige: Any
+    date_create: Optional[str]
+    nature_bien: Optional[str]
+    unite: Optional[str]
+    usage: Optional[str]
+    usage_specifique: Optional[str]
+    nom_proprietaire: Optional[str]
+
+
+@dataclass(slots=True)
+class CartographieParcelleRow:
+    parcelle: CartographieParcelle
+    bien: Optional[CartographieBien]
+    ajouter_par: Optional[str]
+    commune: Optional[str]
+    quartier: Optional[str]
+    avenue: Optional[str]
+
+
+@dataclass(slots=True)
+class CartographieBienRow:
+    bien: CartographieBien
+    ajouter_par: Optional[str]
+    commune: Optional[str]
+    quartier: Optional[str]
+    avenue: Optional[str]
+    rang: Optional[str]
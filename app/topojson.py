@@ -0,0 +1,231 @@
+# app/topojson.py
+from typing import Dict, List, Tuple
+
+from app.geometry import parse_geometry, _is_position
+
+#
+#
+# TOPOJSON ENCODER
+# SHARED-ARC TOPOLOGY FOR MAP PAGES
+#
+#
+
+# Default grid size of the quantized topology (per axis, over the bounding box)
+DEFAULT_QUANTIZATION = 100000
+
+
+# Helper function to turn a stored geometry into (type, nested [lon, lat] positions).
+# Kobo geoshapes become a single-ring Polygon (a single point becomes a Point).
+def geometry_positions(raw):
+    parsed = parse_geometry(raw)
+    if parsed is None:
+        return None
+
+    kind, value = parsed
+    if kind == "kobo":
+        ring = [(lon, lat) for lon, lat, _ in value]
+        if len(ring) == 1:
+            return "Point", ring[0]
+        if len(ring) > 2 and ring[0] != ring[-1]:
+            ring.append(ring[0])
+        return ("Polygon", [ring]) if len(ring) > 3 else ("LineString", ring)
+
+    if _is_position(value):
+        return "Point", tuple(value[:2])
+    depth, probe = 0, value
+    while isinstance(probe, list) and probe and not _is_position(probe):
+        depth += 1
+        probe = probe[0]
+    if depth == 1:
+        return "LineString", [tuple(p[:2]) for p in value]
+    if depth == 2:
+        return "Polygon", [[tuple(p[:2]) for p in ring] for ring in value]
+    if depth == 3:
+        return "MultiPolygon", [[[tuple(p[:2]) for p in ring] for ring in polygon] for polygon in value]
+    return None
+
+
+def _lines_of(geometry_type, positions):
+    """Every ring/line of a geometry, in order."""
+    if geometry_type == "LineString":
+        return [positions]
+    if geometry_type == "Polygon":
+        return list(positions)
+    if geometry_type == "MultiPolygon":
+        return [ring for polygon in positions for ring in polygon]
+    return []
+
+
+class _Topology:
+    def __init__(self, bbox, quantization):
+        x0, y0, x1, y1 = bbox
+        self.kx = (x1 - x0) / (quantization - 1) if x1 > x0 else 1.0
+        self.ky = (y1 - y0) / (quantization - 1) if y1 > y0 else 1.0
+        self.x0, self.y0 = x0, y0
+        self.arcs: List[List[Tuple[int, int]]] = []
+        self.arc_index: Dict[tuple, int] = {}
+
+    def quantize_point(self, position):
+        return (
+            int(round((position[0] - self.x0) / self.kx)),
+            int(round((position[1] - self.y0) / self.ky)),
+        )
+
+    def quantize_line(self, line):
+        points = []
+        for position in line:
+            point = self.quantize_point(position)
+            # Vertices closer than one grid cell collapse into one
+            if not points or points[-1] != point:
+                points.append(point)
+        return points
+
+    def add_arc(self, points):
+        key = tuple(points)
+        index = self.arc_index.get(key)
+        if index is not None:
+            return index
+        index = self.arc_index.get(key[::-1])
+        if index is not None:
+            # Shared edge walked in the opposite direction
+            return ~index
+        self.arc_index[key] = len(self.arcs)
+        self.arcs.append(points)
+        return len(self.arcs) - 1
+
+
+# Helper function to find the junctions: points where shared boundaries start or end.
+# A point is a junction when its neighbours differ between two visits.
+def _find_junctions(lines):
+    neighbours = {}
+    junctions = set()
+    for points, closed in lines:
+        n = len(points) - 1 if closed else len(points)
+        if n <= 0:
+            continue
+        if not closed:
+            junctions.add(points[0])
+            junctions.add(points[-1])
+        for i in range(n):
+            point = points[i]
+            if closed:
+                prev, nxt = points[i - 1 if i > 0 else n - 1], points[i + 1]
+            else:
+                prev = points[i - 1] if i > 0 else None
+                nxt = points[i + 1] if i < n - 1 else None
+            pair = frozenset((prev, nxt))
+            seen = neighbours.get(point)
+            if seen is None:
+                neighbours[point] = pair
+            elif seen != pair:
+                junctions.add(point)
+    return junctions
+
+
+def _cut(points, closed, junctions):
+    """Split a ring/line into arcs at its junctions."""
+    if closed:
+        ring = points[:-1]
+        starts = [i for i, p in enumerate(ring) if p in junctions]
+        if not starts:
+            # Isolated ring: rotate to a canonical start so identical rings dedupe
+            start = ring.index(min(ring))
+            ring = ring[start:] + ring[:start]
+            return [ring + [ring[0]]]
+        start = starts[0]
+        points = ring[start:] + ring[:start] + [ring[start]]
+
+    arcs, current = [], [points[0]]
+    for point in points[1:]:
+        current.append(point)
+        if point in junctions:
+            arcs.append(current)
+            current = [point]
+    if len(current) > 1:
+        arcs.append(current)
+    return arcs
+
+
+def _delta(points):
+    encoded, px, py = [], 0, 0
+    for x, y in points:
+        encoded.append([x - px, y - py])
+        px, py = x, y
+    return encoded
+
+
+def build_topology(objects, quantization: int = DEFAULT_QUANTIZATION):
+    """
+    Build a quantized TopoJSON topology.
+    `objects` maps an object name (e.g. "parcelles") to a list of (id, raw geometry, properties).
+    """
+    geometries = {}
+    xs, ys = [], []
+    for name, features in objects.items():
+        parsed = []
+        for feature_id, raw, properties in features:
+            geometry = geometry_positions(raw)
+            parsed.append((feature_id, geometry, properties))
+            if geometry is None:
+                continue
+            geometry_type, positions = geometry
+            lines = [[positions]] if geometry_type == "Point" else _lines_of(geometry_type, positions)
+            for line in lines:
+                for x, y in line:
+                    xs.append(x)
+                    ys.append(y)
+        geometries[name] = parsed
+
+    bbox = [min(xs), min(ys), max(xs), max(ys)] if xs else [0.0, 0.0, 0.0, 0.0]
+    topology = _Topology(bbox, quantization)
+
+    # Quantize every ring/line once, then detect the junctions over the whole page
+    quantized = {}
+    all_lines = []
+    for name, parsed in geometries.items():
+        for feature_id, geometry, _ in parsed:
+            if geometry is None or geometry[0] == "Point":
+                continue
+            geometry_type, positions = geometry
+            lines = []
+            for line in _lines_of(geometry_type, positions):
+                points = topology.quantize_line(line)
+                closed = geometry_type != "LineString" and len(points) > 3 and points[0] == points[-1]
+                lines.append((points, closed))
+            quantized[(name, feature_id)] = lines
+            all_lines.extend(lines)
+    junctions = _find_junctions(all_lines)
+
+    def line_arcs(points, closed):
+        return [topology.add_arc(arc) for arc in _cut(points, closed, junctions)]
+
+    topo_objects = {}
+    for name, parsed in geometries.items():
+        items = []
+        for feature_id, geometry, properties in parsed:
+            item = {"id": feature_id, "properties": properties}
+            if geometry is None:
+                item["type"] = None
+            elif geometry[0] == "Point":
+                item["type"] = "Point"
+                item["coordinates"] = list(topology.quantize_point(geometry[1]))
+            else:
+                geometry_type, positions = geometry
+                lines = iter([line_arcs(points, closed) for points, closed in quantized[(name, feature_id)]])
+                item["type"] = geometry_type
+                if geometry_type == "LineString":
+                    item["arcs"] = next(lines)
+                elif geometry_type == "Polygon":
+                    item["arcs"] = [next(lines) for _ in positions]
+                else:
+                    item["arcs"] = [[next(lines) for _ in polygon] for polygon in positions]
+            items.append(item)
+        topo_objects[name] = {"type": "GeometryCollection", "geometries": items}
+
+    return {
+        "type": "Topology",
+        "bbox": bbox,
+        "transform": {"scale": [topology.kx, topology.ky], "translate": [topology.x0, topology.y0]},
+        "objects": topo_objects,
+        "arcs": [_delta(arc) for arc in topology.arcs],
+    }
@@ -6,14 +6,31 @@ from io import BytesIO
 from typing import Optional, Dict, Any
 from collections import defaultdict
 
-from sqlalchemy import text, func, distinct, Date
-from sqlalchemy.orm import Session, joinedload, aliased
+from sqlalchemy import text, func, distinct, select
+from sqlalchemy.orm import Session, joinedload, aliased, defer
 from fastapi import APIRouter, Depends, HTTPException, File, Query, UploadFile, BackgroundTasks
 
 from app.auth import get_current_active_user
 from app.service import update_to_erecettes
 from app.database import get_db
-from app.models import Bien, Parcelle, Usage, UsageSpecifique, Adresse, Avenue, Quartier, Commune, Rang, NatureBien, Utilisateur, Personne, TypePersonne, Ville, Province, Unite, Menage
+from app.geometry import resolve_precision, resolve_simplify_level, render_geometry
+from app.topojson import DEFAULT_QUANTIZATION, build_topology
+from app.renderers import render_json
+from app.fieldsets import GEOJSON_FIELDS, parse_fields
+from app.filters import (
+    SqlFilters,
+    date_range_clauses,
+)
+from app.aggregates import (
+    label_lookup,
+    labelled_counts,
+    commune_labelled_counts,
+)
+from app.fanout import fan_out
+from app.locations import parcelle_location_table
+from app.snapshot import dashboard_parcelle_stats, dashboard_bien_stats
+from app.stats_cache import StatsScope, stats_cache, stats_key, stats_scope
+from app.models import Bien, Parcelle, Usage, UsageSpecifique, Adresse, Avenue, Quartier, Commune, NatureBien, Utilisateur, Personne, Ville, Unite, Menage
 
 
 router = APIRouter()
@@ -90,50 +107,52 @@ def process_geojson(geojson, db: Session):
     return updated_keys, parcelle_id, updated_bien_ids
     
 
+# Helper function to turn a /geojson page into a TopoJSON topology:
+# parcelles and biens become two objects sharing the same arcs.
+def geojson_page_to_topology(data, quantization):
+    parcelles, biens = [], []
+    for item in data:
+        parcelle = dict(item["parcelle"])
+        raw = parcelle.pop("coordinates", None)
+        properties = {key: value for key, value in item.items() if key not in ("id", "parcelle", "biens")}
+        properties.update(parcelle)
+        properties["biens"] = [b["id"] for b in item.get("biens", [])]
+        parcelles.append((item["id"], raw, properties))
+        for bien in item.get("biens", []):
+            properties = dict(bien)
+            raw = properties.pop("coordinates", None)
+            properties["parcelle"] = item["id"]
+            biens.append((bien["id"], raw, properties))
+    return build_topology({"parcelles": parcelles, "biens": biens}, quantization)
+
+
 def build_parcelle_filters_and_params(
-    commune: Optional[str] = None,
-    quartier: Optional[str] = None,
-    avenue: Optional[str] = None,
-    rang: Optional[str] = None,
+    commune: Optional[int] = None,
+    quartier: Optional[int] = None,
+    avenue: Optional[int] = None,
+    rang: Optional[int] = None,
     date_start: Optional[str] = None,
     date_end: Optional[str] = None,
 ) -> tuple[list[str], dict]:
-    filters = []
-    params = {}
-    if commune:
-        filters.append("c.id = :commune")
-        params["commune"] = commune
-    if quartier:
-        filters.append("q.id = :quartier")
-        params["quartier"] = quartier
-    if avenue:
-        filters.append("av.id = :avenue")
-        params["avenue"] = avenue
-    if rang:
-        filters.append("r.id = :rang")
-        params["rang"] = rang
-    if date_start:
-        filters.append("CAST(p.date_create AS DATE) >= CAST(:date_start AS DATE)")
-        params["date_start"] = date_start
-    if date_end:
-        filters.append("CAST(p.date_create AS DATE) <= CAST(:date_end AS DATE)")
-        params["date_end"] = date_end
-    return filters, params
+    sql_filters = SqlFilters()
+    sql_filters.location(commune=commune, quartier=quartier, avenue=avenue, rang=rang)
+    sql_filters.date_range("p.date_create", date_start, date_end)
+    return sql_filters.filters, sql_filters.params
 
 
 def build_bien_filters_and_params(
-    commune: Optional[str] = None,
-    quartier: Optional[str] = None,
-    avenue: Optional[str] = None,
-    rang: Optional[str] = None,
-    nature: Optional[str] = None,
+    commune: Optional[int] = None,
+    quartier: Optional[int] = None,
+    avenue: Optional[int] = None,
+    rang: Optional[int] = None,
+    nature: Optional[int] = None,
     date_start: Optional[str] = None,
     date_end: Optional[str] = None,
 ) -> tuple[list[str], dict]:
     filters, params = build_parcelle_filters_and_params(commune, quartier, avenue, rang, date_start, date_end)
     if nature:
-        filters.append("nb.id = :nature")
-        params["nature"] = nature
+        filters.append("b.fk_nature_bien = :nature")
+        params["nature"] = int(nature)
     return filters, params
 
 
@@ -141,15 +160,8 @@ def build_population_filters_and_params(
     date_start: Optional[str] = None,
     date_end: Optional[str] = None,
 ) -> tuple[list[str], dict]:
-    filters = []
-    params = {}
-    if date_start:
-        filters.append("CAST(per.date_create AS DATE) >= CAST(:date_start AS DATE)")
-        params["date_start"] = date_start
-    if date_end:
-        filters.append("CAST(per.date_create AS DATE) <= CAST(:date_end AS DATE)")
-        params["date_end"] = date_end
-    return filters, params
+    sql_filters = SqlFilters().date_range("per.date_create", date_start, date_end)
+    return sql_filters.filters, sql_filters.params
 
 
 @router.get("/geojson", tags=["GeoJSON"])
@@ -165,54 +177,87 @@ async def get_geojson(
     avenue: int = Query(None),
     rang: int = Query(None),
     nature: int = Query(None),
+    zoom: Optional[int] = Query(None, ge=0, le=24),
+    simplify: Optional[float] = Query(None, gt=0),
+    precision: Optional[int] = Query(None, ge=0, le=10),
+    coord_encoding: str = Query("decimal", regex="^(decimal|delta)$"),
+    format: str = Query("geojson", regex="^(geojson|topojson)$"),
+    quantization: int = Query(DEFAULT_QUANTIZATION, ge=1000, le=100000000),
+    fields: Optional[str] = Query(None, description="Field groups to return: " + ", ".join(GEOJSON_FIELDS)),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user)
 ):
+    selected_fields = parse_fields(fields, GEOJSON_FIELDS)
+    if format == "topojson":
+        # A topology is made of the geometries
+        selected_fields = selected_fields | {"geometry"}
     try:
+        # Simplification level for the geometries (None = raw geometry)
+        simplify_level = resolve_simplify_level(zoom, simplify)
+        # Quantization of the coordinates (decimal places or integer deltas)
+        coord_precision = resolve_precision(precision)
+        delta = coord_encoding == "delta"
+
+        # TopoJSON quantizes on its own grid: keep the raw (simplified) coordinates.
+        # With a quartier filter the whole quartier is returned in one topology, without pages.
+        topojson = format == "topojson"
+        if topojson:
+            coord_precision, delta = None, False
+        whole_quartier = topojson and quartier is not None
+
         # ==========================
         # 1. Parcelle IDs + filters
         # ==========================
-        parcelle_q = db.query(Parcelle.id) \
-            .outerjoin(Adresse, Parcelle.fk_adresse == Adresse.id) \
-            .outerjoin(Avenue, Adresse.fk_avenue == Avenue.id) \
-            .outerjoin(Quartier, Avenue.fk_quartier == Quartier.id) \
-            .outerjoin(Commune, Quartier.fk_commune == Commune.id) \
-            .outerjoin(Ville, Commune.fk_ville == Ville.id) \
-            .outerjoin(Province, Ville.fk_province == Province.id) \
-            .outerjoin(Rang, Parcelle.fk_rang == Rang.id)
-
-        if date_start:
-            parcelle_q = parcelle_q.filter(func.cast(Parcelle.date_create, Date) >= date_start)
-        if date_end:
-            parcelle_q = parcelle_q.filter(func.cast(Parcelle.date_create, Date) <= date_end)
-        if province: parcelle_q = parcelle_q.filter(Province.id == province)
-        if ville: parcelle_q = parcelle_q.filter(Ville.id == ville)
-        if commune: parcelle_q = parcelle_q.filter(Commune.id == commune)
-        if quartier: parcelle_q = parcelle_q.filter(Quartier.id == quartier)
-        if avenue: parcelle_q = parcelle_q.filter(Avenue.id == avenue)
-        if rang: parcelle_q = parcelle_q.filter(Rang.id == rang)
-
-        total = parcelle_q.distinct(Parcelle.id).count()
-
-        offset = (page - 1) * page_size
-        parcelle_ids = [
-            row[0] for row in parcelle_q
-            .distinct(Parcelle.id)
-            .order_by(Parcelle.id.desc())
-            .offset(offset)
-            .limit(page_size)
-            .all()
+        # Location filters read the materialized parcelle_location (one join, see app/locations.py)
+        location = parcelle_location_table()
+        parcelle_q = db.query(Parcelle.id)
+        location_filters = [
+            column == value
+            for column, value in (
+                (location.c.fk_province, province),
+                (location.c.fk_ville, ville),
+                (location.c.fk_commune, commune),
+                (location.c.fk_quartier, quartier),
+                (location.c.fk_avenue, avenue),
+            )
+            if value
         ]
-
-        if not parcelle_ids:
-            return {"data": [], "total": total, "page": page, "page_size": page_size}
+        if location_filters:
+            parcelle_q = parcelle_q.join(location, location.c.parcelle_id == Parcelle.id).filter(*location_filters)
+
+        parcelle_q = parcelle_q.filter(*date_range_clauses(Parcelle.date_create, date_start, date_end))
+        if rang: parcelle_q = parcelle_q.filter(Parcelle.fk_rang == rang)
+
+        total = parcelle_q.count()
+
+        # A whole quartier has no pages: its parcelles are selected by the filtered query itself,
+        # never as an id list (SQL Server takes at most 2100 parameters per statement)
+        pagination = {} if whole_quartier else {"page": page, "page_size": page_size}
+        if whole_quartier:
+            quartier_ids = parcelle_q.subquery()
+            in_scope = lambda column: column.in_(select(quartier_ids.c.id))
+            empty = total == 0
+        else:
+            offset = (page - 1) * page_size
+            ids_q = parcelle_q.order_by(Parcelle.id.desc()).offset(offset).limit(page_size)
+            parcelle_ids = [row[0] for row in ids_q.all()]
+            in_scope = lambda column: column.in_(parcelle_ids)
+            empty = not parcelle_ids
+
+        if empty:
+            if topojson:
+                return {"data": geojson_page_to_topology([], quantization), "total": total, **pagination}
+            return {"data": [], "total": total, **pagination}
 
         # ==========================
-        # 2. Load parcelles with relationships
+        # 2. Load parcelles with the relationships of the requested fields
         # ==========================
-        parcelles = (
-            db.query(Parcelle)
-            .options(
+        parcelle_options = []
+        if "geometry" not in selected_fields:
+            # Skip the varchar(max) geometry blobs entirely
+            parcelle_options += [defer(Parcelle.coordonnee_geographique), defer(Parcelle.coord_corrige)]
+        if "adresse" in selected_fields:
+            parcelle_options += [
                 joinedload(Parcelle.adresse)
                     .joinedload(Adresse.avenue)
                     .joinedload(Avenue.quartier)
@@ -220,10 +265,17 @@ async def get_geojson(
                     .joinedload(Commune.ville)
                     .joinedload(Ville.province),
                 joinedload(Parcelle.rang),
+            ]
+        if "proprietaire" in selected_fields:
+            parcelle_options.append(
                 joinedload(Parcelle.proprietaire)
-                    .joinedload(Personne.type_personne),
+                    .joinedload(Personne.type_personne)
             )
-            .filter(Parcelle.id.in_(parcelle_ids))
+
+        parcelles = (
+            db.query(Parcelle)
+            .options(*parcelle_options)
+            .filter(in_scope(Parcelle.id))
             .order_by(Parcelle.id.desc())
             .all()
         )
@@ -231,126 +283,160 @@ async def get_geojson(
         # ==========================
         # 3. Load Biens + propriétaire fallback via Menage (with aliases!)
         # ==========================
-        # Two different Personne tables → must be aliased
-        PersonneDirect = aliased(Personne)   # For Bien.fk_proprietaire
-        PersonneMenage = aliased(Personne)   # For Menage.fk_personne
-
-        biens_q = (
-            db.query(
-                Bien,
-                # Direct propriétaire
-                PersonneDirect.nom.label("prop_nom"),
-                PersonneDirect.postnom.label("prop_postnom"),
-                PersonneDirect.prenom.label("prop_prenom"),
-                # Via ménage
-                PersonneMenage.nom.label("menage_prop_nom"),
-                PersonneMenage.postnom.label("menage_prop_postnom"),
-                PersonneMenage.prenom.label("menage_prop_prenom"),
-                # Others
-                Utilisateur.nom.label("agent_nom"),
-                Utilisateur.prenom.label("agent_prenom"),
-                Usage.intitule.label("usage_intitule"),
-                UsageSpecifique.intitule.label("usage_specifique_intitule"),
-                NatureBien.intitule.label("nature_bien_intitule"),
-                Unite.intitule.label("unite_intitule")
-            )
-            .outerjoin(PersonneDirect, Bien.fk_proprietaire == PersonneDirect.id)
-            .outerjoin(Menage, Bien.id == Menage.fk_bien)
-            .outerjoin(PersonneMenage, Menage.fk_personne == PersonneMenage.id)
-            .outerjoin(Utilisateur, Bien.fk_agent == Utilisateur.id)
-            .outerjoin(NatureBien, Bien.fk_nature_bien == NatureBien.id)
-            .outerjoin(Usage, Bien.fk_usage == Usage.id)
-            .outerjoin(UsageSpecifique, Bien.fk_usage_specifique == UsageSpecifique.id)
-            .outerjoin(Unite, Bien.fk_unite == Unite.id)
-            .filter(Bien.fk_parcelle.in_(parcelle_ids))
-        )
-
-        if nature:
-            biens_q = biens_q.filter(NatureBien.id == nature)
-
-        biens_rows = biens_q.all()
-
-        # ==========================
-        # 4. Build biens map with correct propriétaire
-        # ==========================
         biens_map = defaultdict(list)
-        seen = set()
-
-        for row in biens_rows:
-            b = row[0]
-            if b.id in seen:
-                continue
-            seen.add(b.id)
-
-            # Priority: direct propriétaire → ménage → none
-            if any([row.prop_nom, row.prop_postnom, row.prop_prenom]):
-                prop_name = f"{row.prop_nom or ''} {row.prop_postnom or ''} {row.prop_prenom or ''}".strip()
-            elif any([row.menage_prop_nom, row.menage_prop_postnom, row.menage_prop_prenom]):
-                prop_name = f"{row.menage_prop_nom or ''} {row.menage_prop_postnom or ''} {row.menage_prop_prenom or ''}".strip()
-            else:
-                prop_name = None
-
-            biens_map[b.fk_parcelle].append({
-                "id": str(b.id),
-                "superficie": float(b.superficie) if b.superficie else None,
-                "superficie_corrige": float(b.superficie_corrige) if b.superficie_corrige else None,
-                "nombre_etage": b.nombre_etage,
-                "numero_etage": b.numero_etage,
-                "proprietaire": prop_name or None,
-                "nature_bien": row.nature_bien_intitule,
-                "unite": row.unite_intitule,
-                "usage": row.usage_intitule,
-                "usage_specifique": row.usage_specifique_intitule,
-                "coordinates": b.coord_corrige or b.coordinates,
-                "date": b.date_create.isoformat() if b.date_create else None,
-                "recense_par": f"{row.agent_prenom or ''} {row.agent_nom or ''}".strip() or None,
-            })
+
+        if "biens" in selected_fields:
+            # Two different Personne tables → must be aliased
+            PersonneDirect = aliased(Personne)   # For Bien.fk_proprietaire
+            PersonneMenage = aliased(Personne)   # For Menage.fk_personne
+
+            bien_columns = [Bien]
+            if "proprietaire" in selected_fields:
+                bien_columns += [
+                    # Direct propriétaire
+                    PersonneDirect.nom.label("prop_nom"),
+                    PersonneDirect.postnom.label("prop_postnom"),
+                    PersonneDirect.prenom.label("prop_prenom"),
+                    # Via ménage
+                    PersonneMenage.nom.label("menage_prop_nom"),
+                    PersonneMenage.postnom.label("menage_prop_postnom"),
+                    PersonneMenage.prenom.label("menage_prop_prenom"),
+                ]
+            if "agent" in selected_fields:
+                bien_columns += [Utilisateur.nom.label("agent_nom"), Utilisateur.prenom.label("agent_prenom")]
+            if "usage" in selected_fields:
+                bien_columns += [
+                    Usage.intitule.label("usage_intitule"),
+                    UsageSpecifique.intitule.label("usage_specifique_intitule"),
+                    NatureBien.intitule.label("nature_bien_intitule"),
+                ]
+            if "superficie" in selected_fields:
+                bien_columns.append(Unite.intitule.label("unite_intitule"))
+
+            biens_q = db.query(*bien_columns)
+            if "geometry" not in selected_fields:
+                biens_q = biens_q.options(defer(Bien.coordinates), defer(Bien.coord_corrige))
+            if "proprietaire" in selected_fields:
+                biens_q = biens_q \
+                    .outerjoin(PersonneDirect, Bien.fk_proprietaire == PersonneDirect.id) \
+                    .outerjoin(Menage, Bien.id == Menage.fk_bien) \
+                    .outerjoin(PersonneMenage, Menage.fk_personne == PersonneMenage.id)
+            if "agent" in selected_fields:
+                biens_q = biens_q.outerjoin(Utilisateur, Bien.fk_agent == Utilisateur.id)
+            if "usage" in selected_fields:
+                biens_q = biens_q \
+                    .outerjoin(NatureBien, Bien.fk_nature_bien == NatureBien.id) \
+                    .outerjoin(Usage, Bien.fk_usage == Usage.id) \
+                    .outerjoin(UsageSpecifique, Bien.fk_usage_specifique == UsageSpecifique.id)
+            if "superficie" in selected_fields:
+                biens_q = biens_q.outerjoin(Unite, Bien.fk_unite == Unite.id)
+
+            biens_q = biens_q.filter(in_scope(Bien.fk_parcelle))
+            if nature:
+                biens_q = biens_q.filter(Bien.fk_nature_bien == nature)
+
+            biens_rows = biens_q.all()
+
+            # ==========================
+            # 4. Build biens map with correct propriétaire
+            # ==========================
+            seen = set()
+
+            for row in biens_rows:
+                # Query(Bien) alone yields entities, not rows
+                b = row[0] if len(bien_columns) > 1 else row
+                if b.id in seen:
+                    continue
+                seen.add(b.id)
+
+                bien = {"id": str(b.id)}
+                if "superficie" in selected_fields:
+                    bien.update({
+                        "superficie": float(b.superficie) if b.superficie else None,
+                        "superficie_corrige": float(b.superficie_corrige) if b.superficie_corrige else None,
+                        "nombre_etage": b.nombre_etage,
+                        "numero_etage": b.numero_etage,
+                        "unite": row.unite_intitule,
+                    })
+                if "proprietaire" in selected_fields:
+                    # Priority: direct propriétaire → ménage → none
+                    if any([row.prop_nom, row.prop_postnom, row.prop_prenom]):
+                        prop_name = f"{row.prop_nom or ''} {row.prop_postnom or ''} {row.prop_prenom or ''}".strip()
+                    elif any([row.menage_prop_nom, row.menage_prop_postnom, row.menage_prop_prenom]):
+                        prop_name = f"{row.menage_prop_nom or ''} {row.menage_prop_postnom or ''} {row.menage_prop_prenom or ''}".strip()
+                    else:
+                        prop_name = None
+                    bien["proprietaire"] = prop_name or None
+                if "usage" in selected_fields:
+                    bien.update({
+                        "nature_bien": row.nature_bien_intitule,
+                        "usage": row.usage_intitule,
+                        "usage_specifique": row.usage_specifique_intitule,
+                    })
+                if "geometry" in selected_fields:
+                    bien["coordinates"] = render_geometry(b.coord_corrige or b.coordinates, simplify_level, coord_precision, delta, "bien", b.id)
+                bien["date"] = b.date_create.isoformat() if b.date_create else None
+                if "agent" in selected_fields:
+                    bien["recense_par"] = f"{row.agent_prenom or ''} {row.agent_nom or ''}".strip() or None
+
+                biens_map[b.fk_parcelle].append(bien)
 
         # ==========================
         # 5. Final response
         # ==========================
         data = []
         for p in parcelles:
-            adr = p.adresse
-            av = adr.avenue if adr else None
-            q = av.quartier if av else None
-            c = q.commune if q else None
-            v = c.ville if c else None
-            prov = v.province if v else None
-
-            data.append({
+            parcelle = {}
+            if "geometry" in selected_fields:
+                parcelle["coordinates"] = render_geometry(p.coord_corrige or p.coordonnee_geographique, simplify_level, coord_precision, delta, "parcelle", p.id)
+            if "adresse" in selected_fields:
+                parcelle["rang"] = p.rang.intitule if p.rang else None
+            if "superficie" in selected_fields:
+                parcelle["superficie"] = float(p.superficie_calculee) if p.superficie_calculee else None
+                parcelle["superficie_corrige"] = float(p.superficie_corrige) if p.superficie_corrige else None
+
+            item = {
                 "id": str(p.id),
-                "parcelle": {
-                    "coordinates": p.coord_corrige or p.coordonnee_geographique,
-                    "rang": p.rang.intitule if p.rang else None,
-                    "superficie": float(p.superficie_calculee) if p.superficie_calculee else None,
-                    "superficie_corrige": float(p.superficie_corrige) if p.superficie_corrige else None,
-                },
+                "parcelle": parcelle,
                 "date": p.date_create.isoformat() if p.date_create else None,
-                "adresse": {
+            }
+
+            if "adresse" in selected_fields:
+                adr = p.adresse
+                av = adr.avenue if adr else None
+                q = av.quartier if av else None
+                c = q.commune if q else None
+                v = c.ville if c else None
+                prov = v.province if v else None
+                item["adresse"] = {
                     "numero": adr.numero if adr else None,
                     "avenue": av.intitule if av else None,
                     "quartier": q.intitule if q else None,
                     "commune": c.intitule if c else None,
                     "ville": v.intitule if v else None,
                     "province": prov.intitule if prov else None,
-                },
-                "proprietaire": {
+                }
+            if "proprietaire" in selected_fields:
+                item["proprietaire"] = {
                     "nom": p.proprietaire.nom if p.proprietaire else None,
                     "postnom": p.proprietaire.postnom if p.proprietaire else None,
                     "prenom": p.proprietaire.prenom if p.proprietaire else None,
                     "denomination": p.proprietaire.denomination if p.proprietaire else None,
                     "type_personne": p.proprietaire.type_personne.intitule if p.proprietaire and p.proprietaire.type_personne else None,
-                },
-                "biens": biens_map.get(p.id, [])
-            })
+                }
+            if "biens" in selected_fields:
+                item["biens"] = biens_map.get(p.id, [])
 
-        return {
+            data.append(item)
+
+        if topojson:
+            data = geojson_page_to_topology(data, quantization)
+
+        return render_json({
             "data": data,
             "total": total,
-            "page": page,
-            "page_size": page_size,
-        }
+            **pagination,
+        })
 
     except Exception as e:
         import logging
@@ -364,6 +450,8 @@ async def get_geojson_summary(
     page_size: int = Query(10, ge=1, le=10000),
     date_start: str = Query(None),
     date_end: str = Query(None),
+    precision: Optional[int] = Query(None, ge=0, le=10),
+    coord_encoding: str = Query("decimal", regex="^(decimal|delta)$"),
     db: Session = Depends(get_db),
     current_user = Depends(get_current_active_user),
 ):
@@ -372,16 +460,17 @@ async def get_geojson_summary(
     Ordered by most recent sync first.
     """
     try:
+        # Quantization of the coordinates (decimal places or integer deltas)
+        coord_precision = resolve_precision(precision)
+        delta = coord_encoding == "delta"
+
         # ==========================
         # 1. Base query: ONLY synced parcelles
         # ==========================
         query = db.query(Parcelle).filter(Parcelle.date_erecettes.isnot(None))
 
         # Optional date_create filters
-        if date_start:
-            query = query.filter(func.cast(Parcelle.date_create, Date) >= date_start)
-        if date_end:
-            query = query.filter(func.cast(Parcelle.date_create, Date) <= date_end)
+        query = query.filter(*date_range_clauses(Parcelle.date_create, date_start, date_end))
 
         # ==========================
         # 2. Total count (only synced ones)
@@ -464,7 +553,7 @@ async def get_geojson_summary(
             data.append({
                 "id": str(p.id),
                 "parcelle": {
-                    "coordinates": p.coord_corrige or p.coordonnee_geographique,
+                    "coordinates": render_geometry(p.coord_corrige or p.coordonnee_geographique, None, coord_precision, delta, "parcelle", p.id),
                     "rang": p.rang.intitule if p.rang else None,
                     "superficie": float(p.superficie_calculee) if p.superficie_calculee else None,
                     "superficie_corrige": float(p.superficie_corrige) if p.superficie_corrige else None,
@@ -490,12 +579,12 @@ async def get_geojson_summary(
                 "nombre_biens": biens_count_map.get(p.id, 0),
             })
 
-        return {
+        return render_json({
             "data": data,
             "total": total,
             "page": page,
             "page_size": page_size,
-        }
+        })
 
     except Exception as e:
         import logging
@@ -569,278 +658,176 @@ async def import_geojson_zip(
         raise HTTPException(status_code=400, detail=f"Error processing zip file: {str(e)}")
 
 
-# Group 1: Core stats - separate simple queries for each count
+# Group 1: Core stats - rollup totals, distinct owners and population counts
 @router.get("/stats/dashboard/core", tags=["Stats"])
 def get_core_stats(
-    commune: Optional[str] = Query(None),
-    quartier: Optional[str] = Query(None),
-    avenue: Optional[str] = Query(None),
-    rang: Optional[str] = Query(None),
-    nature: Optional[str] = Query(None),
+    commune: Optional[int] = Query(None),
+    quartier: Optional[int] = Query(None),
+    avenue: Optional[int] = Query(None),
+    rang: Optional[int] = Query(None),
+    nature: Optional[int] = Query(None),
     date_start: Optional[str] = Query(None),
     date_end: Optional[str] = Query(None),
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db),
 ):
     try:
-        # Accessible parcelles
-        parcelle_filters, parcelle_params = build_parcelle_filters_and_params(commune, quartier, avenue, rang, date_start, date_end)
-        # filter_clause = " AND " + " AND ".join(parcelle_filters) if parcelle_filters else ""
-        accessible_query = f"""
-            SELECT COUNT(p.id) 
-            FROM parcelle p
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            WHERE p.statut = 1
-        """
-            # WHERE p.statut = 1{filter_clause}
-        total_parcelles_accessibles = db.execute(text(accessible_query), parcelle_params).scalar() or 0
-
-        # Inaccessible parcelles (similar, but statut=2)
-        inaccessible_query = accessible_query.replace("p.statut = 1", "p.statut = 2")
-        total_parcelles_inaccessibles = db.execute(text(inaccessible_query), parcelle_params).scalar() or 0
-
-        # Total biens
-        bien_filters, bien_params = build_bien_filters_and_params(commune, quartier, avenue, rang, nature, date_start, date_end)
-        # bien_filter_clause = " AND " + " AND ".join(bien_filters) if bien_filters else ""
-        bien_query = f"""
-            SELECT COUNT(p.id) 
+        # The core totals cover the whole census whatever the filters (their WHERE clauses
+        # have always been commented out): every filter combination shares one entry
+        cache_key = stats_key("dashboard/core")
+        cached = stats_cache.get(cache_key)
+        if cached is not None:
+            return render_json(cached)
+        generation = stats_cache.generation
+
+        # Total biens: those attached to a parcelle, as COUNT(p.id) over bien LEFT JOIN parcelle
+        # counted them; unfiltered, nature included
+        bien_query = """
+            SELECT COUNT(b.fk_parcelle)
             FROM bien b
-            LEFT JOIN parcelle p ON b.fk_parcelle = p.id
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            LEFT JOIN nature_bien nb ON b.fk_nature_bien = nb.id
-            WHERE 1=1
         """
-            # WHERE 1=1{bien_filter_clause}
-        total_biens = db.execute(text(bien_query), bien_params).scalar() or 0
-
-        # Total proprietaires: distinct fk_proprietaire from parcelles (no nature) and biens (with nature)
-        parcelle_subquery = f"""
-            SELECT p.id 
-            FROM parcelle p
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            WHERE 1=1
-        """
-            # WHERE 1=1{filter_clause}
-            
-        # For biens subquery, remove nature filter for proprietaires
-        parcelle_bien_filters = [f for f in bien_filters if "nb.id" not in f]
-        parcelle_bien_params = {k: v for k, v in bien_params.items() if k != "nature"}
-        parcelle_bien_filter_clause = " AND " + " AND ".join(parcelle_bien_filters) if parcelle_bien_filters else ""
-        bien_subquery = f"""
-            SELECT b.id 
-            FROM bien b
-            LEFT JOIN parcelle p ON b.fk_parcelle = p.id
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            WHERE 1=1
-        """
-            # WHERE 1=1{parcelle_bien_filter_clause}
-            
-        proprietaire_query = f"""
+
+        # Total proprietaires: distinct fk_proprietaire over parcelles and biens
+        proprietaire_query = """
             SELECT COUNT(DISTINCT person_id)
             FROM (
                 SELECT p.fk_proprietaire AS person_id
-                FROM ({parcelle_subquery}) fp
-                JOIN parcelle p ON fp.id = p.id
+                FROM parcelle p
                 WHERE p.fk_proprietaire IS NOT NULL
                 UNION
                 SELECT b.fk_proprietaire AS person_id
-                FROM ({bien_subquery}) fb
-                JOIN bien b ON fb.id = b.id
+                FROM bien b
                 WHERE b.fk_proprietaire IS NOT NULL
             ) AS all_owners
         """
-        all_params = {**parcelle_params, **parcelle_bien_params}
-        total_proprietaires = db.execute(text(proprietaire_query), all_params).scalar() or 0
-
-        # Total population: simple count from personne where fk_type_personne = 1, with date filters only
-        pop_filters, pop_params = build_population_filters_and_params(date_start, date_end)
-        pop_filter_clause = " AND " + " AND ".join(pop_filters) if pop_filters else ""
-        population_query = f"""
-            SELECT COUNT(per.id) 
+
+        # Total population: every personne
+        population_query = """
+            SELECT COUNT(per.id)
             FROM personne per
         """
-            # WHERE per.id is not null {pop_filter_clause}
-        total_population = db.execute(text(population_query), pop_params).scalar() or 0
 
-        return {
+        # The four counts are independent: run them side by side. Parcelles by statut come
+        # unfiltered from the columnar snapshot (app/snapshot.py), or the daily rollups
+        results = fan_out({
+            "parcelles": lambda session: dashboard_parcelle_stats(session, only=("total",)),
+            "biens": lambda session: session.execute(text(bien_query)).scalar(),
+            "proprietaires": lambda session: session.execute(text(proprietaire_query)).scalar(),
+            "population": lambda session: session.execute(text(population_query)).scalar(),
+        })
+        parcelle_totals = results["parcelles"]["total"].get((), {})
+        total_parcelles_accessibles = parcelle_totals.get("accessible", 0)
+        total_parcelles_inaccessibles = parcelle_totals.get("inaccessible", 0)
+        total_biens = results["biens"] or 0
+        total_proprietaires = results["proprietaires"] or 0
+        total_population = results["population"] or 0
+
+        # Every count covers the whole census: any ingestion changes them
+        payload = {
             "total_parcelles_accessibles": total_parcelles_accessibles,
             "total_parcelles_inaccessibles": total_parcelles_inaccessibles,
             "total_biens": total_biens,
             "total_proprietaires": total_proprietaires,
             "total_population": total_population,
         }
+        stats_cache.set(cache_key, payload, StatsScope(), generation)
+        return render_json(payload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Group 2: Biens breakdowns - separate simple queries
+# Group 2: Biens breakdowns - one scan of the daily bien rollup
 @router.get("/stats/dashboard/biens", tags=["Stats"])
 def get_biens_breakdowns(
-    commune: Optional[str] = Query(None),
-    quartier: Optional[str] = Query(None),
-    avenue: Optional[str] = Query(None),
-    rang: Optional[str] = Query(None),
-    nature: Optional[str] = Query(None),
+    commune: Optional[int] = Query(None),
+    quartier: Optional[int] = Query(None),
+    avenue: Optional[int] = Query(None),
+    rang: Optional[int] = Query(None),
+    nature: Optional[int] = Query(None),
     date_start: Optional[str] = Query(None),
     date_end: Optional[str] = Query(None),
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db),
 ):
     try:
-        bien_filters, params = build_bien_filters_and_params(commune, quartier, avenue, rang, nature, date_start, date_end)
-        filter_clause = " AND " + " AND ".join(bien_filters) if bien_filters else ""
-        base_bien_query = f"""
-            FROM bien b
-            LEFT JOIN parcelle p ON b.fk_parcelle = p.id
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            LEFT JOIN nature_bien nb ON b.fk_nature_bien = nb.id
-            LEFT JOIN usage u ON b.fk_usage = u.id
-            LEFT JOIN usage_specifique us ON b.fk_usage_specifique = us.id
-            WHERE 1=1{filter_clause}
-        """
-
-        # biens_by_nature
-        biens_by_nature_query = f"""
-            SELECT COALESCE(nb.intitule, 'Inconnu'), COUNT(b.id)
-            {base_bien_query}
-            GROUP BY nb.id, nb.intitule
-        """
-        biens_by_nature = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(biens_by_nature_query), params).fetchall()
-        }
-
-        # biens_by_rang
-        biens_by_rang_query = biens_by_nature_query.replace("COALESCE(nb.intitule, 'Inconnu')", "COALESCE(r.intitule, 'Inconnu')").replace("nb.id, nb.intitule", "r.id, r.intitule")
-        biens_by_rang = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(biens_by_rang_query), params).fetchall()
-        }
-
-        # biens_by_usage
-        biens_by_usage_query = biens_by_nature_query.replace("nb.intitule", "u.intitule").replace("nb.id, nb.intitule", "u.id, u.intitule")
-        biens_by_usage = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(biens_by_usage_query), params).fetchall()
-        }
-
-        # biens_by_usage_specifique
-        biens_by_usage_specifique_query = biens_by_nature_query.replace("nb.intitule", "us.intitule").replace("nb.id, nb.intitule", "us.id, us.intitule")
-        biens_by_usage_specifique = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(biens_by_usage_specifique_query), params).fetchall()
-        }
-
-        return {
+        cache_key = stats_key(
+            "dashboard/biens", commune=commune, quartier=quartier, avenue=avenue, rang=rang,
+            nature=nature, date_start=date_start, date_end=date_end,
+        )
+        cached = stats_cache.get(cache_key)
+        if cached is not None:
+            return render_json(cached)
+        generation = stats_cache.generation
+
+        # Bien counts keyed by id (app/snapshot.py); the labels load alongside
+        results = fan_out({
+            "biens": lambda session: dashboard_bien_stats(session, commune, quartier, avenue, rang, date_start, date_end, nature),
+            "labels": label_lookup,
+        })
+        bien_stats, labels = results["biens"], results["labels"]
+        biens_by_nature = labelled_counts(bien_stats["nature"], labels["nature_bien"])
+        biens_by_rang = labelled_counts(bien_stats["rang"], labels["rang"])
+        biens_by_usage = labelled_counts(bien_stats["usage"], labels["usage"])
+        biens_by_usage_specifique = labelled_counts(bien_stats["usage_specifique"], labels["usage_specifique"])
+
+        payload = {
             "biens_by_nature": biens_by_nature,
             "biens_by_rang": biens_by_rang,
             "biens_by_usage": biens_by_usage,
             "biens_by_usage_specifique": biens_by_usage_specifique,
         }
+        stats_cache.set(cache_key, payload, stats_scope(date_start, date_end, commune, quartier, avenue), generation)
+        return render_json(payload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# Group 3: Parcelles breakdowns - separate simple queries (no nature)
+# Group 3: Parcelles breakdowns - one scan of the daily parcelle rollup (no nature)
 @router.get("/stats/dashboard/parcelles", tags=["Stats"])
 def get_parcelles_breakdowns(
-    commune: Optional[str] = Query(None),
-    quartier: Optional[str] = Query(None),
-    avenue: Optional[str] = Query(None),
-    rang: Optional[str] = Query(None),
+    commune: Optional[int] = Query(None),
+    quartier: Optional[int] = Query(None),
+    avenue: Optional[int] = Query(None),
+    rang: Optional[int] = Query(None),
     date_start: Optional[str] = Query(None),
     date_end: Optional[str] = Query(None),
     current_user = Depends(get_current_active_user),
     db: Session = Depends(get_db),
 ):
     try:
-        parcelle_filters, params = build_parcelle_filters_and_params(commune, quartier, avenue, rang, date_start, date_end)
-        filter_clause = " AND " + " AND ".join(parcelle_filters) if parcelle_filters else ""
-        base_parcelle_query = f"""
-            FROM parcelle p
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            LEFT JOIN commune c ON q.fk_commune = c.id
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            WHERE 1=1{filter_clause}
-        """
-
-        # parcelles_by_rang
-        parcelles_by_rang_query = f"""
-            SELECT COALESCE(r.intitule, 'Inconnu'), COUNT(p.id)
-            {base_parcelle_query}
-            GROUP BY r.id, r.intitule
-        """
-        parcelles_by_rang = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(parcelles_by_rang_query), params).fetchall()
-        }
-
-        # parcelles_by_commune (only fk_ville=1)
-        parcelles_by_commune_query = f"""
-            SELECT c.intitule, COUNT(p.id)
-            FROM parcelle p
-            LEFT JOIN adresse a ON p.fk_adresse = a.id
-            LEFT JOIN avenue av ON a.fk_avenue = av.id
-            LEFT JOIN quartier q ON av.fk_quartier = q.id
-            INNER JOIN commune c ON q.fk_commune = c.id AND c.fk_ville = 1
-            LEFT JOIN rang r ON p.fk_rang = r.id
-            WHERE 1=1{filter_clause}
-            GROUP BY c.id, c.intitule
-        """
-        parcelles_by_commune = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(parcelles_by_commune_query), params).fetchall()
-        }
-
-        # parcelles_by_quartier
-        parcelles_by_quartier_query = f"""
-            SELECT CONCAT(COALESCE(q.intitule, ''), ' (', COALESCE(c.intitule, ''), ')'), COUNT(p.id)
-            {base_parcelle_query}
-            GROUP BY q.id, q.intitule, c.id, c.intitule
-        """
-        parcelles_by_quartier = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(parcelles_by_quartier_query), params).fetchall()
-        }
-
-        # parcelles_by_avenue
-        parcelles_by_avenue_query = f"""
-            SELECT CONCAT(COALESCE(av.intitule, ''), ' (', COALESCE(c.intitule, ''), ')'), COUNT(p.id)
-            {base_parcelle_query}
-            GROUP BY av.id, av.intitule, c.id, c.intitule
-        """
-        parcelles_by_avenue = {
-            row[0] if row[0] else "Inconnu": row[1]
-            for row in db.execute(text(parcelles_by_avenue_query), params).fetchall()
-        }
+        cache_key = stats_key(
+            "dashboard/parcelles", commune=commune, quartier=quartier, avenue=avenue, rang=rang,
+            date_start=date_start, date_end=date_end,
+        )
+        cached = stats_cache.get(cache_key)
+        if cached is not None:
+            return render_json(cached)
+        generation = stats_cache.generation
+
+        # Parcelle counts keyed by id (app/snapshot.py); the labels load alongside
+        results = fan_out({
+            "parcelles": lambda session: dashboard_parcelle_stats(
+                session, commune, quartier, avenue, rang, date_start, date_end, only=("rang", "commune", "quartier", "avenue"),
+            ),
+            "labels": label_lookup,
+        })
+        parcelle_stats, labels = results["parcelles"], results["labels"]
+        parcelles_by_rang = labelled_counts(parcelle_stats["rang"], labels["rang"])
+        # Communes of ville 1 only, those with parcelles
+        parcelles_by_commune = labelled_counts(
+            {key: measures for key, measures in parcelle_stats["commune"].items() if key[0] in labels["commune_ville"]},
+            labels["commune_ville"],
+        )
+        parcelles_by_quartier = commune_labelled_counts(parcelle_stats["quartier"], labels["quartier"], labels["commune"])
+        parcelles_by_avenue = commune_labelled_counts(parcelle_stats["avenue"], labels["avenue"], labels["commune"])
 
-        return {
+        payload = {
             "parcelles_by_rang": parcelles_by_rang,
             "parcelles_by_commune": parcelles_by_commune,
             "parcelles_by_quartier": parcelles_by_quartier,
             "parcelles_by_avenue": parcelles_by_avenue,
         }
+        stats_cache.set(cache_key, payload, stats_scope(date_start, date_end, commune, quartier, avenue), generation)
+        return render_json(payload)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,196 @@
+# app/versioning.py
+import hashlib
+import threading
+import time
+import uuid
+
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterable
+
+import jwt
+
+from fastapi import Request
+from fastapi.responses import Response
+from jwt.exceptions import InvalidTokenError
+from sqlalchemy import event
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from app.auth import SECRET_KEY, ALGORITHM
+from app.database import SessionLocal
+
+#
+#
+# DATA VERSION TRACKER
+# PER-TABLE HIGH-WATER MARKS FOR ETAG / CONDITIONAL GET
+#
+#
+# The API runs as a single uvicorn worker: versions live in process memory.
+# The boot id makes every ETag change on restart, since counters start over.
+
+
+class DataVersions:
+    def __init__(self):
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.boot_time = time.time()
+        self._versions = {}  # table -> version counter
+        self._modified = {}  # table -> unix time of the last bump
+        self._lock = threading.Lock()
+
+    def bump(self, *tables: str):
+        now = time.time()
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+                self._modified[table] = now
+
+    def version(self, table: str) -> int:
+        return self._versions.get(table, 0)
+
+    def versions(self, tables: Iterable[str]) -> tuple:
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in tables)
+
+    def last_modified(self, tables: Iterable[str]) -> float:
+        with self._lock:
+            return max([self._modified.get(table, self.boot_time) for table in tables] or [self.boot_time])
+
+    def etag(self, tables: Iterable[str], *extra) -> str:
+        digest = hashlib.sha1(repr((self.versions(tables), extra)).encode("utf-8")).hexdigest()[:16]
+        return f'W/"{self.boot_id}-{digest}"'
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"boot_id": self.boot_id, "versions": dict(self._versions)}
+
+
+data_versions = DataVersions()
+
+
+#
+#
+# SESSION HOOKS: EVERY ORM WRITE (INGESTION, GEOJSON IMPORT, ADMIN EDITS)
+# BUMPS THE TABLES IT TOUCHED ONCE THE TRANSACTION COMMITS
+#
+#
+
+@event.listens_for(SessionLocal, "after_flush")
+def _collect_touched_tables(session, flush_context):
+    touched = session.info.setdefault("touched_tables", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, "__tablename__", None)
+        if table:
+            touched.add(table)
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _bump_touched_tables(session):
+    touched = session.info.pop("touched_tables", None)
+    if touched:
+        data_versions.bump(*touched)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_touched_tables(session):
+    session.info.pop("touched_tables", None)
+
+
+#
+#
+# CONDITIONAL GET
+#
+#
+
+LOCATION_TABLES = ("province", "ville", "commune", "quartier", "avenue", "adresse")
+SURVEY_TABLES = ("parcelle", "bien", "personne", "menage", "membre_menage", "location_bien", "adresse")
+PARAMETER_TABLES = ("rang", "nature_bien", "usage", "usage_specifique")
+MAP_TABLES = SURVEY_TABLES + ("utilisateur", "unite", "type_personne") + LOCATION_TABLES + PARAMETER_TABLES
+
+# Tables each cacheable GET route reads
+ROUTE_TABLES = {
+    "/api/v1/provinces": ("province",),
+    "/api/v1/villes": ("ville",),
+    "/api/v1/communes": ("commune",),
+    "/api/v1/quartiers": ("quartier",),
+    "/api/v1/avenues": ("avenue",),
+    "/api/v1/rangs": ("rang",),
+    "/api/v1/natures": ("nature_bien",),
+    "/api/v1/usages": ("usage",),
+    "/api/v1/usage-specifiques": ("usage_specifique",),
+    "/api/v1/get-parameters": PARAMETER_TABLES,
+    "/api/v1/population-by-age-pyramid": SURVEY_TABLES + LOCATION_TABLES,
+    "/api/v1/stats/dashboard": SURVEY_TABLES + LOCATION_TABLES + PARAMETER_TABLES,
+    "/api/v2/stats/dashboard/core": SURVEY_TABLES + LOCATION_TABLES + PARAMETER_TABLES,
+    "/api/v2/stats/dashboard/biens": SURVEY_TABLES + LOCATION_TABLES + PARAMETER_TABLES,
+    "/api/v2/stats/dashboard/parcelles": SURVEY_TABLES + LOCATION_TABLES + PARAMETER_TABLES,
+    "/api/v1/geojson": MAP_TABLES,
+    "/api/v1/cartographie": MAP_TABLES,
+    "/api/v2/geojson": MAP_TABLES,
+    "/api/v2/geojson-summary": MAP_TABLES,
+}
+
+
+# Helper function to check the bearer token without touching the database:
+# a 304 carries no data, the signature is enough to answer it
+def _has_valid_token(request: Request) -> bool:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except InvalidTokenError:
+        return False
+    return payload.get("sub") is not None
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110): compare opaque tags without the W/ prefix
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def _not_modified_since(if_modified_since: str, last_modified: float) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since).timestamp()
+    except (TypeError, ValueError):
+        return False
+    # HTTP dates have a one second resolution
+    return int(last_modified) <= since
+
+
+class ConditionalGetMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        tables = ROUTE_TABLES.get(request.url.path) if request.method in ("GET", "HEAD") else None
+        if tables is None:
+            return await call_next(request)
+
+        # Read the versions before the route runs its queries: the tag can only be
+        # older than the data it labels, never newer
+        etag = data_versions.etag(tables, request.url.path, str(request.query_params))
+        last_modified = formatdate(data_versions.last_modified(tables), usegmt=True)
+        validators = {"etag": etag, "last-modified": last_modified, "cache-control": "private, no-cache"}
+
+        if_none_match = request.headers.get("if-none-match")
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_none_match is not None:
+            fresh = _etag_matches(if_none_match, etag)
+        elif if_modified_since is not None:
+            fresh = _not_modified_since(if_modified_since, data_versions.last_modified(tables))
+        else:
+            fresh = False
+
+        if fresh and _has_valid_token(request):
+            return Response(status_code=304, headers=validators)
+
+        response = await call_next(request)
+        if response.status_code == 200:
+            for name, value in validators.items():
+                response.headers[name] = value
+        return response
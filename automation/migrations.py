@@ -0,0 +1,33 @@
+import argparse
+
+from app.database import engine
+from app.migrations import pending_migrations, run_migrations
+
+#
+#
+# SCHEMA MIGRATIONS
+# RUN WITH: python -m automation.migrations status|apply [--target N]
+#
+#
+# The API applies the cheap migrations at startup; apply runs the deferred
+# ones too (index builds, backfills of the census tables), while it serves.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List or apply the pending schema migrations, the deferred ones included")
+    parser.add_argument("command", choices=("status", "apply"))
+    parser.add_argument("--target", type=int, help="last version to apply (default: all)")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        pending = pending_migrations(engine)
+        for version, name in pending:
+            print(f"{version} {name}")
+        print(f"{len(pending)} migrations pending")
+    else:
+        applied = run_migrations(engine, target=args.target)
+        print(f"{len(applied)} migrations applied: {', '.join(map(str, applied)) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+import argparse
+import json
+
+from app.locations import backfill_parcelle_locations, check_parcelle_locations, PARCELLE_LOCATION_BATCH_SIZE
+
+#
+#
+# PARCELLE_LOCATION MAINTENANCE
+# RUN WITH: python -m automation.parcelle_location backfill|check [--repair]
+#
+#
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill or check the materialized parcelle_location table")
+    parser.add_argument("command", choices=("backfill", "check"))
+    parser.add_argument("--repair", action="store_true", help="rewrite the inconsistent rows found by check")
+    parser.add_argument("--batch-size", type=int, default=PARCELLE_LOCATION_BATCH_SIZE)
+    args = parser.parse_args()
+
+    if args.command == "backfill":
+        inserted = backfill_parcelle_locations(batch_size=args.batch_size)
+        print(f"{inserted} rows backfilled")
+    else:
+        report = check_parcelle_locations(repair=args.repair, batch_size=args.batch_size)
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
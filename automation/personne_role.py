@@ -0,0 +1,29 @@
+import argparse
+
+from app.database import SessionLocal
+from app.roles import rebuild_personne_roles, PERSONNE_ROLE_BATCH_SIZE
+
+#
+#
+# PERSONNE_ROLE MAINTENANCE
+# RUN WITH: python -m automation.personne_role rebuild [--batch-size N]
+#
+#
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rewrite the personne_role index from parcelle, menage, membre_menage and location_bien")
+    parser.add_argument("command", choices=("rebuild",))
+    parser.add_argument("--batch-size", type=int, default=PERSONNE_ROLE_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        written = rebuild_personne_roles(db, batch_size=args.batch_size, commit=True)
+    finally:
+        db.close()
+    print(f"{written} rows written")
+
+
+if __name__ == "__main__":
+    main()
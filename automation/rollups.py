@@ -0,0 +1,35 @@
+import argparse
+
+from app.database import SessionLocal
+from app.rollups import rebuild_rollups, rebuild_rollups_in_batches, ROLLUP_BATCH_DAYS
+
+#
+#
+# DAILY STATS ROLLUPS MAINTENANCE
+# RUN WITH: python -m automation.rollups rebuild [--date-start YYYY-MM-DD] [--date-end YYYY-MM-DD]
+#
+#
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recount the daily stats rollups from the census tables")
+    parser.add_argument("command", choices=("rebuild",))
+    parser.add_argument("--date-start", help="first day to recount (default: the whole census)")
+    parser.add_argument("--date-end", help="last day to recount (default: the whole census)")
+    parser.add_argument("--batch-days", type=int, default=ROLLUP_BATCH_DAYS)
+    args = parser.parse_args()
+
+    if args.date_start is None and args.date_end is None:
+        days = rebuild_rollups_in_batches(batch_days=args.batch_days)
+    else:
+        db = SessionLocal()
+        try:
+            days = rebuild_rollups(db, args.date_start, args.date_end)
+            db.commit()
+        finally:
+            db.close()
+    print(f"{days} days recounted")
+
+
+if __name__ == "__main__":
+    main()
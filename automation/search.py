@@ -0,0 +1,31 @@
+import argparse
+import json
+
+from app.database import SessionLocal
+from app.search import rebuild_search_index, SEARCH_BATCH_SIZE, SEARCH_ENTITIES
+
+#
+#
+# SEARCH_NGRAM MAINTENANCE
+# RUN WITH: python -m automation.search rebuild [--entity personne|utilisateur|rang ...] [--batch-size N]
+#
+#
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-index the labels of the keyword filters in search_ngram")
+    parser.add_argument("command", choices=("rebuild",))
+    parser.add_argument("--entity", action="append", choices=tuple(SEARCH_ENTITIES), help="entity to re-index (default: all)")
+    parser.add_argument("--batch-size", type=int, default=SEARCH_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        counts = rebuild_search_index(db, args.entity, batch_size=args.batch_size, commit=True)
+    finally:
+        db.close()
+    print(json.dumps(counts, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# tests/conftest.py
+import os
+
+# app.database builds its engine from MSSQL_SERVER at import (load_dotenv never overrides it)
+os.environ["MSSQL_SERVER"] = "sqlite://"
+
+import random
+import re
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from sqlalchemy import create_engine, event, insert
+from sqlalchemy.pool import StaticPool
+
+import app.main  # noqa: F401 - registers every session hook, as the running API does
+
+from app import aggregates, models, snapshot
+from app.database import Base, SessionLocal
+from app.derived import derived_tables
+from app.migrations import MIGRATIONS
+
+
+# Helper function to give sqlite the SQL Server functions the models and routes call
+def _tsql_functions(connection, record):
+    connection.create_function("NOW", 0, lambda: "2025-06-01 00:00:00")
+    connection.create_function("GETDATE", 0, lambda: "2025-06-01 00:00:00")
+    connection.create_function("CONCAT", -1, lambda *values: "".join("" if value is None else str(value) for value in values))
+
+
+# Helper function to give sqlite the day of a datetime, which CAST(... AS DATE) turns into a year
+def _tsql_dates(conn, cursor, statement, parameters, context, executemany):
+    return re.sub(r"CAST\((\w+\.date_create) AS DATE\)", r"DATE(\1)", statement), parameters
+
+
+# Helper function to run a GroupingSets on sqlite, which has no GROUPING SETS: one SELECT per set
+def _union_of_groupings(self) -> str:
+    names = list(self.dimensions)
+    parts = []
+    for grouping_id, set_name in self.set_of_grouping_id.items():
+        dims = self.sets[set_name]
+        columns = [f"{grouping_id} AS grouping_id"]
+        columns += [f"{self.dimensions[name] if name in dims else 'NULL'} AS {name}" for name in names]
+        columns += [f"{expression} AS {name}" for name, expression in self.measures.items()]
+        group_by = f" GROUP BY {', '.join(self.dimensions[name] for name in dims)}" if dims else ""
+        parts.append(f"SELECT {', '.join(columns)} FROM {self.source}{group_by}")
+    return " UNION ALL ".join(parts)
+
+
+@pytest.fixture
+def engine():
+    """An in-memory sqlite database with every table, migrated, SessionLocal bound
+    to it (so the session hooks run on its sessions), emptied after the test."""
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", _tsql_functions)
+    event.listen(engine, "before_cursor_execute", _tsql_dates, retval=True)
+    Base.metadata.create_all(engine)
+    # Every table created: recorded as migrated, the derived tables as filled
+    with engine.begin() as conn:
+        conn.execute(insert(models.SchemaMigration), [
+            {"version": version, "name": name, "applied_at": datetime(2025, 6, 1)} for version, name, _, _ in MIGRATIONS
+        ])
+    derived_tables.clear()
+    bound = SessionLocal.kw["bind"]
+    SessionLocal.configure(bind=engine)
+    try:
+        yield engine
+    finally:
+        SessionLocal.configure(bind=bound)
+        derived_tables.clear()
+        engine.dispose()
+
+
+@pytest.fixture
+def db(engine):
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def census(db):
+    """~150 parcelles over 3 communes and 3 weeks, with biens, ménages, members and
+    owners, written through SessionLocal so the session hooks maintain the derived tables."""
+    rng = random.Random(7)
+    db.add_all([models.Province(id=1, intitule="Kinshasa"), models.Ville(id=1, intitule="Kinshasa", fk_province=1)])
+    db.add_all([models.Commune(id=c, intitule=f"Commune {c}", fk_ville=1) for c in (1, 2, 3)])
+    db.add_all([models.Quartier(id=q, intitule=f"Quartier {q}", fk_commune=1 + q % 3) for q in range(1, 7)])
+    db.add_all([models.Avenue(id=a, intitule=f"Avenue {a}", fk_quartier=1 + a % 6) for a in range(1, 19)])
+    db.add_all([models.Adresse(id=a, numero=str(a), fk_avenue=(1 + a % 18 if a % 11 else None)) for a in range(1, 80)])
+    db.add_all([models.Rang(id=r, intitule=f"Rang {r}") for r in (1, 2)])
+    db.add_all([models.NatureBien(id=n, intitule=f"Nature {n}") for n in (1, 2)])
+    db.add_all([models.Personne(id=i, nom=f"Nom{i}", prenom="P", fk_type_personne=1) for i in range(1, 41)])
+    db.flush()
+
+    bien_id = menage_id = membre_id = 1
+    for parcelle_id in range(1, 151):
+        created = datetime(2025, 6, 1) + timedelta(days=rng.randint(0, 20), hours=rng.randint(0, 23))
+        agent = rng.choice([1, 2, 3, None])
+        db.add(models.Parcelle(
+            id=parcelle_id, numero_parcellaire=f"P-{parcelle_id}", fk_adresse=rng.choice([None, *range(1, 80)]),
+            fk_rang=rng.choice([None, 1, 2]), statut=rng.choice([1, 1, 2, None]), fk_agent=agent,
+            fk_proprietaire=rng.choice([None, *range(1, 41)]), date_create=created,
+        ))
+        for _ in range(rng.randint(0, 3)):
+            db.add(models.Bien(
+                id=bien_id, fk_parcelle=rng.choice([parcelle_id, parcelle_id, None]), fk_nature_bien=rng.choice([None, 1, 2]),
+                fk_proprietaire=rng.choice([None, *range(1, 41)]), fk_agent=agent, date_create=created,
+            ))
+            for _ in range(rng.randint(0, 2)):
+                db.add(models.Menage(id=menage_id, fk_bien=bien_id, fk_personne=rng.randint(1, 40), fk_agent=agent, date_create=created))
+                for _ in range(rng.randint(0, 2)):
+                    db.add(models.MembreMenage(
+                        id=membre_id, fk_menage=menage_id, fk_personne=rng.randint(1, 40), fk_agent=agent,
+                        date_create=created + timedelta(days=rng.choice([0, 0, 1])),
+                    ))
+                    membre_id += 1
+                menage_id += 1
+            bien_id += 1
+    db.commit()
+    return db
+
+
+@pytest.fixture
+def grouping_sets(monkeypatch):
+    """The rollup readers (app/aggregates.py) on sqlite: GROUPING SETS as a UNION ALL of GROUP BYs.
+    The SQL Server statement itself is checked by tests/test_aggregates.py."""
+    monkeypatch.setattr(aggregates.GroupingSets, "sql", _union_of_groupings)
+
+
+@pytest.fixture
+def rollup_counts(monkeypatch, grouping_sets):
+    """Dashboard counts read from the rollups, no snapshot built in the background."""
+    monkeypatch.setattr(snapshot, "SNAPSHOT_ENABLED", False)
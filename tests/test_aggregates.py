@@ -0,0 +1,90 @@
+# tests/test_aggregates.py
+import re
+
+import pytest
+
+from app.aggregates import GroupingSets, bien_rollup_stats, parcelle_rollup_stats, stats_filters
+
+PARCELLE_SETS = ["total", "rang", "commune", "quartier", "avenue"]
+BIEN_SETS = ["total", "nature", "rang", "usage", "usage_specifique"]
+
+
+class _Recorder:
+    """Stands for a session: keeps the statements and returns no row."""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(str(statement))
+        return self
+
+    def mappings(self):
+        return []
+
+
+# Helper function to split a comma list at the top level of parentheses
+def _split(listing: str) -> list:
+    parts, depth, current = [], 0, ""
+    for char in listing:
+        if char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+            continue
+        depth += (char == "(") - (char == ")")
+        current += char
+    return [part for part in (*parts, current.strip()) if part]
+
+
+# Helper function to read back the parts of a GroupingSets statement the server checks
+def _parsed(sql: str) -> dict:
+    select = re.search(r"SELECT\s+(.*?)\s+FROM\s", sql, re.S).group(1)
+    columns = [re.fullmatch(r"(.*) AS (\w+)", column, re.S).groups() for column in _split(select)]
+    grouping_sets = re.search(r"GROUP BY GROUPING SETS \((.*)\)\s*$", sql, re.S).group(1)
+    sets = [_split(grouping_set.strip()[1:-1]) for grouping_set in _split(grouping_sets)]
+    return {"columns": dict((name, expression) for expression, name in columns), "sets": sets}
+
+
+# Helper function to check what SQL Server requires of a GROUP BY GROUPING SETS
+def _assert_valid(sql: str, measures):
+    parsed = _parsed(sql)
+    grouped = [expression for grouping_set in parsed["sets"] for expression in grouping_set]
+    grouping_id = parsed["columns"].pop("grouping_id")
+    dimensions = [expression for name, expression in parsed["columns"].items() if name not in measures]
+    # Every selected dimension is in some grouping set...
+    assert set(dimensions) <= set(grouped)
+    # ...and GROUPING_ID() covers exactly the grouped columns
+    if grouped:
+        assert _split(re.fullmatch(r"GROUPING_ID\((.*)\)", grouping_id, re.S).group(1)) == dimensions
+        assert set(dimensions) == set(grouped)
+    else:
+        assert grouping_id == "0" and not dimensions
+
+
+@pytest.mark.parametrize("only", [None, ("total",), ("rang",), ("total", "quartier"), ("avenue",), ("commune", "avenue")])
+def test_parcelle_rollup_sql_groups_every_selected_column(engine, only):
+    db = _Recorder()
+    parcelle_rollup_stats(db, stats_filters(commune=1), only)
+    _assert_valid(db.statements[0], {"total", "accessible", "inaccessible"})
+
+
+@pytest.mark.parametrize("only", [None, ("total",), ("nature",), ("total", "usage_specifique")])
+def test_bien_rollup_sql_groups_every_selected_column(engine, only):
+    db = _Recorder()
+    bien_rollup_stats(db, stats_filters(), nature=2, only=only)
+    _assert_valid(db.statements[0], {"total"})
+
+
+def test_grouping_ids_follow_the_kept_dimensions():
+    aggregation = GroupingSets(
+        source="t",
+        dimensions={"a": "t.a", "b": "t.b", "c": "t.c"},
+        sets={"total": (), "c": ("c",), "ac": ("a", "c")},
+        measures={"total": "COUNT(*)"},
+    )
+    assert list(aggregation.dimensions) == ["a", "c"]
+    # GROUPING_ID(t.a, t.c): a is the high bit
+    assert aggregation.set_of_grouping_id == {3: "total", 2: "c", 0: "ac"}
+    alone = GroupingSets(source="t", dimensions={"a": "t.a"}, sets={"total": ()}, measures={"total": "COUNT(*)"})
+    assert alone.set_of_grouping_id == {0: "total"}
+    assert "0 AS grouping_id" in alone.sql() and "GROUPING SETS (())" in alone.sql()
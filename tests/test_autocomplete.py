@@ -0,0 +1,93 @@
+# tests/test_autocomplete.py
+import time
+
+import pytest
+
+from sqlalchemy.sql import text
+
+from app import autocomplete, models
+from app.autocomplete import ParcelleAutocomplete
+
+
+@pytest.fixture
+def index(census, monkeypatch):
+    """A fresh index over the census, the one the session hooks queue writes for."""
+    fresh = ParcelleAutocomplete()
+    monkeypatch.setattr(autocomplete, "parcelle_autocomplete", fresh)
+    fresh.rebuild()
+    return fresh
+
+
+# Helper function to list the matched parcelle ids
+def _ids(index, query, type_="all", limit=50) -> list:
+    return [parcelle_id for parcelle_id, _ in index.search(query, limit, type_)]
+
+
+# Helper function to wait for a background build to finish
+def _wait_built(index, timeout=10):
+    deadline = time.monotonic() + timeout
+    while (index._building or index.built_at is None) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_prefix_lookup_on_numero_then_owner(index, census):
+    assert _ids(index, "p-14", "numero") == [14, 140, 141, 142, 143, 144, 145, 146, 147, 148, 149]
+    owned = {row[0] for row in census.execute(text("SELECT id FROM parcelle WHERE fk_proprietaire = 7"))}
+    assert set(_ids(index, "NOM7 ", "proprietaire")) == owned
+    # Owner words are indexed from each word: the first name alone matches
+    assert set(_ids(index, "p", "proprietaire", limit=500)) >= owned
+
+
+def test_cold_refresh_returns_at_once_and_builds_in_the_background(census, monkeypatch):
+    cold = ParcelleAutocomplete()
+    monkeypatch.setattr(autocomplete, "parcelle_autocomplete", cold)
+    cold.refresh(census)
+    assert cold._building or cold.built_at is not None
+    _wait_built(cold)
+    assert _ids(cold, "p-150") == [150]
+
+
+def test_refresh_never_waits_for_a_running_load(index, census):
+    census.add(models.Parcelle(id=151, numero_parcellaire="P-151", statut=1))
+    census.commit()
+    # Another refresh holds the lock: the lookup is served from the current index
+    index._refresh_lock.acquire()
+    try:
+        index.refresh(census)
+        assert _ids(index, "p-151") == []
+    finally:
+        index._refresh_lock.release()
+    index.refresh(census)
+    assert _ids(index, "p-151") == [151]
+
+
+def test_written_parcelles_and_renamed_owners_are_reloaded(index, census):
+    owner = census.execute(text("SELECT fk_proprietaire FROM parcelle WHERE id = 10")).scalar()
+    assert owner is not None
+    census.get(models.Parcelle, 20).numero_parcellaire = "ZX-20"
+    census.delete(census.get(models.Parcelle, 30))
+    census.get(models.Personne, owner).nom = "Kabeya"
+    census.commit()
+    index.refresh(census)
+
+    assert _ids(index, "zx") == [20]
+    assert 20 not in _ids(index, "p-20")
+    assert 30 not in _ids(index, "p-30")
+    assert 10 in _ids(index, "kabeya")
+    assert 10 not in _ids(index, f"nom{owner} ", "proprietaire")
+    # Edited twice: only the latest keys match
+    census.get(models.Parcelle, 20).numero_parcellaire = "ZY-20"
+    census.commit()
+    index.refresh(census)
+    assert _ids(index, "zx") == [] and _ids(index, "zy") == [20]
+
+
+def test_raw_sql_edits_wait_for_the_rebuild(index, census):
+    census.execute(text("UPDATE parcelle SET numero_parcellaire = 'RAW-5' WHERE id = 5"))
+    census.commit()
+    index.refresh(census)
+    assert _ids(index, "raw") == []
+    index.invalidate()
+    index.refresh(census)
+    _wait_built(index)
+    assert _ids(index, "raw") == [5]
@@ -0,0 +1,93 @@
+# tests/test_derived.py
+import pytest
+
+from sqlalchemy import select
+from sqlalchemy.sql import text
+
+from app import derived
+from app.activity import agent_activity_series
+from app.aggregates import bien_rollup_stats, parcelle_rollup_stats, stats_filters
+from app.derived import FILL_MIGRATIONS, derived_tables
+from app.filters import PARCELLE_JOINS, SqlFilters, build_joins
+from app.locations import parcelle_location_table
+from app.migrations import MIGRATIONS, run_migrations
+from app.models import Parcelle
+
+
+# Helper function to count the parcelles of a commune through the location join
+def _commune_count(db, commune: int) -> int:
+    filters = SqlFilters().location(commune=commune)
+    query = f"SELECT COUNT(*) FROM parcelle p {build_joins(PARCELLE_JOINS, filters.aliases())} WHERE 1=1 {filters.sql()}"
+    return db.execute(text(query), filters.params).scalar()
+
+
+# Helper function to read everything the derived tables answer for the census
+def _answers(db) -> dict:
+    location = parcelle_location_table()
+    roles = derived_tables.source("personne_role")
+    return {
+        "communes": [_commune_count(db, commune) for commune in (1, 2, 3)],
+        "orm": sorted(db.execute(select(Parcelle.id, location.c.fk_quartier).join(location, location.c.parcelle_id == Parcelle.id)).all()),
+        "roles": sorted(tuple(row) for row in db.execute(text(f"SELECT personne_id, parcelle_id, role FROM {roles} pr WHERE bien_id IS NULL"))),
+        "population": db.execute(text(f"SELECT COUNT(DISTINCT pr.personne_id) FROM {roles} pr")).scalar(),
+        "parcelles": parcelle_rollup_stats(db, stats_filters(commune=2)),
+        "biens": bien_rollup_stats(db, stats_filters(date_start="2025-06-05", date_end="2025-06-12")),
+        "activity": [dict(row) for row in agent_activity_series(db, 1, "2025-06-03", "2025-06-15")],
+    }
+
+
+@pytest.fixture
+def deployed(census, engine, grouping_sets):
+    """The census as just after a deploy: the derived tables created, their fills not run yet."""
+    expected = _answers(census)
+    with engine.begin() as conn:
+        for table in FILL_MIGRATIONS:
+            conn.execute(text(f"DELETE FROM {table}"))
+        conn.execute(text("DELETE FROM schema_migrations WHERE version IN (4, 7, 8, 9)"))
+    derived_tables.clear()
+    return expected
+
+
+def test_readers_compute_the_unfilled_tables_from_their_sources(deployed, census):
+    assert not any(derived_tables.filled(table) for table in FILL_MIGRATIONS)
+    assert _answers(census) == deployed
+    # The parcelles only counted through the join chain
+    assert sum(deployed["communes"]) > 0 and deployed["activity"]
+
+
+def test_readers_switch_to_the_tables_once_filled(deployed, census, engine):
+    assert run_migrations(engine) == [4, 7, 8, 9]
+    assert all(derived_tables.filled(table) for table in FILL_MIGRATIONS)
+    assert build_joins(PARCELLE_JOINS, {"pl"}) == "LEFT JOIN parcelle_location pl ON pl.parcelle_id = p.id"
+    assert _answers(census) == deployed
+
+
+def test_fills_recorded_by_another_process_are_seen_after_the_recheck(deployed, census, engine, monkeypatch):
+    assert not derived_tables.filled("personne_role")
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO schema_migrations (version, name, applied_at) VALUES (8, 'fill personne_role', '2025-06-02')"))
+    # Read at most every DERIVED_RECHECK_SECONDS
+    assert not derived_tables.filled("personne_role")
+    monkeypatch.setattr(derived, "DERIVED_RECHECK_SECONDS", 0)
+    assert derived_tables.filled("personne_role")
+    assert derived_tables.source("personne_role") == "personne_role"
+
+
+def test_fill_versions_name_the_migrations_filling_the_tables():
+    names = {version: name for version, name, _, deferred in MIGRATIONS if deferred}
+    for table, version in FILL_MIGRATIONS.items():
+        assert version in names
+        assert table in names[version] or (table.startswith("stats_") and "rollups" in names[version])
+
+
+def test_keyword_filters_find_the_rows_indexed_before_the_fill(deployed, census, engine):
+    # search_ngram is empty: the LIKE alone still finds the existing persons
+    filters = SqlFilters().search(("per.nom",), "kw", "Nom7", (("per.id", "personne"),))
+    query = text(f"SELECT per.id FROM personne per WHERE 1=1 {filters.sql()}")
+    assert sorted(row[0] for row in census.execute(query, filters.params)) == [7]
+    run_migrations(engine)
+    assert census.execute(text("SELECT COUNT(*) FROM search_ngram")).scalar() > 0
+    filters = SqlFilters().search(("per.nom",), "kw", "Nom7", (("per.id", "personne"),))
+    assert "search_ngram" in filters.sql()
+    query = text(f"SELECT per.id FROM personne per WHERE 1=1 {filters.sql()}")
+    assert sorted(row[0] for row in census.execute(query, filters.params)) == [7]
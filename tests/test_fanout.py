@@ -0,0 +1,71 @@
+# tests/test_fanout.py
+import threading
+import time
+
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import text
+
+from app import fanout
+from app.database import SessionLocal
+from app.fanout import fan_out
+
+# Counts to a billion: far longer than any test may take unless it is stopped
+SLOW_QUERY = text("""
+    WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < 1000000000)
+    SELECT SUM(x) FROM c
+""")
+
+
+@pytest.fixture
+def file_engine(tmp_path):
+    """A sqlite file, one connection per worker: queries really run side by side."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'fanout.db'}", connect_args={"check_same_thread": False})
+    bound = SessionLocal.kw["bind"]
+    SessionLocal.configure(bind=engine)
+    try:
+        yield engine
+    finally:
+        SessionLocal.configure(bind=bound)
+        engine.dispose()
+
+
+def test_results_by_name(file_engine):
+    results = fan_out({
+        "one": lambda db: db.execute(text("SELECT 1")).scalar(),
+        "two": lambda db: db.execute(text("SELECT 2")).scalar(),
+    })
+    assert results == {"one": 1, "two": 2}
+    assert fan_out({"one": lambda db: db.execute(text("SELECT 1")).scalar()}, max_workers=1) == {"one": 1}
+
+
+def test_a_failure_stops_the_running_statements(file_engine):
+    started = threading.Event()
+    outcome = {}
+
+    def slow(db):
+        started.set()
+        try:
+            return db.execute(SLOW_QUERY).scalar()
+        except Exception as error:
+            outcome["slow"] = error
+            raise
+
+    def failing(db):
+        started.wait(5)
+        time.sleep(0.2)  # The slow scan is running
+        return db.execute(text("SELECT * FROM no_such_table")).fetchall()
+
+    start = time.monotonic()
+    with pytest.raises(OperationalError, match="no_such_table"):
+        fan_out({"slow": slow, "failing": failing})
+    assert time.monotonic() - start < 5
+    assert "interrupted" in str(outcome["slow"])
+
+
+def test_a_cancelled_query_runs_no_further_statement(file_engine):
+    run = fanout._Run(lambda db: [db.execute(text("SELECT 1")).scalar(), run.cancel(), db.execute(text("SELECT 2")).scalar()])
+    with pytest.raises(fanout.QueryCancelled):
+        run()
@@ -0,0 +1,169 @@
+# tests/test_filters.py
+from datetime import date, datetime
+
+import pytest
+
+from fastapi import HTTPException
+
+from app.derived import derived_tables
+from app.filters import (
+    BIEN_JOINS,
+    PARCELLE_JOINS,
+    STATS_JOINS,
+    SqlFilters,
+    build_joins,
+    date_bounds,
+    day_bounds,
+    keyword_grams,
+)
+from app.locations import SELECT_LOCATIONS
+
+# The location join once parcelle_location is filled
+PL_JOIN = "LEFT JOIN parcelle_location pl ON pl.parcelle_id = p.id"
+
+
+@pytest.fixture
+def filled():
+    """parcelle_location and search_ngram trusted as filled, without a database to ask."""
+    derived_tables.mark_filled("parcelle_location", "search_ngram")
+    yield
+    derived_tables.clear()
+
+
+def test_equals_binds_typed_values_and_skips_missing_ones():
+    filters = SqlFilters().equals("p.statut", "statut", "2").equals("p.fk_rang", "rang", None).equals("p.fk_agent", "agent", "")
+    assert filters.filters == ["p.statut = :statut"]
+    assert filters.params == {"statut": 2}
+    assert isinstance(filters.params["statut"], int)
+    assert filters.sql() == " AND p.statut = :statut"
+    assert SqlFilters().equals("c.intitule", "commune", 12, type_=str).params == {"commune": "12"}
+
+
+def test_no_filter_renders_nothing():
+    filters = SqlFilters({"limit": 10})
+    assert not filters
+    assert filters.sql() == ""
+    assert filters.params == {"limit": 10}
+
+
+def test_date_range_is_half_open_on_the_bare_column():
+    filters = SqlFilters().date_range("p.date_create", "2025-06-05", "2025-06-10")
+    assert filters.filters == ["p.date_create >= :date_start", "p.date_create < :date_end"]
+    # The end day is fully included: the bound is the next midnight, bound as a datetime
+    assert filters.params == {"date_start": datetime(2025, 6, 5), "date_end": datetime(2025, 6, 11)}
+    assert "CAST" not in filters.sql()
+
+
+def test_date_range_with_one_bound_and_custom_names():
+    filters = SqlFilters().date_range("b.date_create", None, "2025-12-31", start_name="d0", end_name="d1")
+    assert filters.filters == ["b.date_create < :d1"]
+    assert filters.params == {"d1": datetime(2026, 1, 1)}
+
+
+def test_date_bounds_date_only_end_covers_the_whole_day():
+    assert date_bounds(None, "2025-06-10") == (None, datetime(2025, 6, 11))
+    # A time of day on the end is ignored: the whole day is still included
+    assert date_bounds(None, "2025-06-10T15:30:00") == (None, datetime(2025, 6, 11))
+    assert date_bounds(None, datetime(2025, 6, 10, 23, 59)) == (None, datetime(2025, 6, 11))
+    assert date_bounds(None, date(2025, 2, 28)) == (None, datetime(2025, 3, 1))
+    assert date_bounds("", "") == (None, None)
+
+
+def test_date_bounds_inverted_range_is_empty_not_swapped():
+    start, end = date_bounds("2025-06-10", "2025-06-05")
+    assert (start, end) == (datetime(2025, 6, 10), datetime(2025, 6, 6))
+    assert not start < end
+    # The same day twice is a one-day range
+    assert date_bounds("2025-06-10", "2025-06-10") == (datetime(2025, 6, 10), datetime(2025, 6, 11))
+
+
+def test_invalid_date_is_a_400():
+    with pytest.raises(HTTPException) as error:
+        date_bounds("10/06/2025")
+    assert error.value.status_code == 400
+
+
+def test_day_range_is_inclusive_on_dates():
+    assert day_bounds("2025-06-05", "2025-06-10") == (date(2025, 6, 5), date(2025, 6, 10))
+    filters = SqlFilters().day_range("s.jour", "2025-06-05", "2025-06-10")
+    assert filters.filters == ["s.jour >= :date_start", "s.jour <= :date_end"]
+    assert filters.params == {"date_start": date(2025, 6, 5), "date_end": date(2025, 6, 10)}
+
+
+def test_location_filters_read_parcelle_location():
+    filters = SqlFilters().location(commune="3", quartier=7, avenue=None, rang="2")
+    assert filters.filters == ["pl.fk_commune = :commune", "pl.fk_quartier = :quartier", "p.fk_rang = :rang"]
+    assert filters.params == {"commune": 3, "quartier": 7, "rang": 2}
+    assert filters.aliases() == {"pl", "p"}
+
+
+def test_stats_location_filters_read_the_rollup_avenue():
+    filters = SqlFilters().stats_location(commune=1, avenue=4)
+    assert filters.filters == ["q.fk_commune = :commune", "s.fk_avenue = :avenue"]
+    assert filters.aliases() == {"q", "s"}
+    assert build_joins(STATS_JOINS, filters.aliases()) == "\n".join([STATS_JOINS["av"][0], STATS_JOINS["q"][0]])
+
+
+def test_search_narrows_by_ngrams_then_keeps_the_like_predicates(filled):
+    filters = SqlFilters().search(["per.nom", "per.prenom"], "kw", "Kabe", (("per.id", "personne"),))
+    grams = keyword_grams("Kabe")
+    assert grams == ("abe", "kab")
+    assert filters.params == {"kw_g0": "abe", "kw_g1": "kab", "kw": "%Kabe%"}
+    ngram, like = filters.filters
+    assert "per.id IN (SELECT g.entity_id FROM search_ngram g WHERE g.entity = 'personne'" in ngram
+    assert "g.gram IN (:kw_g0, :kw_g1)" in ngram
+    assert "HAVING COUNT(*) = 2" in ngram
+    assert like == "(per.nom LIKE :kw OR per.prenom LIKE :kw)"
+
+
+def test_search_folds_accents_and_ors_the_targets(filled):
+    filters = SqlFilters().search(["per.nom", "r.intitule"], "kw", "Élé", (("per.id", "personne"), ("p.fk_rang", "rang")))
+    assert filters.params["kw_g0"] == "ele"
+    assert " OR p.fk_rang IN (SELECT g.entity_id FROM search_ngram g WHERE g.entity = 'rang'" in filters.filters[0]
+
+
+def test_search_falls_back_to_like_when_the_index_cannot_answer(filled):
+    for keyword in ("ab", "50%", "a_b", "[x]"):
+        filters = SqlFilters().search(["per.nom"], "kw", keyword, (("per.id", "personne"),))
+        assert filters.filters == ["(per.nom LIKE :kw)"], keyword
+        assert filters.params == {"kw": f"%{keyword}%"}
+    assert SqlFilters().search(["per.nom"], "kw", None, (("per.id", "personne"),)).filters == []
+
+
+def test_search_scans_with_like_until_the_index_is_filled(engine):
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DELETE FROM schema_migrations WHERE version = 4")
+    filters = SqlFilters().search(["per.nom"], "kw", "Kabe", (("per.id", "personne"),))
+    assert filters.filters == ["(per.nom LIKE :kw)"]
+    assert filters.params == {"kw": "%Kabe%"}
+
+
+def test_build_joins_keeps_only_the_chain_to_the_referenced_aliases(filled):
+    assert build_joins(PARCELLE_JOINS, []) == ""
+    assert build_joins(PARCELLE_JOINS, {"p"}) == ""
+    assert build_joins(PARCELLE_JOINS, {"c"}) == "\n".join([PL_JOIN, PARCELLE_JOINS["c"][0]])
+    assert build_joins(PARCELLE_JOINS, {"tp", "r"}) == "\n".join(
+        [PARCELLE_JOINS["per"][0], PARCELLE_JOINS["tp"][0], PARCELLE_JOINS["r"][0]]
+    )
+
+
+def test_build_joins_emits_parents_first_in_declaration_order(filled):
+    joins = build_joins(BIEN_JOINS, {"pr", "nb"}).split("\n")
+    assert joins == [BIEN_JOINS["p"][0], PL_JOIN, BIEN_JOINS["pr"][0], BIEN_JOINS["nb"][0]]
+
+
+def test_build_joins_from_filter_and_column_aliases(filled):
+    filters = SqlFilters().location(quartier=2).keyword(["per.nom"], "kw", "x")
+    aliases = filters.aliases() | {"b"}
+    assert aliases == {"pl", "per", "b"}
+    joins = build_joins(BIEN_JOINS, aliases)
+    assert joins == "\n".join([BIEN_JOINS["p"][0], PL_JOIN, BIEN_JOINS["per"][0]])
+    assert "LEFT JOIN commune" not in joins and "LEFT JOIN adresse" not in joins
+
+
+def test_build_joins_reads_the_chain_until_parcelle_location_is_filled(engine):
+    # Recorded as not filled: the location join computes its rows from the chain
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DELETE FROM schema_migrations WHERE version = 9")
+    joins = build_joins(PARCELLE_JOINS, {"c"})
+    assert joins.startswith(f"LEFT JOIN ({SELECT_LOCATIONS}) pl ON pl.parcelle_id = p.id")
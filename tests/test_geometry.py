@@ -0,0 +1,70 @@
+# tests/test_geometry.py
+import json
+import math
+
+from app.geometry import SIMPLIFY_ZOOM_LEVELS, quantize_geometry, render_geometry, resolve_precision, simplify_geometry
+
+
+# Helper function to draw a closed ring of n vertices, radius_m metres around Kinshasa, with a little jitter
+def _ring(n: int, radius_m: float):
+    radius = radius_m / 111320.0
+    ring = [
+        [15.3 + radius * math.cos(2 * math.pi * i / n) * (1 + 0.05 * (i % 3)),
+         -4.4 + radius * math.sin(2 * math.pi * i / n) * (1 + 0.05 * (i % 2))]
+        for i in range(n)
+    ]
+    return ring + [ring[0]]
+
+
+# Helper function to count the vertices served at each simplification level, finest level first
+def _counts(raw, count):
+    return [count(simplify_geometry(raw, level)) for level in reversed(SIMPLIFY_ZOOM_LEVELS)]
+
+
+def test_vertex_count_never_increases_as_zoom_decreases_json():
+    for n, radius_m in ((41, 15), (200, 15), (41, 200), (12, 3)):
+        raw = json.dumps([_ring(n, radius_m)])
+        counts = _counts(raw, lambda geometry: len(json.loads(geometry)[0]))
+        assert counts == sorted(counts, reverse=True), (n, radius_m, counts)
+
+
+def test_vertex_count_never_increases_as_zoom_decreases_kobo():
+    raw = ";".join(f"{lat} {lon} 312.5 4.0" for lon, lat in _ring(41, 15))
+    counts = _counts(raw, lambda geometry: len(geometry.split(";")))
+    assert counts == sorted(counts, reverse=True), counts
+
+
+def test_coarse_ring_keeps_a_closed_triangle_in_ring_order():
+    ring = _ring(41, 15)
+    coarse = json.loads(simplify_geometry(json.dumps([ring]), SIMPLIFY_ZOOM_LEVELS[0]))[0]
+    assert len(coarse) == 4
+    assert coarse[0] == coarse[-1] == ring[0]
+    positions = [ring.index(point) for point in coarse[:-1]]
+    assert positions == sorted(positions)
+
+
+def test_open_line_keeps_its_endpoints():
+    line = [[15.3 + i * 1e-6, -4.4 + (i % 2) * 1e-6] for i in range(10)]
+    coarse = json.loads(simplify_geometry(json.dumps(line), SIMPLIFY_ZOOM_LEVELS[0]))
+    assert coarse == [line[0], line[-1]]
+
+
+def test_short_rings_are_served_unchanged():
+    triangle = [[15.3, -4.4], [15.3001, -4.4], [15.3, -4.4001], [15.3, -4.4]]
+    raw = json.dumps([triangle])
+    for level in SIMPLIFY_ZOOM_LEVELS:
+        assert json.loads(simplify_geometry(raw, level)) == [triangle]
+
+
+def test_coordinates_are_sent_as_stored_unless_precision_is_requested():
+    raw = "-4.412345678 15.312345678 312.56 4.25;-4.41 15.31 312.5 4.0"
+    assert render_geometry(raw) == raw
+    assert resolve_precision() is None
+    assert resolve_precision(4) == 4
+
+
+def test_quantization_rounds_only_plan_coordinates():
+    kobo = "-4.412345678 15.312345678 312.56 4.25"
+    assert quantize_geometry(kobo, 3) == "-4.412 15.312 312.56 4.25"
+    geojson = json.dumps([[15.312345678, -4.412345678, 312.56]])
+    assert json.loads(quantize_geometry(geojson, 3)) == [[15.312, -4.412, 312.56]]
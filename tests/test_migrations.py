@@ -0,0 +1,72 @@
+# tests/test_migrations.py
+import pytest
+
+from sqlalchemy import inspect
+from sqlalchemy.sql import text
+
+from app.migrations import HOT_PATH_INDEXES, model_indexes, pending_migrations, run_migrations
+from app.models import (
+    ParcelleLocation,
+    PersonneRole,
+    SchemaMigration,
+    SearchNgram,
+    StatsBienJour,
+    StatsMenageJour,
+    StatsParcelleJour,
+)
+
+MANAGED_TABLES = (ParcelleLocation, SearchNgram, StatsParcelleJour, StatsBienJour, StatsMenageJour, PersonneRole, SchemaMigration)
+
+
+@pytest.fixture
+def unmigrated(census, engine):
+    """The seeded census as before the migrations: no managed table, no hot path index."""
+    census.close()
+    with engine.begin() as conn:
+        for index in model_indexes(*HOT_PATH_INDEXES):
+            index.drop(bind=conn)
+        for model in MANAGED_TABLES:
+            model.__table__.drop(bind=conn)
+    return engine
+
+
+# Helper function to list the hot path indexes present
+def _hot_path_indexes(engine) -> set:
+    inspector = inspect(engine)
+    present = {index["name"] for table in inspector.get_table_names() for index in inspector.get_indexes(table)}
+    return present & set(HOT_PATH_INDEXES)
+
+
+# Helper function to count the rows of a table
+def _count(engine, table: str) -> int:
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT COUNT(*) FROM {table}")).scalar()
+
+
+def test_startup_applies_only_the_cheap_ddl(unmigrated):
+    assert run_migrations(unmigrated, deferred=False) == [1, 3, 5, 6]
+    tables = set(inspect(unmigrated).get_table_names())
+    assert {model.__tablename__ for model in MANAGED_TABLES} <= tables
+    # Empty tables, no index built
+    for model in MANAGED_TABLES[:-1]:
+        assert _count(unmigrated, model.__tablename__) == 0
+    assert not _hot_path_indexes(unmigrated)
+    assert [version for version, _ in pending_migrations(unmigrated)] == [2, 4, 7, 8, 9]
+    assert pending_migrations(unmigrated, deferred=False) == []
+    # A second start has nothing left to do
+    assert run_migrations(unmigrated, deferred=False) == []
+
+
+def test_apply_builds_the_indexes_and_fills_the_tables(unmigrated):
+    run_migrations(unmigrated, deferred=False)
+    assert run_migrations(unmigrated) == [2, 4, 7, 8, 9]
+    assert pending_migrations(unmigrated) == []
+    assert _hot_path_indexes(unmigrated) == set(HOT_PATH_INDEXES)
+    assert _count(unmigrated, "parcelle_location") == _count(unmigrated, "parcelle") == 150
+    with unmigrated.connect() as conn:
+        assert conn.execute(text("SELECT SUM(nb_parcelles) FROM stats_parcelle_jour")).scalar() == 150
+        assert conn.execute(text("SELECT SUM(nb_biens) FROM stats_bien_jour")).scalar() == _count(unmigrated, "bien")
+        owners = conn.execute(text("SELECT COUNT(*) FROM parcelle WHERE fk_proprietaire IS NOT NULL")).scalar()
+        assert conn.execute(text("SELECT COUNT(*) FROM personne_role WHERE role = 1")).scalar() == owners
+        indexed = conn.execute(text("SELECT COUNT(DISTINCT entity_id) FROM search_ngram WHERE entity = 'personne'")).scalar()
+        assert indexed == _count(unmigrated, "personne")
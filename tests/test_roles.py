@@ -0,0 +1,93 @@
+# tests/test_roles.py
+from sqlalchemy.sql import text
+
+from app import models
+from app.roles import (
+    ROLE_LOCATAIRE,
+    ROLE_MEMBRE_MENAGE,
+    ROLE_PROPRIETAIRE,
+    ROLE_RESPONSABLE_MENAGE,
+    rebuild_personne_roles,
+)
+
+# The four-way UNION personne_role replaces, one row per person and role
+SOURCE_ROLES = f"""
+    SELECT p.fk_proprietaire, p.id, NULL, {ROLE_PROPRIETAIRE} FROM parcelle p WHERE p.fk_proprietaire IS NOT NULL
+    UNION ALL
+    SELECT m.fk_personne, b.fk_parcelle, b.id, {ROLE_RESPONSABLE_MENAGE}
+    FROM menage m JOIN bien b ON m.fk_bien = b.id WHERE m.fk_personne IS NOT NULL
+    UNION ALL
+    SELECT mm.fk_personne, b.fk_parcelle, b.id, {ROLE_MEMBRE_MENAGE}
+    FROM membre_menage mm JOIN menage m ON mm.fk_menage = m.id JOIN bien b ON m.fk_bien = b.id
+    WHERE mm.fk_personne IS NOT NULL
+    UNION ALL
+    SELECT lb.fk_personne, b.fk_parcelle, b.id, {ROLE_LOCATAIRE}
+    FROM location_bien lb JOIN bien b ON lb.fk_bien = b.id WHERE lb.fk_personne IS NOT NULL
+"""
+
+
+# Helper function to read rows as a sorted list, NULLs included
+def _rows(db, query: str) -> list:
+    return sorted((tuple(row) for row in db.execute(text(query))), key=repr)
+
+
+# Helper function to read the indexed roles
+def _indexed(db) -> list:
+    return _rows(db, "SELECT personne_id, parcelle_id, bien_id, role FROM personne_role")
+
+
+def test_session_hooks_index_every_role_of_the_inserted_rows(census):
+    indexed = _indexed(census)
+    assert indexed == _rows(census, SOURCE_ROLES)
+    assert {row[3] for row in indexed} == {ROLE_PROPRIETAIRE, ROLE_RESPONSABLE_MENAGE, ROLE_MEMBRE_MENAGE}
+
+
+def test_session_hooks_follow_moves_and_deletes(census):
+    db = census
+    bien_ids = [row[0] for row in db.execute(text("SELECT DISTINCT fk_bien FROM menage ORDER BY fk_bien"))]
+    # A new owner, a bien moved to another parcelle, a new ménage head, a tenant
+    db.get(models.Parcelle, 1).fk_proprietaire = 40
+    db.get(models.Bien, bien_ids[0]).fk_parcelle = 150
+    menage = db.execute(text("SELECT MIN(id) FROM menage")).scalar()
+    db.get(models.Menage, menage).fk_personne = 39
+    db.add(models.LocationBien(id=1, fk_personne=38, fk_bien=bien_ids[1]))
+    db.commit()
+    # A member moved to another ménage, another deleted, a ménage moved to another bien, a bien deleted
+    members = [row[0] for row in db.execute(text("SELECT id FROM membre_menage ORDER BY id LIMIT 2"))]
+    db.get(models.MembreMenage, members[0]).fk_menage = db.execute(text("SELECT MAX(id) FROM menage")).scalar()
+    db.delete(db.get(models.MembreMenage, members[1]))
+    db.get(models.Menage, menage).fk_bien = bien_ids[2]
+    db.delete(db.get(models.Bien, bien_ids[3]))
+    db.commit()
+
+    indexed = _indexed(db)
+    assert (40, 1, None, ROLE_PROPRIETAIRE) in indexed
+    assert (38, db.get(models.Bien, bien_ids[1]).fk_parcelle, bien_ids[1], ROLE_LOCATAIRE) in indexed
+    assert not [row for row in indexed if row[2] == bien_ids[3]]
+    assert indexed == _rows(db, SOURCE_ROLES)
+
+
+def test_rolled_back_writes_leave_the_index_alone(census):
+    before = _indexed(census)
+    census.get(models.Parcelle, 1).fk_proprietaire = 40
+    census.add(models.LocationBien(id=1, fk_personne=38, fk_bien=1))
+    census.flush()
+    census.rollback()
+    assert _indexed(census) == before
+
+
+def test_batched_rebuild_repairs_raw_sql_writes(census):
+    db = census
+    # Raw SQL bypasses the hooks: a stale owner and rows of a deleted bien stay behind
+    db.execute(text("UPDATE parcelle SET fk_proprietaire = 1 WHERE id = 2"))
+    deleted = db.execute(text("SELECT MIN(bien_id) FROM personne_role WHERE bien_id IS NOT NULL")).scalar()
+    db.execute(text("DELETE FROM bien WHERE id = :id"), {"id": deleted})
+    db.commit()
+    assert _indexed(db) != _rows(db, SOURCE_ROLES)
+
+    # Batches smaller than the id ranges, each committing on its own
+    assert rebuild_personne_roles(db, batch_size=7, commit=True) == len(_rows(db, SOURCE_ROLES))
+    rebuilt = _indexed(db)
+    assert rebuilt == _rows(db, SOURCE_ROLES)
+    assert (1, 2, None, ROLE_PROPRIETAIRE) in rebuilt
+    assert not [row for row in rebuilt if row[2] == deleted]
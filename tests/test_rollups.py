@@ -0,0 +1,131 @@
+# tests/test_rollups.py
+import json
+
+from datetime import datetime
+
+import pytest
+
+from sqlalchemy.sql import text
+
+from app import fanout, models
+from app.rollups import rebuild_rollups
+from app.stats_cache import stats_cache
+from app.v2.routes import get_core_stats
+
+ROLLUP_COLUMNS = {
+    "stats_parcelle_jour": "jour, fk_agent, fk_avenue, fk_rang, statut, nb_parcelles",
+    "stats_bien_jour": "jour, fk_agent, fk_avenue, fk_rang, fk_nature_bien, fk_usage, fk_usage_specifique, nb_biens",
+    "stats_menage_jour": "jour, fk_agent, nb_menages, nb_membres_menage",
+}
+
+
+# Helper function to read every rollup row, in a comparable order
+def _rollup_rows(db) -> dict:
+    return {
+        table: sorted((tuple(row) for row in db.execute(text(f"SELECT {columns} FROM {table}"))), key=repr)
+        for table, columns in ROLLUP_COLUMNS.items()
+    }
+
+
+# Helper function to have a full rebuild recount the rollups, and read them back
+def _rebuilt_rows(db) -> dict:
+    rebuild_rollups(db)
+    db.commit()
+    return _rollup_rows(db)
+
+
+def test_rollups_add_up_to_the_source_rows(census):
+    totals = census.execute(text("""
+        SELECT (SELECT SUM(nb_parcelles) FROM stats_parcelle_jour), (SELECT COUNT(*) FROM parcelle),
+               (SELECT SUM(nb_biens) FROM stats_bien_jour), (SELECT COUNT(*) FROM bien),
+               (SELECT SUM(nb_menages) FROM stats_menage_jour), (SELECT COUNT(*) FROM menage),
+               (SELECT SUM(nb_membres_menage) FROM stats_menage_jour), (SELECT COUNT(*) FROM membre_menage)
+    """)).fetchone()
+    assert totals[0] == totals[1] == 150
+    assert totals[2] == totals[3] > 0
+    assert totals[4] == totals[5] > 0
+    assert totals[6] == totals[7] > 0
+
+
+def test_session_hooks_match_a_full_rebuild_after_inserts(census):
+    maintained = _rollup_rows(census)
+    assert maintained == _rebuilt_rows(census)
+
+
+def test_session_hooks_match_a_full_rebuild_after_moves_and_deletes(census):
+    db = census
+    # A parcelle moved to another day and agent, another to another adresse, a third re-rated
+    first = db.get(models.Parcelle, 1)
+    first.date_create, first.fk_agent = datetime(2025, 7, 14, 9), 3
+    db.get(models.Parcelle, 2).fk_adresse = 5
+    db.get(models.Parcelle, 3).statut = 2
+    db.commit()
+    # An adresse moved to another avenue: its parcelles and their biens move with it
+    db.get(models.Adresse, 5).fk_avenue = 17
+    # A bien deleted, another changing nature, a member counted on another day
+    deleted = db.execute(text("SELECT MIN(id) FROM bien WHERE id NOT IN (SELECT fk_bien FROM menage WHERE fk_bien IS NOT NULL)")).scalar()
+    db.delete(db.get(models.Bien, deleted))
+    changed = db.execute(text("SELECT MAX(id) FROM bien")).scalar()
+    db.get(models.Bien, changed).fk_nature_bien = 2 if db.get(models.Bien, changed).fk_nature_bien != 2 else 1
+    db.get(models.MembreMenage, 1).date_create = datetime(2025, 5, 30)
+    db.commit()
+
+    maintained = _rollup_rows(db)
+    assert maintained == _rebuilt_rows(db)
+
+
+def test_rolled_back_writes_leave_the_rollups_alone(census):
+    before = _rollup_rows(census)
+    census.add(models.Parcelle(id=1000, numero_parcellaire="P-1000", statut=1, date_create=datetime(2025, 6, 2)))
+    census.flush()
+    census.rollback()
+    assert _rollup_rows(census) == before
+
+
+def test_partial_rebuild_recounts_only_its_days(census):
+    census.execute(text("DELETE FROM stats_parcelle_jour"))
+    assert rebuild_rollups(census, "2025-06-05", "2025-06-07", rollups=("parcelle",)) == 3
+    days = {row[0] for row in census.execute(text("SELECT DISTINCT jour FROM stats_parcelle_jour"))}
+    assert {str(day)[:10] for day in days} <= {"2025-06-05", "2025-06-06", "2025-06-07"}
+    counted = census.execute(text("SELECT SUM(nb_parcelles) FROM stats_parcelle_jour")).scalar()
+    assert counted == census.execute(text(
+        "SELECT COUNT(*) FROM parcelle WHERE date_create >= :start AND date_create < :end"
+    ), {"start": datetime(2025, 6, 5), "end": datetime(2025, 6, 8)}).scalar()
+
+
+# Helper function to call the core stats route as FastAPI would, with only the given filters
+def _core_stats(db, **filters) -> dict:
+    arguments = dict(commune=None, quartier=None, avenue=None, rang=None, nature=None, date_start=None, date_end=None)
+    arguments.update(filters)
+    return json.loads(get_core_stats(**arguments, current_user=None, db=db).body)
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"commune": 1},
+    {"quartier": 2, "rang": 1},
+    {"nature": 2},
+    {"date_start": "2025-06-05", "date_end": "2025-06-06"},
+])
+def test_core_stats_count_the_whole_census_whatever_the_filters(census, rollup_counts, monkeypatch, filters):
+    # One connection behind the sqlite engine: run the fanned-out counts one after the other
+    monkeypatch.setattr(fanout, "FANOUT_MAX_WORKERS", 1)
+    stats_cache.clear()
+    expected = census.execute(text("""
+        SELECT (SELECT COUNT(p.id) FROM parcelle p WHERE p.statut = 1),
+               (SELECT COUNT(p.id) FROM parcelle p WHERE p.statut = 2),
+               (SELECT COUNT(p.id) FROM bien b LEFT JOIN parcelle p ON b.fk_parcelle = p.id)
+    """)).fetchone()
+    stats = _core_stats(census, **filters)
+    assert stats["total_parcelles_accessibles"] == expected[0]
+    assert stats["total_parcelles_inaccessibles"] == expected[1]
+    # Biens without a parcelle were never counted
+    assert stats["total_biens"] == expected[2] < census.execute(text("SELECT COUNT(*) FROM bien")).scalar()
+    assert stats["total_population"] == 40
+
+
+def test_core_stats_share_one_cache_entry(census, rollup_counts, monkeypatch):
+    monkeypatch.setattr(fanout, "FANOUT_MAX_WORKERS", 1)
+    stats_cache.clear()
+    assert _core_stats(census, commune=1) == _core_stats(census, date_start="2025-06-03")
+    assert len(stats_cache) == 1
@@ -0,0 +1,123 @@
+# tests/test_snapshot.py
+import time
+
+import pytest
+
+from sqlalchemy.sql import text
+
+from app import models, snapshot
+from app.aggregates import bien_rollup_stats, parcelle_rollup_stats, stats_filters
+from app.snapshot import ColumnarSnapshot, dashboard_bien_stats, dashboard_parcelle_stats
+
+pytestmark = pytest.mark.skipif(not snapshot.SNAPSHOT_ENABLED, reason="the snapshot needs NumPy")
+
+FILTER_SETS = [
+    {},
+    {"commune": 1},
+    {"quartier": 2, "rang": 1},
+    {"avenue": 5},
+    {"rang": 2},
+    {"date_start": "2025-06-05", "date_end": "2025-06-10"},
+    {"commune": 2, "rang": 1, "date_start": "2025-06-03"},
+]
+
+
+@pytest.fixture
+def cold(census, grouping_sets, monkeypatch):
+    """A snapshot not built yet, the one the dashboard counts and the session hooks use."""
+    fresh = ColumnarSnapshot()
+    monkeypatch.setattr(snapshot, "dashboard_snapshot", fresh)
+    return fresh
+
+
+@pytest.fixture
+def built(cold):
+    cold.rebuild()
+    return cold
+
+
+# Helper function to wait for a background build to finish
+def _wait_built(held, timeout=10):
+    deadline = time.monotonic() + timeout
+    while (held._building or held.built_at is None) and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+# Helper function to read the rollup counts of the dashboard filters
+def _rollups(db, nature=None, **filters) -> tuple:
+    rollup_filters = stats_filters(**filters)
+    return parcelle_rollup_stats(db, rollup_filters), bien_rollup_stats(db, rollup_filters, nature)
+
+
+@pytest.mark.parametrize("filters", FILTER_SETS)
+def test_snapshot_counts_match_the_rollups(built, census, filters):
+    parcelles, biens = _rollups(census, **filters)
+    assert built.parcelle_stats(**filters) == parcelles
+    assert built.bien_stats(**filters) == biens
+    assert built.bien_stats(nature=1, **filters) == _rollups(census, nature=1, **filters)[1]
+
+
+def test_cold_counts_come_from_the_rollups_until_the_build_is_in(cold, census):
+    parcelles, biens = _rollups(census)
+    assert not cold.refresh(census)
+    assert dashboard_parcelle_stats(census) == parcelles
+    assert dashboard_bien_stats(census) == biens
+    _wait_built(cold)
+    assert cold.refresh(census)
+    assert cold.parcelle_stats() == parcelles
+
+
+def test_an_aged_snapshot_keeps_answering_while_it_is_rebuilt(built, census, monkeypatch):
+    started = []
+    monkeypatch.setattr(built, "warm", lambda: started.append(True))
+    built.built_at -= snapshot.SNAPSHOT_REBUILD_SECONDS + 1
+    census.add(models.Parcelle(id=151, numero_parcellaire="P-151", statut=1))
+    census.commit()
+    # Served from the previous arrays, brought up to date incrementally
+    assert built.refresh(census)
+    assert started == [True]
+    assert built.parcelle_stats(only=("total",))["total"][()]["total"] == 151
+
+
+def test_writes_committed_during_a_build_are_reloaded_after_it(built, census, monkeypatch):
+    load_lookups = built._load_lookups
+    written = []
+
+    # The tables are loaded: commit a write, refreshed into the previous arrays, before the build swaps its own in
+    def load_lookups_then_write(db):
+        if built._building and not written:
+            written.append(True)
+            census.get(models.Parcelle, 7).statut = 2
+            census.add(models.Parcelle(id=151, numero_parcellaire="P-151", statut=1))
+            census.commit()
+            assert built.refresh(census)
+        return load_lookups(db)
+
+    monkeypatch.setattr(built, "_load_lookups", load_lookups_then_write)
+    built.built_at -= snapshot.SNAPSHOT_REBUILD_SECONDS + 1
+    assert built.refresh(census)
+    _wait_built(built)
+    assert written
+    assert built.refresh(census)
+    assert built.parcelle_stats() == _rollups(census)[0]
+    assert built.check(census)["consistent"]
+
+
+def test_check_compares_an_id_range(built, census):
+    census.execute(text("UPDATE parcelle SET statut = 3 WHERE id = 5"))
+    census.execute(text("DELETE FROM parcelle WHERE id = 120"))
+    census.commit()
+
+    first = built.check(census, start_id=0, width=100)
+    assert not first["consistent"]
+    assert first["parcelle"]["stale"] == 1 and first["parcelle"]["sample"]["stale"] == [5]
+    assert first["parcelle"]["extra"] == 0 and first["next_start_id"] == 100
+    second = built.check(census, start_id=100, width=100)
+    assert second["parcelle"]["sample"]["extra"] == [120] and second["parcelle"]["rows"] == 49
+    last_bien = census.execute(text("SELECT MAX(id) FROM bien")).scalar()
+    assert built.check(census, start_id=100, width=last_bien)["next_start_id"] is None
+
+    built.invalidate()
+    assert built.check(census) == {"enabled": True, "ready": False}
+    _wait_built(built)
+    assert built.check(census, width=last_bien)["consistent"]